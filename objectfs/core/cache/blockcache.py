@@ -0,0 +1,290 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function, absolute_import
+import os
+import errno
+import sqlite3
+import threading
+import collections
+from objectfs.core.common.objectfsthread import ObjectFSThread
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+BLOCK_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    inode_id INTEGER NOT NULL,
+    block_id INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    dirty INTEGER NOT NULL,
+    PRIMARY KEY (inode_id, block_id)
+);
+"""
+
+# block id of a whole file cached as one block
+WHOLE_FILE_BLOCK_ID = -1
+# suffix of a fetched block being written, before it is moved into place
+FETCH_SUFFIX = '.fetch'
+
+class CachedBlock(object):
+    """Size and state of a cached block"""
+
+    __slots__ = ('size', 'dirty', 'referenced')
+
+    def __init__(self, size, dirty):
+        self.size = size
+        # written by the file-system and not uploaded yet, never evicted
+        self.dirty = dirty
+        # read since the clock hand last passed, gets a second chance
+        self.referenced = False
+
+class BlockCacheIndex(object):
+    """Index of the blocks held by the file cache of a file-system, shared by all the file cache stores
+    of the process. The size and the dirty flag of each block are kept in a SQLite database next to
+    the blocks, so the used size is known again after a restart. Once the used size passes the high
+    watermark of the capacity, clean blocks are evicted with the clock algorithm until it is below the
+    low watermark. Blocks are evicted by a background thread, and by the writer itself when the cache
+    is full. The blocks of open inodes are pinned, so that they are not evicted under a reader or a
+    writer"""
+
+    __indexes = {}
+    __lock = threading.Lock()
+
+    def __init__(self, fs_name, block_path):
+        self._fs_name = fs_name
+        self._config = settings.config
+        self._block_path = block_path
+        self._capacity = self._config.FILE_CACHE_CAPACITY
+        # blocks in the order of the clock hand
+        self._block_map = collections.OrderedDict()
+        # open count of the pinned inodes
+        self._pin_map = {}
+        self._used_size = 0
+        self._lock = threading.Lock()
+        self._evict_event = threading.Event()
+        self._pid = os.getpid()
+        if not os.path.isdir(self._config.FILE_CACHE_MOUNT_POINT):
+            os.makedirs(self._config.FILE_CACHE_MOUNT_POINT)
+        self._path = os.path.join(self._config.FILE_CACHE_MOUNT_POINT, '{}%index.db'.format(fs_name))
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(BLOCK_CACHE_SCHEMA)
+        self._load_blocks()
+
+    @staticmethod
+    def load(fs_name, block_path):
+        """Return the index of the file-system, opening it once per process. block_path returns the
+        path of a block from its inode id and block id"""
+        with BlockCacheIndex.__lock:
+            index = BlockCacheIndex.__indexes.get(fs_name)
+            # connections are not shared with forked workers
+            if index is None or index._pid != os.getpid():
+                logger.debug("Open block cache index {}".format(fs_name))
+                index = BlockCacheIndex(fs_name, block_path)
+                BlockCacheIndex.__indexes[fs_name] = index
+                if index._capacity:
+                    evict_thread = ObjectFSThread(target=index._run_evict, name='BlockCacheEvict')
+                    evict_thread.daemon = True
+                    evict_thread.start()
+            return index
+
+    def _load_blocks(self):
+        """Load the index and add the blocks written after their last commit, which were cached
+        clean since dirty blocks are committed before they are written"""
+        for (inode_id, block_id, size, dirty) in self._connection.execute('SELECT inode_id, block_id, size, dirty FROM blocks'):
+            self._add((inode_id, None if block_id == WHOLE_FILE_BLOCK_ID else block_id), size, bool(dirty))
+        prefix = '{}%data%'.format(self._fs_name)
+        new_block_list = []
+        for file_name in os.listdir(self._config.FILE_CACHE_MOUNT_POINT):
+            if not file_name.startswith(prefix):
+                continue
+            if FETCH_SUFFIX in file_name:
+                # the fetch stopped before the block was moved into place
+                os.unlink(os.path.join(self._config.FILE_CACHE_MOUNT_POINT, file_name))
+                continue
+            name_list = file_name[len(prefix):].split('%')
+            try:
+                key = (int(name_list[0]), int(name_list[1]) if len(name_list) > 1 else None)
+            except ValueError:
+                continue
+            if key not in self._block_map:
+                size = os.path.getsize(os.path.join(self._config.FILE_CACHE_MOUNT_POINT, file_name))
+                self._add(key, size, False)
+                new_block_list.append(self._row(key, size, False))
+        if new_block_list:
+            logger.debug("Adding {} unindexed blocks to the block cache index".format(len(new_block_list)))
+            with self._connection:
+                self._connection.executemany('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)', new_block_list)
+        logger.debug("Block cache index {} holds {} blocks of {} bytes".format(self._fs_name, len(self._block_map), self._used_size))
+
+    def _key_row(self, key):
+        (inode_id, block_id) = key
+        return (inode_id, WHOLE_FILE_BLOCK_ID if block_id is None else block_id)
+
+    def _row(self, key, size, dirty):
+        return self._key_row(key) + (size, int(dirty))
+
+    def _add(self, key, size, dirty):
+        """Add or replace a block, called with the lock held"""
+        block = self._block_map.get(key)
+        if block is None:
+            block = self._block_map[key] = CachedBlock(size, dirty)
+        else:
+            self._used_size -= block.size
+            block.size = size
+            block.dirty = dirty
+        self._used_size += size
+        return block
+
+    def put(self, inode_id, block_id, fetch_path, size):
+        """Move a clean block fetched from the object store into place from fetch_path and record it.
+        A block written since the fetch started is newer, the fetched one is dropped then. Returns if
+        the block was put"""
+        with self._lock:
+            block = self._block_map.get((inode_id, block_id))
+            if block is not None and block.dirty:
+                os.unlink(fetch_path)
+                return False
+            os.rename(fetch_path, self._block_path(inode_id, block_id))
+            self._add((inode_id, block_id), size, False)
+            with self._connection:
+                self._connection.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)', self._row((inode_id, block_id), size, False))
+        self._check_capacity()
+        return True
+
+    def mark_dirty(self, inode_id, block_id):
+        """Protect a block from eviction before it is written"""
+        with self._lock:
+            block = self._block_map.get((inode_id, block_id))
+            if block is not None and block.dirty:
+                return
+            block = self._add((inode_id, block_id), block.size if block else 0, True)
+            with self._connection:
+                self._connection.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)', self._row((inode_id, block_id), block.size, True))
+
+    def write(self, inode_id, block_id, end):
+        """Record a write up to end of a block marked dirty"""
+        with self._lock:
+            block = self._block_map.get((inode_id, block_id))
+            if block is None or end <= block.size:
+                return
+            self._add((inode_id, block_id), end, True)
+            with self._connection:
+                self._connection.execute('UPDATE blocks SET size = ? WHERE inode_id = ? AND block_id = ?', (end,) + self._key_row((inode_id, block_id)))
+        self._check_capacity()
+
+    def mark_clean(self, inode_id, block_id):
+        """Allow a block to be evicted once it is stored in the object store"""
+        with self._lock:
+            block = self._block_map.get((inode_id, block_id))
+            if block is None or not block.dirty:
+                return
+            block.dirty = False
+            with self._connection:
+                self._connection.execute('UPDATE blocks SET dirty = 0 WHERE inode_id = ? AND block_id = ?', self._key_row((inode_id, block_id)))
+
+    def pin(self, inode_id):
+        """Keep the blocks of an inode from eviction while it is open"""
+        with self._lock:
+            self._pin_map[inode_id] = self._pin_map.get(inode_id, 0) + 1
+
+    def unpin(self, inode_id):
+        """Allow the blocks of an inode to be evicted once it is closed as many times as it was opened"""
+        with self._lock:
+            pin_count = self._pin_map.pop(inode_id, 0) - 1
+            if pin_count > 0:
+                self._pin_map[inode_id] = pin_count
+
+    def reference(self, inode_id, block_id):
+        """Give a block which was read a second chance"""
+        block = self._block_map.get((inode_id, block_id))
+        if block is not None:
+            block.referenced = True
+
+    def remove(self, key_list):
+        """Drop blocks which were removed from the cache, given as (inode id, block id) pairs"""
+        with self._lock:
+            removed_list = []
+            for key in key_list:
+                block = self._block_map.pop(key, None)
+                if block is not None:
+                    self._used_size -= block.size
+                    removed_list.append(self._key_row(key))
+            if removed_list:
+                with self._connection:
+                    self._connection.executemany('DELETE FROM blocks WHERE inode_id = ? AND block_id = ?', removed_list)
+
+    def _check_capacity(self):
+        """Wake the evictor above the high watermark and evict right away when the cache is full"""
+        if not self._capacity:
+            return
+        if self._used_size > self._capacity:
+            self.evict()
+        elif self._used_size > self._capacity * self._config.FILE_CACHE_HIGH_WATERMARK:
+            self._evict_event.set()
+
+    def _run_evict(self):
+        """Evict clean blocks above the high watermark, checked every evict interval"""
+        while True:
+            self._evict_event.wait(self._config.FILE_CACHE_EVICT_INTERVAL)
+            self._evict_event.clear()
+            try:
+                if self._used_size > self._capacity * self._config.FILE_CACHE_HIGH_WATERMARK:
+                    self.evict()
+            except Exception as e:
+                logger.error("Failed to evict blocks from the file cache", exc_info=True)
+
+    def evict(self):
+        """Evict clean blocks of closed inodes with the clock algorithm until the used size is below the
+        low watermark. Returns the number of blocks evicted"""
+        target_size = self._capacity * self._config.FILE_CACHE_LOW_WATERMARK
+        with self._lock:
+            evict_list = []
+            # the first pass clears the reference bits, the second one evicts
+            num_blocks = 2 * len(self._block_map)
+            while self._used_size > target_size and num_blocks > 0:
+                num_blocks -= 1
+                (key, block) = self._block_map.popitem(last=False)
+                if block.referenced or block.dirty or key[0] in self._pin_map:
+                    block.referenced = False
+                    self._block_map[key] = block
+                    continue
+                self._used_size -= block.size
+                evict_list.append(key)
+            # the blocks are unlinked with the lock held, so that a writer cannot mark them dirty meanwhile
+            for (inode_id, block_id) in evict_list:
+                try:
+                    os.unlink(self._block_path(inode_id, block_id))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise e
+            if evict_list:
+                with self._connection:
+                    self._connection.executemany('DELETE FROM blocks WHERE inode_id = ? AND block_id = ?', [self._key_row(key) for key in evict_list])
+            if self._used_size > target_size:
+                logger.warn("File cache holds {} bytes above its low watermark, the rest is dirty or open".format(self._used_size - target_size))
+        logger.debug("Evicted {} blocks from the file cache".format(len(evict_list)))
+        return len(evict_list)
+
+    @property
+    def used_size(self):
+        return self._used_size
+
+    def __len__(self):
+        return len(self._block_map)
@@ -0,0 +1,128 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function, absolute_import
+import threading
+from objectfs.core.cache.ioscheduler import READ
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+class BlockFetcher(object):
+    """Fetches blocks of files from the object store into the cache through the scheduler. Each block
+    being fetched is registered with its request, so that a read or readahead of the block waits on
+    that request instead of fetching the block again"""
+
+    def __init__(self, io_scheduler, data_store, cache_store):
+        self._config = settings.config
+        self._io_scheduler = io_scheduler
+        self._data_store = data_store
+        self._cache_store = cache_store
+        # request fetching each (inode id, block id)
+        self._inflight_map = {}
+        # callbacks of the requests by key
+        self._callback_map = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, io_class, inode_id, block_id_list, inode_size, callback=None):
+        """Fetch the blocks which are not in flight, adjacent blocks with one ranged GET. Return a map of
+        each block id to the first block id and the request fetching it. The callback is called with
+        each of these requests once it is done or cancelled"""
+        block_map = {}
+        with self._lock:
+            fetch_list = []
+            for object_block_id in sorted(block_id_list):
+                request = self._inflight_map.get((inode_id, object_block_id))
+                if request is None:
+                    fetch_list.append(object_block_id)
+                    continue
+                if io_class < request.io_class:
+                    # a read waits on the readahead of the block, so it should not wait behind other readahead
+                    request = self._submit(io_class, inode_id, request.key[2], request.key[3], inode_size)
+                block_map[object_block_id] = (request.key[2], request)
+            # runs of adjacent blocks as [first block, last block + 1]
+            run_list = []
+            for object_block_id in fetch_list:
+                if run_list and run_list[-1][1] == object_block_id:
+                    run_list[-1][1] += 1
+                else:
+                    run_list.append([object_block_id, object_block_id+1])
+            for (first_block_id, end_block_id) in run_list:
+                request = self._submit(io_class, inode_id, first_block_id, end_block_id, inode_size)
+                for object_block_id in range(first_block_id, end_block_id):
+                    block_map[object_block_id] = (first_block_id, request)
+            if callback is not None:
+                for request in set(request for (first_block_id, request) in block_map.values()):
+                    self._callback_map.setdefault(request.key, []).append(callback)
+        return block_map
+
+    def _submit(self, io_class, inode_id, first_block_id, end_block_id, inode_size):
+        """Submit the fetch of a run of blocks and register it, called with the lock held"""
+        request = self._io_scheduler.submit(io_class, (inode_id, 'fetch', first_block_id, end_block_id), self._fetch_blocks,
+                                            (inode_id, first_block_id, end_block_id, inode_size), callback=self._done)
+        for object_block_id in range(first_block_id, end_block_id):
+            self._inflight_map[(inode_id, object_block_id)] = request
+        return request
+
+    def get(self, inode_id, block_id_list, inode_size):
+        """Fetch the blocks for a read and return a map of each block id to a memoryview of the block"""
+        block_size = self._config.DATA_BLOCK_SIZE
+        block_map = self.fetch(READ, inode_id, block_id_list, inode_size)
+        view_map = {}
+        for object_block_id in block_id_list:
+            (first_block_id, request) = block_map[object_block_id]
+            data_view = request.wait()
+            if request.cancelled:
+                # the readahead of the block was cancelled before the read waited on it
+                (first_block_id, request) = self.fetch(READ, inode_id, [object_block_id], inode_size)[object_block_id]
+                data_view = request.wait()
+            if data_view is None:
+                raise IOError("Failed to fetch inode {} object-block {}".format(inode_id, object_block_id))
+            block_off = (object_block_id - first_block_id) * block_size
+            view_map[object_block_id] = data_view[block_off:block_off+block_size]
+        return view_map
+
+    def cancel(self, inode_id):
+        """Cancel the queued readahead of a file"""
+        return self._io_scheduler.cancel(inode_id)
+
+    def _done(self, request):
+        """Unregister the blocks of a request once it is done or cancelled"""
+        (inode_id, name, first_block_id, end_block_id) = request.key
+        with self._lock:
+            for object_block_id in range(first_block_id, end_block_id):
+                if self._inflight_map.get((inode_id, object_block_id)) is request:
+                    del self._inflight_map[(inode_id, object_block_id)]
+            callback_list = self._callback_map.pop(request.key, [])
+        for callback in callback_list:
+            callback(request)
+
+    def _fetch_blocks(self, inode_id, first_block_id, end_block_id, inode_size):
+        """Fetch the blocks first to end-1 with one ranged GET and put them in the cache"""
+        block_size = self._config.DATA_BLOCK_SIZE
+        run_off = first_block_id * block_size
+        run_size = min(end_block_id * block_size, inode_size) - run_off
+        data_view = memoryview(self._data_store.get_dnode_range(inode_id, run_off, run_size))
+        for object_block_id in range(first_block_id, end_block_id):
+            block_off = object_block_id * block_size
+            block_view = data_view[block_off-run_off:block_off-run_off+block_size]
+            self._cache_store.put_inode(inode_id, block_view.tobytes(), object_block_id=object_block_id)
+        return data_view
+
+    def __len__(self):
+        with self._lock:
+            return len(self._inflight_map)
@@ -19,7 +19,10 @@ import redis
 import llfuse
 import os
 import stat
+import errno
+import threading
 from objectfs.core.common.redispool import RedisPool
+from objectfs.core.cache.blockcache import BlockCacheIndex, FETCH_SUFFIX
 from objectfs.settings import Settings
 settings = Settings()
 import logging
@@ -38,6 +41,7 @@ class CacheStore(object):
     
     def __init__(self, fs_name):
         self._fs_name = fs_name
+        self._config = settings.config
         
     @abstractmethod
     def write_inode(self, inode_id, offset, buf, object_block_id=0):
@@ -64,10 +68,30 @@ class CacheStore(object):
         """Delete the inode from cache"""
         return NotImplemented
     
+    @abstractmethod
+    def remove_inodes(self, inode_block_list):
+        """Delete the cache blocks of many inodes, given as (inode id, number of blocks) pairs"""
+        return NotImplemented
+
+    @abstractmethod
+    def clean_inode(self, inode_id, object_block_id=0):
+        """Mark an inode written to the object store, so that the cache can evict it"""
+        return NotImplemented
+
     @abstractmethod
     def exists_inode(self, inode_id, object_block_id=0):
         """Check if inode exists"""
         return NotImplemented
+
+    @abstractmethod
+    def pin_inode(self, inode_id):
+        """Keep the blocks of an inode in the cache while it is open"""
+        return NotImplemented
+
+    @abstractmethod
+    def unpin_inode(self, inode_id):
+        """Allow the cache to evict the blocks of an inode once it is closed"""
+        return NotImplemented
     
 class RedisCacheStore(CacheStore):
 
@@ -105,10 +129,11 @@ class RedisCacheStore(CacheStore):
             raise e
     
     def put_inode(self, inode_id, data, object_block_id=0):
-        """Put an inode inside cache"""
+        """Put an inode inside cache. A block written meanwhile is kept, it is newer than data"""
         try:
             logger.debug("Put inode:{} into cache".format(inode_id))
-            response = self._client.set(self._cache_key(inode_id, object_block_id), data)
+            # only set when missing, a cached block is at least as new as the one fetched
+            response = self._client.set(self._cache_key(inode_id, object_block_id), data, nx=True)
             return response
         except Exception as e:
             logger.error("Failed to put inode:{} into cache".format(inode_id), exc_info=True)
@@ -133,6 +158,18 @@ class RedisCacheStore(CacheStore):
         except Exception as e:
             logger.error("Failed to remove inode:{} from cache".format(inode_id), exc_info=True)
             raise e
+
+    def remove_inodes(self, inode_block_list):
+        """Delete the cache blocks of many inodes with pipelined deletes"""
+        try:
+            logger.debug("Remove {} inodes from cache".format(len(inode_block_list)))
+            pipe = self._client.pipeline(transaction=False)
+            for (inode_id, num_blocks) in inode_block_list:
+                pipe.delete(*[self._cache_key(inode_id, object_block_id) for object_block_id in range(num_blocks)])
+            return sum(pipe.execute())
+        except Exception as e:
+            logger.error("Failed to remove {} inodes from cache".format(len(inode_block_list)), exc_info=True)
+            raise e
      
     def exists_inode(self, inode_id, object_block_id=0):
         """Check if inode exists"""
@@ -144,16 +181,30 @@ class RedisCacheStore(CacheStore):
             logger.error("Failed to check if inode:{} exists".format(inode_id), exc_info=True)
             raise e
 
+    def clean_inode(self, inode_id, object_block_id=0):
+        """Nothing to mark, Redis evicts by its own policy"""
+        pass
+
+    def pin_inode(self, inode_id):
+        """Nothing to pin, Redis evicts by its own policy"""
+        pass
+
+    def unpin_inode(self, inode_id):
+        """Nothing to unpin, Redis evicts by its own policy"""
+        pass
+
 class FileCacheStore(CacheStore):
 
     def __init__(self, fs_name):
         super(self.__class__, self).__init__(fs_name)
+        # sizes and states of the cached blocks, bounded by the capacity
+        self._index = BlockCacheIndex.load(fs_name, self._cache_key)
         
     def _cache_key(self, inode_id, object_block_id):
         if object_block_id is None:
-            return '{}{}{}{}{}{}'.format(settings.FILE_CACHE_MOUNT_POINT, self._fs_name, FS_DELIMITER, 'data', FS_DELIMITER, inode_id)
+            return os.path.join(self._config.FILE_CACHE_MOUNT_POINT, '{}{}{}{}{}'.format(self._fs_name, FS_DELIMITER, 'data', FS_DELIMITER, inode_id))
         else:
-            return '{}{}{}{}{}{}{}{}'.format(settings.FILE_CACHE_MOUNT_POINT, self._fs_name, FS_DELIMITER, 'data', FS_DELIMITER, inode_id, FS_DELIMITER, object_block_id)
+            return os.path.join(self._config.FILE_CACHE_MOUNT_POINT, '{}{}{}{}{}{}{}'.format(self._fs_name, FS_DELIMITER, 'data', FS_DELIMITER, inode_id, FS_DELIMITER, object_block_id))
     
     def _open_cache_block(self, inode_id, object_block_id, file_flag):
         return os.open(self._cache_key(inode_id, object_block_id), file_flag) 
@@ -162,11 +213,14 @@ class FileCacheStore(CacheStore):
         """Write an inode to cache"""
         try:
             logger.debug("Write inode:{} to cache at offset:{},length:{}".format(inode_id, offset, len(buf)))
+            # written blocks are not evicted until they are uploaded
+            self._index.mark_dirty(inode_id, object_block_id)
             # opening the file with write only and direct mode
             file_descp = self._open_cache_block(inode_id, object_block_id, os.O_WRONLY | os.O_CREAT)
             # set to SEEK_SET which is relative to start of file
             os.lseek(file_descp, offset, os.SEEK_SET)
             os.write(file_descp, buf)
+            self._index.write(inode_id, object_block_id, offset+len(buf))
         except Exception as e:
             print(e)
             raise e
@@ -178,10 +232,22 @@ class FileCacheStore(CacheStore):
         try:
             logger.debug("Read inode:{} from cache with offset:{},size:{}".format(inode_id, offset, size))
             # opening the file with read only and direct mode
-            file_descp = self._open_cache_block(inode_id, object_block_id, os.O_RDONLY | os.O_CREAT)
+            try:
+                file_descp = self._open_cache_block(inode_id, object_block_id, os.O_RDONLY)
+            except OSError as e:
+                # evicted, read like a missing key of the redis cache
+                if e.errno == errno.ENOENT:
+                    return b''
+                raise e
+        except Exception as e:
+            print(e)
+            raise e
+        try:
+            self._index.reference(inode_id, object_block_id)
             # set to SEEK_SET which is relative to start of file
             os.lseek(file_descp, offset, os.SEEK_SET)
-            return os.read(file_descp, size)
+            # the end is inclusive like GETRANGE of the redis cache
+            return os.read(file_descp, size-offset+1)
         except Exception as e:
             print(e)
             raise e
@@ -193,35 +259,59 @@ class FileCacheStore(CacheStore):
         try:
             f = open(self._cache_key(inode_id, object_block_id))
             data = f.read()
+            self._index.reference(inode_id, object_block_id)
             return data
         except Exception as e:
             print(e)
             raise e
 
     def put_inode(self, inode_id, data, offset=None, object_block_id=None):
-        """Put an inode inside cache"""
+        """Put an inode inside cache. A block written meanwhile is kept, it is newer than data"""
         try:
             logger.debug("Put inode:{} into cache".format(inode_id))
-            # os.mknod(self._cache_key(inode_id, object_block_id), mode=0600|stat.S_IFREG)
-            file_descp = os.open(self._cache_key(inode_id, object_block_id), os.O_WRONLY | os.O_CREAT)
-            # if offset:
-                # os.lseek(file_descp, offset, os.SEEK_SET)
-            os.write(file_descp, data)
+            # written aside and moved into place by the index, so that a concurrent write is not truncated
+            fetch_path = '{}{}{}'.format(self._cache_key(inode_id, object_block_id), FETCH_SUFFIX, threading.current_thread().ident)
+            file_descp = os.open(fetch_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                os.write(file_descp, data)
+            finally:
+                os.close(file_descp)
+            self._index.put(inode_id, object_block_id, fetch_path, len(data))
         except Exception as e:
             print(e)
             raise e
-        finally:
-            os.close(file_descp)
     
     def remove_inode(self, inode_id, object_block_id=None):
         """Delete the inode from cache"""
         try:
             logger.debug("Remove inode:{} from cache".format(inode_id))
+            self._index.remove([(inode_id, object_block_id)])
             os.unlink(self._cache_key(inode_id, object_block_id))
         except Exception as e:
             print(e)
             raise e
 
+    def remove_inodes(self, inode_block_list):
+        """Delete the cache files of many inodes. Blocks which were never cached are skipped"""
+        try:
+            logger.debug("Remove {} inodes from cache".format(len(inode_block_list)))
+            self._index.remove([(inode_id, object_block_id) for (inode_id, num_blocks) in inode_block_list
+                                for object_block_id in [None] + range(num_blocks)])
+            for (inode_id, num_blocks) in inode_block_list:
+                for object_block_id in [None] + range(num_blocks):
+                    try:
+                        os.unlink(self._cache_key(inode_id, object_block_id))
+                    except OSError as e:
+                        if e.errno != errno.ENOENT:
+                            raise e
+        except Exception as e:
+            logger.error("Failed to remove {} inodes from cache".format(len(inode_block_list)), exc_info=True)
+            raise e
+
+    def clean_inode(self, inode_id, object_block_id=None):
+        """Mark an inode written to the object store, so that the cache can evict it"""
+        self._index.mark_clean(inode_id, object_block_id)
+
     def exists_inode(self, inode_id, object_block_id=None):
         """Check if inode exists"""
         try:
@@ -231,6 +321,14 @@ class FileCacheStore(CacheStore):
             print(e)
             raise e
 
+    def pin_inode(self, inode_id):
+        """Keep the blocks of an inode in the cache while it is open"""
+        self._index.pin(inode_id)
+
+    def unpin_inode(self, inode_id):
+        """Allow the cache to evict the blocks of an inode once it is closed"""
+        self._index.unpin(inode_id)
+
 class CacheStoreFactory(object):
     
     __store_classes = {
@@ -25,6 +25,7 @@ from objectfs.core.common.mergequeue import MergeQueue
 from objectfs.core.common.fragmentmap import FragmentMap
 from objectfs.settings import Settings
 settings = Settings()
+config = settings.config
 import logging
 logger = logging.getLogger(__name__)
 
@@ -36,8 +37,7 @@ def download_object_block(fs_name, inode_id, object_block_id, offset, size):
     data_store = ObjectStoreFactory.create_store(fs_name)
     cache_store = CacheStoreFactory.create_store(fs_name)
     # check if the object block already exists
-    if False:
-    # if cache_store.exists_inode(inode_id, object_block_id):
+    if cache_store.exists_inode(inode_id, object_block_id):
         logger.debug("Worker reading from cache since inode {} object-block {} exists".format(inode_id, object_block_id))
         return cache_store.read_inode(inode_id, offset, offset+size-1, object_block_id)
     else:
@@ -75,17 +75,21 @@ def prefetch_object_block((fs_name, inode_id, object_block_id)):
     data_store = ObjectStoreFactory.create_store(fs_name)
     cache_store = CacheStoreFactory.create_store(fs_name)
     # check if the object block already exists in cache
-    if False:
-    # if cache_store.exists_inode(inode_id, object_block_id):
+    if cache_store.exists_inode(inode_id, object_block_id):
         logger.debug("Returning from prefetch task as inode {} object-block {} exists".format(inode_id, object_block_id))
         return
     else:
-        # read data from object store
-        logger.debug("Starting the prefetch task for inode {}, object_block {}".format(inode_id, object_block_id))
-        data = data_store.get_dnode(inode_id, object_block_id)
-        # put data in cache store
-        cache_store.put_inode(inode_id, data, object_block_id=object_block_id)
-        logger.debug("Finished with prefetch task for inode {}, object_block {}".format(inode_id, object_block_id))
+        try:
+            # read data from object store
+            logger.debug("Starting the prefetch task for inode {}, object_block {}".format(inode_id, object_block_id))
+            data = data_store.get_dnode(inode_id, object_block_id)
+            # put data in cache store
+            cache_store.put_inode(inode_id, data, object_block_id=object_block_id)
+            logger.debug("Finished with prefetch task for inode {}, object_block {}".format(inode_id, object_block_id))
+        except Exception as e:
+            # only a prefetch, the read fetches the block again
+            logger.warn("Failed to prefetch inode {}, object_block {}".format(inode_id, object_block_id), exc_info=True)
+    return (inode_id, object_block_id)
 
 def multipart_upload_object_block((fs_name, inode_id, object_block_id, multipart_id, log_object_name)):
     """Multipart upload task"""
@@ -93,7 +97,7 @@ def multipart_upload_object_block((fs_name, inode_id, object_block_id, multipart
     cache_store = CacheStoreFactory.create_store(fs_name)
     logger.debug("Starting multipart_upload task for inode {} object-block {} multi-part {}".format(inode_id, object_block_id, multipart_id))
     # read data from cache
-    data = cache_store.read_inode(inode_id, 0, settings.DATA_BLOCK_SIZE-1, object_block_id)
+    data = cache_store.read_inode(inode_id, 0, config.DATA_BLOCK_SIZE-1, object_block_id)
     # remove data from cache
     cache_store.remove_inode(inode_id, object_block_id)
     # upload data to object store
@@ -136,7 +140,7 @@ def merge_log_objects(fs_name, inode_id):
     
     # upload the remaining from the base object
     # base_obj_set = Set(range(data_store.dnode_size(inode_id)//settings.DATA_BLOCK_SIZE))
-    base_obj_set = Set(range(inode.size//settings.DATA_BLOCK_SIZE+1))
+    base_obj_set = Set(range(inode.size//config.DATA_BLOCK_SIZE+1))
     for block_id in base_obj_set.symmetric_difference(object_id_set):
         data = data_store.get_dnode(inode_id, int(block_id))
         print("Base:", block_id)
@@ -199,7 +203,7 @@ def merge_log_objects_parallel(fs_name, inode_id, num_threads=4):
         object_id_set = object_id_set.union(log_object_set)
     
     # upload the remaining from the base object
-    base_obj_set = Set(range(data_store.dnode_size(inode_id)//settings.DATA_BLOCK_SIZE))
+    base_obj_set = Set(range(data_store.dnode_size(inode_id)//config.DATA_BLOCK_SIZE))
     for block_id in base_obj_set.symmetric_difference(object_id_set):
         args_list.append((fs_name, inode_id, None, int(block_id), base_obj.id, None))
     
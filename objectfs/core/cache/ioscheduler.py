@@ -0,0 +1,197 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function, absolute_import
+import threading
+import collections
+from objectfs.core.common.objectfsthread import ObjectFSThread
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+# classes of transfers in the order of priority
+READ, READAHEAD, WRITEBACK, MERGE = range(4)
+IO_CLASS_NAMES = ['read', 'readahead', 'writeback', 'merge']
+
+class IORequest(object):
+    """A transfer submitted to the scheduler"""
+
+    QUEUED, RUNNING, DONE, CANCELLED = range(4)
+
+    def __init__(self, io_class, key, func, args):
+        self.io_class = io_class
+        self.key = key
+        self.func = func
+        self.args = args
+        self.state = IORequest.QUEUED
+        self.result = None
+        self.exception = None
+        # request submitted with the key of this write-back or merge while it ran, queued once it is done
+        self.rerun = None
+        self._callback_list = []
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.state == IORequest.CANCELLED
+
+    def wait(self, timeout=None):
+        """Wait for the transfer and return its result. Raises the exception of a failed transfer and
+        returns None for a cancelled one"""
+        self._event.wait(timeout)
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def _finish(self, state):
+        """Wake the waiters and call the callbacks, outside of the scheduler lock"""
+        self.state = state
+        self._event.set()
+        for callback in self._callback_list:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error("Callback of the {} request {} failed".format(IO_CLASS_NAMES[self.io_class], self.key), exc_info=True)
+
+class IOScheduler(object):
+    """Runs the transfers between the object store and the cache of a mount on one set of threads. A
+    free thread takes the oldest request of the highest priority class which is below its thread
+    limit. A request with the key of a queued or running request is not run again, except that a write-back
+    or merge submitted while it runs is run once more after it since it may have missed the latest data.
+    Queued requests of a file can be cancelled and the threads are started with the first request"""
+
+    def __init__(self):
+        self._config = settings.config
+        self._limit_list = [self._config.CACHE_IO_READ_THREADS, self._config.CACHE_IO_READAHEAD_THREADS,
+                            self._config.CACHE_IO_WRITEBACK_THREADS, self._config.CACHE_IO_MERGE_THREADS]
+        self._queue_list = [collections.deque() for io_class in IO_CLASS_NAMES]
+        self._running_list = [0 for io_class in IO_CLASS_NAMES]
+        # queued and running requests by key
+        self._request_map = {}
+        self._condition = threading.Condition()
+        self._thread_list = []
+        self._stopped = False
+
+    def submit(self, io_class, key, func, args=(), callback=None):
+        """Queue func(*args) and return its request. The key starts with the inode id. A queued request
+        submitted again with a higher priority class is moved to that class. The callback is called
+        with the request once it is done or cancelled"""
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("I/O scheduler is stopped")
+            request = self._request_map.get(key)
+            if request is None:
+                request = IORequest(io_class, key, func, args)
+                self._request_map[key] = request
+                self._queue_list[io_class].append(request)
+            elif io_class in (WRITEBACK, MERGE) and request.state == IORequest.RUNNING:
+                if request.rerun is None:
+                    request.rerun = IORequest(io_class, key, func, args)
+                request = request.rerun
+            elif io_class < request.io_class and request.state == IORequest.QUEUED:
+                self._queue_list[request.io_class].remove(request)
+                request.io_class = io_class
+                self._queue_list[io_class].append(request)
+            if callback is not None:
+                request._callback_list.append(callback)
+            if not self._thread_list:
+                self._start()
+            self._condition.notify()
+            return request
+
+    def cancel(self, inode_id, io_class_list=(READAHEAD,)):
+        """Cancel the queued requests of a file in these classes. Running requests are not stopped"""
+        cancel_list = []
+        with self._condition:
+            for io_class in io_class_list:
+                queue = self._queue_list[io_class]
+                for request in [request for request in queue if request.key[0] == inode_id]:
+                    queue.remove(request)
+                    del self._request_map[request.key]
+                    cancel_list.append(request)
+        for request in cancel_list:
+            request._finish(IORequest.CANCELLED)
+        if cancel_list:
+            logger.debug("Cancelled {} requests of inode {}".format(len(cancel_list), inode_id))
+        return len(cancel_list)
+
+    def queue_depths(self):
+        """Return the number of queued and running requests of each class"""
+        with self._condition:
+            return dict((IO_CLASS_NAMES[io_class], (len(self._queue_list[io_class]), self._running_list[io_class]))
+                        for io_class in range(len(IO_CLASS_NAMES)))
+
+    def _start(self):
+        """Start the threads, called with the lock held"""
+        for thread_id in range(self._config.CACHE_IO_THREADS):
+            thread = ObjectFSThread(target=self._run, name='IOScheduler-{}'.format(thread_id))
+            thread.daemon = True
+            thread.start()
+            self._thread_list.append(thread)
+
+    def stop(self):
+        """Cancel the queued reads and readaheads, finish the write-backs and merges and stop the threads"""
+        with self._condition:
+            self._stopped = True
+            cancel_list = []
+            for io_class in [READ, READAHEAD]:
+                cancel_list.extend(self._queue_list[io_class])
+                self._queue_list[io_class].clear()
+            for request in cancel_list:
+                del self._request_map[request.key]
+            self._condition.notify_all()
+        for request in cancel_list:
+            request._finish(IORequest.CANCELLED)
+        for thread in self._thread_list:
+            thread.join()
+        self._thread_list = []
+
+    def _next_request(self):
+        """Take the next request which can run, called with the lock held"""
+        for io_class, queue in enumerate(self._queue_list):
+            if queue and self._running_list[io_class] < self._limit_list[io_class]:
+                request = queue.popleft()
+                request.state = IORequest.RUNNING
+                self._running_list[io_class] += 1
+                return request
+        return None
+
+    def _run(self):
+        """Run the requests until stopped and no request is queued"""
+        while True:
+            with self._condition:
+                request = self._next_request()
+                while request is None:
+                    if self._stopped and not any(self._queue_list):
+                        return
+                    self._condition.wait()
+                    request = self._next_request()
+            try:
+                request.result = request.func(*request.args)
+            except Exception as e:
+                logger.error("The {} request {} failed".format(IO_CLASS_NAMES[request.io_class], request.key), exc_info=True)
+                request.exception = e
+            with self._condition:
+                self._running_list[request.io_class] -= 1
+                if request.rerun is None:
+                    del self._request_map[request.key]
+                else:
+                    self._request_map[request.key] = request.rerun
+                    self._queue_list[request.rerun.io_class].append(request.rerun)
+                # a thread waiting on a class at its limit can take a request now
+                self._condition.notify_all()
+            request._finish(IORequest.DONE)
@@ -0,0 +1,131 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function, absolute_import
+import threading
+from objectfs.core.cache.ioscheduler import READAHEAD
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+class ReadaheadState(object):
+    """Sequential stream of an open file"""
+
+    __slots__ = ('prev_block_id', 'window', 'async_block_id', 'next_block_id')
+
+    def __init__(self):
+        # last block read
+        self.prev_block_id = None
+        # blocks read ahead at a time, 0 when the file is not read sequentially
+        self.window = 0
+        # reading this block reads the next window ahead
+        self.async_block_id = None
+        # first block not read ahead yet
+        self.next_block_id = 0
+
+class Readahead(object):
+    """Reads the blocks of sequentially read files into the cache ahead of the reader. A stream starts
+    with a small window which doubles each time the reader reaches the last window read ahead, is
+    halved when blocks read ahead are gone from the cache before they are read and is stopped by a
+    random read. Blocks already cached are not read ahead again. The bytes being read ahead by a mount
+    are capped"""
+
+    def __init__(self, fs_name, block_fetcher, cache_store):
+        self._fs_name = fs_name
+        self._config = settings.config
+        self._block_fetcher = block_fetcher
+        self._cache_store = cache_store
+        self._state_map = {}
+        # bytes of the blocks being read ahead
+        self._inflight_map = {}
+        self._inflight_size = 0
+        self._lock = threading.Lock()
+
+    def read(self, inode_id, first_block_id, last_block_id, inode_size, miss_block_list=()):
+        """Follow a read of the blocks first to last of a file of inode_size bytes. The blocks
+        missing from the cache are fetched by the read itself"""
+        if self._config.CACHE_READAHEAD_MIN_BLOCKS == 0:
+            return
+        with self._lock:
+            state = self._state_map.setdefault(inode_id, ReadaheadState())
+            sequential = state.prev_block_id is None and first_block_id == 0 or \
+                state.prev_block_id is not None and state.prev_block_id <= first_block_id <= state.prev_block_id+1
+            state.prev_block_id = last_block_id
+            if not sequential:
+                # random read, stop the stream
+                state.window = 0
+                state.async_block_id = None
+                return
+            if state.window == 0:
+                # new stream, larger reads start with a larger window
+                state.window = min(max(self._config.CACHE_READAHEAD_MIN_BLOCKS, 2*(last_block_id-first_block_id+1)),
+                                   self._config.CACHE_READAHEAD_MAX_BLOCKS)
+                state.next_block_id = last_block_id+1
+            else:
+                # blocks read ahead which are neither cached nor in flight were evicted before they were read
+                for object_block_id in miss_block_list:
+                    if object_block_id < state.next_block_id and (inode_id, object_block_id) not in self._inflight_map:
+                        state.window = max(state.window//2, self._config.CACHE_READAHEAD_MIN_BLOCKS)
+                        break
+                state.next_block_id = max(state.next_block_id, last_block_id+1)
+                if state.async_block_id is None or last_block_id < state.async_block_id:
+                    return
+                state.window = min(2*state.window, self._config.CACHE_READAHEAD_MAX_BLOCKS)
+            self._read_ahead(inode_id, state, inode_size)
+
+    def _read_ahead(self, inode_id, state, inode_size):
+        """Read the next window of a stream ahead, as far as the in flight cap allows"""
+        block_size = self._config.DATA_BLOCK_SIZE
+        num_blocks = (inode_size-1)//block_size+1
+        start_block_id = state.next_block_id
+        end_block_id = min(start_block_id + state.window, num_blocks)
+        for object_block_id in range(start_block_id, end_block_id):
+            key = (inode_id, object_block_id)
+            if key in self._inflight_map:
+                continue
+            # a cached block may be written and not uploaded yet, the object store holds an older one
+            if self._cache_store.exists_inode(inode_id, object_block_id):
+                continue
+            if self._inflight_size + block_size > self._config.CACHE_READAHEAD_MAX_INFLIGHT:
+                logger.debug("Readahead of inode {} capped at object-block {}".format(inode_id, object_block_id))
+                end_block_id = object_block_id
+                break
+            self._inflight_map[key] = block_size
+            self._inflight_size += block_size
+            # blocks are fetched one by one so that a window is fetched in parallel
+            self._block_fetcher.fetch(READAHEAD, inode_id, [object_block_id], inode_size, callback=self._done)
+        # the reader reaching the first block of this window reads the next one ahead
+        state.async_block_id = start_block_id if start_block_id < num_blocks else None
+        state.next_block_id = end_block_id
+
+    def _done(self, request):
+        """Called once the request fetching a block read ahead is done or cancelled"""
+        (inode_id, name, first_block_id, end_block_id) = request.key
+        with self._lock:
+            for object_block_id in range(first_block_id, end_block_id):
+                self._inflight_size -= self._inflight_map.pop((inode_id, object_block_id), 0)
+
+    def release(self, inode_id):
+        """Drop the stream of a file which is closed or truncated and cancel its queued readahead"""
+        with self._lock:
+            self._state_map.pop(inode_id, None)
+        self._block_fetcher.cancel(inode_id)
+
+    @property
+    def inflight_size(self):
+        with self._lock:
+            return self._inflight_size
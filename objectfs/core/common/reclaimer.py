@@ -0,0 +1,128 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function, absolute_import
+import threading
+import redis
+from objectfs.core.common.fragmentmap import FragmentMap
+from objectfs.core.common.mergequeue import MergeQueue
+from objectfs.core.common.blockset import CleanSet, DirtySet
+from objectfs.core.common.objectfsthread import ObjectFSThread
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+FS_DELIMITER = '%'
+NAME_DELIMITER = '@'
+PENDING_SET_NAME = 'RECLAIM'
+
+class InodeReclaimer(object):
+    """Removes the data of deleted files in the background, off the FUSE threads. The objects, log
+    objects, cache blocks and fragment-map keys of the files deleted since the last run are removed
+    together with batched deletes. The deleted files are queued in Redis until their data is removed,
+    so that the files of a mount which crashed are reclaimed by the next mount"""
+
+    def __init__(self, fs_name, data_store, cache_store):
+        self._fs_name = fs_name
+        self._config = settings.config
+        self._data_store = data_store
+        self._cache_store = cache_store
+        self._fragment_map = FragmentMap(fs_name)
+        self._merge_queue = MergeQueue(fs_name)
+        self._dirty_set = DirtySet(fs_name)
+        self._clean_set = CleanSet(fs_name)
+        # the fragment-map keys are on the default redis server
+        self._client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
+        # inode id and number of blocks of the deleted files not yet reclaimed, shared by the mounts
+        self._pending_key = '{}{}{}'.format(fs_name, FS_DELIMITER, PENDING_SET_NAME)
+        self._reclaim_lock = threading.Lock()
+        self._reclaim_event = threading.Event()
+        self._reclaim_thread = None
+
+    def __len__(self):
+        return self._client.scard(self._pending_key)
+
+    def _pending_member(self, inode_id, num_blocks):
+        return '{}{}{}'.format(inode_id, NAME_DELIMITER, num_blocks)
+
+    def start(self):
+        """Start reclaiming in the background, first the files left by mounts which stopped before reclaiming them"""
+        self._reclaim_thread = ObjectFSThread(target=self._run_reclaim, name='InodeReclaim')
+        self._reclaim_thread.daemon = True
+        self._reclaim_event.set()
+        self._reclaim_thread.start()
+
+    def stop(self):
+        """Stop the background reclaim and reclaim the remaining files"""
+        reclaim_thread = self._reclaim_thread
+        self._reclaim_thread = None
+        if reclaim_thread is not None:
+            self._reclaim_event.set()
+            reclaim_thread.join()
+        self.flush()
+
+    def reclaim(self, inode_id, size):
+        """Queue the data of a deleted file for removal. Removed right away when not started"""
+        pipe = self._client.pipeline(transaction=False)
+        pipe.sadd(self._pending_key, self._pending_member(inode_id, size // self._config.DATA_BLOCK_SIZE + 1))
+        pipe.scard(self._pending_key)
+        (added, pending) = pipe.execute()
+        if self._reclaim_thread is None:
+            self.flush()
+        elif pending >= self._config.FS_RECLAIM_BATCH_SIZE:
+            self._reclaim_event.set()
+
+    def _run_reclaim(self):
+        """Reclaim on every interval or when woken up by a full batch"""
+        while self._reclaim_thread is not None:
+            self._reclaim_event.wait(self._config.FS_RECLAIM_INTERVAL)
+            self._reclaim_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # the files are kept and reclaimed with the next try
+                logger.error("Failed to reclaim deleted files for file-system {}".format(self._fs_name), exc_info=True)
+
+    def flush(self):
+        """Reclaim the queued files in batches"""
+        with self._reclaim_lock:
+            while True:
+                member_list = self._client.srandmember(self._pending_key, self._config.FS_RECLAIM_BATCH_SIZE)
+                if not member_list:
+                    return
+                inode_block_list = [tuple(int(value) for value in member.split(NAME_DELIMITER)) for member in member_list]
+                self._reclaim_batch(inode_block_list)
+                # the files are dequeued once reclaimed, a failed or interrupted batch is reclaimed again
+                self._client.srem(self._pending_key, *member_list)
+
+    def _reclaim_batch(self, inode_block_list):
+        """Remove the data of a batch of files"""
+        logger.debug("Reclaim {} deleted files of file-system {}".format(len(inode_block_list), self._fs_name))
+        # the log objects of the files are listed by their merge queues
+        pipe = self._client.pipeline(transaction=False)
+        for (inode_id, num_blocks) in inode_block_list:
+            pipe.lrange(self._merge_queue._queue_key(inode_id), 0, -1)
+        object_name_list = [inode_id for (inode_id, num_blocks) in inode_block_list]
+        for log_object_list in pipe.execute():
+            object_name_list.extend(log_object_list)
+        self._data_store.delete_objects(object_name_list)
+        self._cache_store.remove_inodes(inode_block_list)
+        # the keys are removed last so that a failed batch can find the log objects again
+        for (inode_id, num_blocks) in inode_block_list:
+            key_list = [self._fragment_map._block_key(inode_id, object_block_id) for object_block_id in range(num_blocks)]
+            key_list.extend([self._merge_queue._queue_key(inode_id), self._dirty_set._set_key(inode_id), self._clean_set._set_key(inode_id)])
+            pipe.delete(*key_list)
+        pipe.execute()
@@ -14,10 +14,8 @@
 # limitations under the License.
 
 from __future__ import print_function, absolute_import
-from swiftclient.client import Connection
-import google.cloud.storage as gcstorage
-import google.auth.compute_engine as gcengine
-import boto3
+# the client library of an object store is imported when its connection is made,
+# so that a process only loads the library of the store it uses
 from objectfs.settings import Settings
 settings = Settings()
 import logging
@@ -43,14 +41,17 @@ class StoreConnection(object):
 class SwiftConnection(StoreConnection):
 
     def __init__(self):
+        from swiftclient.client import Connection
         self.conn = Connection(authurl=settings.SWIFT_AUTH_URL, user=settings.SWIFT_AUTH_USER, key=settings.SWIFT_AUTH_KEY)
 
 class S3Connection(StoreConnection):
     
     def __init__(self):
+        import boto3
         self.conn = boto3.resource('s3', region_name=settings.S3_AWS_REGION, endpoint_url=settings.S3_ENDPOINT, aws_access_key_id=settings.AWS_ACCESS_KEY_ID, aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
 
 class GoogleConnection(StoreConnection):
 
     def __init__(self):
+        import google.cloud.storage as gcstorage
         self.conn = gcstorage.client.Client.from_service_account_json(settings.GOOGLE_SERVICE_ACCOUNT_JSON_PATH)
@@ -15,15 +15,19 @@
 
 from __future__ import absolute_import, print_function
 from abc import ABCMeta, abstractmethod
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 import six
-import boto3
-import google.cloud.storage as gcstorage
-from swiftclient.exceptions import ClientException
 from objectfs.core.data.connection import SwiftConnection, S3Connection, GoogleConnection
 from objectfs.core.data.object import SwiftObject, S3Object, GoogleObject
+from objectfs.settings import Settings
+settings = Settings()
 import logging
 logger = logging.getLogger(__name__)
 
+# most objects removed by one multi-object delete request
+DELETE_BATCH_SIZE = 1000
+
 @six.add_metaclass(ABCMeta)
 class Container(object):
     
@@ -46,9 +50,43 @@ class Container(object):
         return NotImplemented
     
     @abstractmethod
-    def delete(self):
+    def exists(self):
+        """Check if the container exists without listing all the containers"""
+        return NotImplemented
+    
+    @abstractmethod
+    def delete(self, num_threads=settings.NUM_THREADS):
         """Delete a container"""
         return NotImplemented
+
+    def _delete_batches(self, batch_iter, delete_batch, num_threads):
+        """Delete batches of object names with a pool of threads. Only a few batches are listed
+           ahead of the deletes so that memory stays bounded for any number of objects
+           Return the number of objects deleted"""
+        pool = ThreadPool(num_threads)
+        try:
+            deleted = 0
+            while True:
+                batch_list = list(islice(batch_iter, num_threads))
+                if not batch_list:
+                    break
+                deleted += sum(pool.map(delete_batch, batch_list))
+            return deleted
+        finally:
+            pool.terminate()
+
+    def delete_objects(self, object_name_list):
+        """Delete objects by name with batched deletes. Missing objects are skipped
+           Return the number of objects deleted"""
+        try:
+            logger.debug("DELETE {} objects in container {}".format(len(object_name_list), self.name))
+            deleted = 0
+            for index in range(0, len(object_name_list), DELETE_BATCH_SIZE):
+                deleted += self._delete_object_batch(object_name_list[index:index+DELETE_BATCH_SIZE])
+            return deleted
+        except Exception as e:
+            logger.error("Failed to DELETE {} objects in container {}".format(len(object_name_list), self.name), exc_info=True)
+            raise e
     
     @staticmethod
     @abstractmethod
@@ -72,6 +110,7 @@ class SwiftContainer(Container):
     @staticmethod
     def list():
         """List containers"""
+        from swiftclient.exceptions import ClientException
         connection = SwiftConnection()
         try:
             logger.debug("LIST all Swift containers")
@@ -85,6 +124,7 @@ class SwiftContainer(Container):
 
     def create(self):
         """Create a container"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("CREATE swift container {}".format(self.name))
             response = self._connection.conn.put_container(self.name)
@@ -95,6 +135,7 @@ class SwiftContainer(Container):
 
     def post(self):
         """Update a container"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("UPDATE swift container {}".format(self.name))
             response = self._connection.conn.post_container(self.name)
@@ -103,10 +144,24 @@ class SwiftContainer(Container):
             logger.error("Failed to UPDATE swift container {}".format(self.name), exc_info=True)
             raise e
 
-    def delete(self):
+    def exists(self):
+        """Check if the container exists"""
+        from swiftclient.exceptions import ClientException
+        try:
+            logger.debug("HEAD swift container {}".format(self.name))
+            self._connection.conn.head_container(self.name)
+            return True
+        except ClientException as e:
+            if e.http_status == 404:
+                return False
+            logger.error("Failed to HEAD swift container {}".format(self.name), exc_info=True)
+            raise e
+
+    def delete(self, num_threads=settings.NUM_THREADS):
         """Delete a container"""
+        from swiftclient.exceptions import ClientException
         try:
-            self.delete_all_objects()
+            self.delete_all_objects(num_threads)
             logger.debug("DELETE swift container {}".format(self.name))
             response = self._connection.conn.delete_container(self.name)
             return response
@@ -125,11 +180,40 @@ class SwiftContainer(Container):
             logger.error("Failed to LIST objects in swift container {}".format(self.name), exc_info=True)
             raise e
     
-    def delete_all_objects(self):
-        """Delete all objects"""
-        logger.debug("DELETE all objects in container {}".format(self.name))
-        for object_item in self.list_objects():
-            object_item.delete()
+    def _list_object_batches(self):
+        """Yield lists of object names, one page of the listing at a time"""
+        marker = ''
+        while True:
+            response = self._connection.conn.get_container(self.name, marker=marker, limit=DELETE_BATCH_SIZE)
+            if not response[1]:
+                break
+            yield [object_item['name'] for object_item in response[1]]
+            marker = response[1][-1]['name']
+
+    def _delete_object_batch(self, object_name_list):
+        """Delete a batch of objects over a connection of the thread"""
+        from swiftclient.exceptions import ClientException
+        connection = SwiftConnection()
+        for object_name in object_name_list:
+            try:
+                connection.conn.delete_object(self.name, object_name)
+            except ClientException as e:
+                # deleted meanwhile
+                if e.http_status != 404:
+                    raise e
+        return len(object_name_list)
+
+    def delete_all_objects(self, num_threads=settings.NUM_THREADS):
+        """Delete all objects with a pool of threads"""
+        from swiftclient.exceptions import ClientException
+        try:
+            logger.debug("DELETE all objects in container {}".format(self.name))
+            deleted = self._delete_batches(self._list_object_batches(), self._delete_object_batch, num_threads)
+            logger.info("DELETED {} objects in container {}".format(deleted, self.name))
+            return deleted
+        except ClientException as e:
+            logger.error("Failed to DELETE all objects in swift container {}".format(self.name), exc_info=True)
+            raise e
 
 class S3Container(Container):
 
@@ -147,9 +231,23 @@ class S3Container(Container):
             print(e)
             raise e
 
-    def delete(self):
+    def exists(self):
+        """Check if the container exists"""
+        import botocore.exceptions
+        try:
+            self._connection.conn.meta.client.head_bucket(Bucket=self.name)
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchBucket']:
+                return False
+            logger.error("Failed to HEAD s3 bucket {}".format(self.name), exc_info=True)
+            raise e
+
+    def delete(self, num_threads=settings.NUM_THREADS):
         """Delete container"""
         try:
+            # a bucket must be empty to be deleted
+            self.delete_all_objects(num_threads)
             response = self._bucket.delete()
             return response
         except Exception as e:
@@ -167,7 +265,10 @@ class S3Container(Container):
         """Return list of objects"""
         try:
             logger.debug("LIST objects s3 container {}".format(self.name))
-            response = self._bucket.objects.all()
+            if prefix:
+                response = self._bucket.objects.filter(Prefix=prefix)
+            else:
+                response = self._bucket.objects.all()
             for page in response.pages():
                 for object_item in page:
                     yield(self.object(object_item.key))
@@ -175,11 +276,33 @@ class S3Container(Container):
             logger.error("Failed to LIST objects in s3 container {}".format(self.name), exc_info=True)
             raise e
     
-    def delete_all_objects(self):
-        """Delete all objects"""
-        logger.debug("DELETE all objects in container {}".format(self.name))
-        for object_item in self.list_objects():
-            object_item.delete()
+    def _list_object_batches(self):
+        """Yield lists of object names, one page of the listing at a time"""
+        paginator = self._connection.conn.meta.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.name, PaginationConfig={'PageSize': DELETE_BATCH_SIZE}):
+            object_name_list = [object_item['Key'] for object_item in page.get('Contents', [])]
+            if object_name_list:
+                yield object_name_list
+
+    def _delete_object_batch(self, object_name_list):
+        """Delete up to 1000 objects with one multi-object delete request. The low level client is thread safe"""
+        response = self._connection.conn.meta.client.delete_objects(Bucket=self.name, Delete={'Objects': [{'Key': object_name} for object_name in object_name_list],
+                                                                                              'Quiet': True})
+        if response.get('Errors'):
+            logger.error("Failed to DELETE {} objects in s3 container {}: {}".format(len(response['Errors']), self.name, response['Errors'][:10]))
+            raise IOError("Failed to DELETE {} objects in s3 container {}".format(len(response['Errors']), self.name))
+        return len(object_name_list)
+
+    def delete_all_objects(self, num_threads=settings.NUM_THREADS):
+        """Delete all objects with multi-object delete requests sent by a pool of threads"""
+        try:
+            logger.debug("DELETE all objects in container {}".format(self.name))
+            deleted = self._delete_batches(self._list_object_batches(), self._delete_object_batch, num_threads)
+            logger.info("DELETED {} objects in container {}".format(deleted, self.name))
+            return deleted
+        except Exception as e:
+            logger.error("Failed to DELETE all objects in s3 container {}".format(self.name), exc_info=True)
+            raise e
 
     @staticmethod
     def list():
@@ -191,6 +314,7 @@ class S3Container(Container):
 class GoogleContainer(Container):
 
     def __init__(self, container_name, store_connection):
+        import google.cloud.storage as gcstorage
         super(GoogleContainer, self).__init__(container_name, store_connection)
         self._bucket = gcstorage.Bucket(self._connection.conn, self.name)
     
@@ -202,9 +326,19 @@ class GoogleContainer(Container):
             print(e)
             raise e
 
-    def delete(self):
+    def exists(self):
+        """Check if the container exists"""
+        try:
+            return self._bucket.exists()
+        except Exception as e:
+            logger.error("Failed to HEAD google bucket {}".format(self.name), exc_info=True)
+            raise e
+
+    def delete(self, num_threads=settings.NUM_THREADS):
         """Delete container"""
         try:
+            # a bucket must be empty to be deleted
+            self.delete_all_objects(num_threads)
             response = self._bucket.delete()
             return response
         except Exception as e:
@@ -220,13 +354,32 @@ class GoogleContainer(Container):
     
     def list_objects(self, prefix=None, full_listing=False):
         """Return list of objects"""
-        for blob in self._bucket.list_blobs():
+        for blob in self._bucket.list_blobs(prefix=prefix):
             yield (self.object(blob.name))
     
-    def delete_all_objects(self):
-        """Delete all objects"""
-        object_list = self.list_objects()
-        self._bucket.delete_blobs(object_list)
+    def _list_object_batches(self):
+        """Yield lists of object names, one page of the listing at a time"""
+        for page in self._bucket.list_blobs().pages:
+            yield [blob.name for blob in page]
+
+    def _delete_object_batch(self, object_name_list):
+        """Delete a batch of objects over a connection of the thread"""
+        import google.cloud.storage as gcstorage
+        bucket = gcstorage.Bucket(GoogleConnection().conn, self.name)
+        # deleted meanwhile
+        bucket.delete_blobs(object_name_list, on_error=lambda blob: None)
+        return len(object_name_list)
+
+    def delete_all_objects(self, num_threads=settings.NUM_THREADS):
+        """Delete all objects with a pool of threads"""
+        try:
+            logger.debug("DELETE all objects in container {}".format(self.name))
+            deleted = self._delete_batches(self._list_object_batches(), self._delete_object_batch, num_threads)
+            logger.info("DELETED {} objects in container {}".format(deleted, self.name))
+            return deleted
+        except Exception as e:
+            logger.error("Failed to DELETE all objects in google container {}".format(self.name), exc_info=True)
+            raise e
     
     @staticmethod
     def list():
@@ -16,10 +16,7 @@
 from __future__ import absolute_import, print_function
 from abc import ABCMeta, abstractmethod
 import six
-import botocore
-import google.cloud.storage as gcstorage
 import cStringIO
-from swiftclient.exceptions import ClientException
 from objectfs.settings import Settings
 settings = Settings()
 import logging
@@ -34,6 +31,7 @@ class DataObject(object):
         self._container = container_obj
         self._connection = store_connection
         self._name = str(object_name)
+        self._config = settings.config
     
     @property
     def container(self):
@@ -51,6 +49,11 @@ class DataObject(object):
     def get(self):
         """Get an object"""
         return NotImplemented
+
+    @abstractmethod
+    def get_range(self, offset, size):
+        """Get size bytes of an object from offset with one ranged request"""
+        return NotImplemented
     
     @abstractmethod
     def put(self, contents):
@@ -112,6 +115,7 @@ class SwiftObject(DataObject):
     
     def put(self, contents, content_type='text/plain'):
         """Put an object"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("PUT an object {} to swift container {}".format(self.name, self.container.name))
             self._connection.conn.put_object(self.container.name, self.name, contents=contents, content_type=content_type)
@@ -121,6 +125,7 @@ class SwiftObject(DataObject):
     
     def get(self):
         """Get an object"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("GET an object {} from swift container {}".format(self.name, self.container.name))
             response_headers, object_contents = self._connection.conn.get_object(self.container.name, self.name)
@@ -129,8 +134,21 @@ class SwiftObject(DataObject):
             logger.error("Failed to GET an object {} from swift container {}".format(self.name, self.container.name), exc_info=True)
             raise e
 
+    def get_range(self, offset, size):
+        """Get size bytes of an object from offset"""
+        from swiftclient.exceptions import ClientException
+        try:
+            logger.debug("GET range {}-{} of an object {} from swift container {}".format(offset, offset+size-1, self.name, self.container.name))
+            response_headers, object_contents = self._connection.conn.get_object(self.container.name, self.name,
+                                                                                 headers={'Range': 'bytes={}-{}'.format(offset, offset+size-1)})
+            return object_contents
+        except ClientException as e:
+            logger.error("Failed to GET range {}-{} of an object {} from swift container {}".format(offset, offset+size-1, self.name, self.container.name), exc_info=True)
+            raise e
+
     def delete(self):
         """Delete an object"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("DELETE an object {} from swift container {}".format(self.name, self.container.name))
             if self.head():
@@ -142,6 +160,7 @@ class SwiftObject(DataObject):
     def head(self):
         """Head an object. This method does not get an object but just check if it exists or not.
         For now return bool"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("HEAD an object {} from swift container {}".format(self.name, self.container.name))
             response_headers = self._connection.conn.head_object(self.container.name, self.name)
@@ -156,6 +175,7 @@ class SwiftObject(DataObject):
     def move(self, new_object_name):
         """Renames an object. This method copies the object into the new object name and 
         then delets the old copy"""
+        from swiftclient.exceptions import ClientException
         try:
             logger.debug("COPY object {} to {} in container {}".format(self.name, new_object_name, self.container.name))
             self._connection.conn.copy_object(self.container.name, self.name, destination='/{}/{}'.format(self.container.name, new_object_name))
@@ -277,15 +297,22 @@ class S3Object(DataObject):
         """Get an object"""
         try:
             if object_block_id is not None:
-                # print(object_block_id, object_block_id*settings.DATA_BLOCK_SIZE, (object_block_id+1)*settings.DATA_BLOCK_SIZE)
-                object_block_id = int(object_block_id)
-                response = self._object.get(Range='bytes={}-{}'.format(object_block_id*settings.DATA_BLOCK_SIZE, (object_block_id+1)*settings.DATA_BLOCK_SIZE))
-            else:
-                response = self._object.get()
+                block_size = self._config.DATA_BLOCK_SIZE
+                return self.get_range(int(object_block_id)*block_size, block_size)
+            response = self._object.get()
             return response['Body'].read()
         except Exception as e:
             print(e)
             raise e
+
+    def get_range(self, offset, size):
+        """Get size bytes of an object from offset. The end of an HTTP range is inclusive"""
+        try:
+            response = self._object.get(Range='bytes={}-{}'.format(offset, offset+size-1))
+            return response['Body'].read()
+        except Exception as e:
+            logger.error("Failed to GET range {}-{} of an object {} from s3 container {}".format(offset, offset+size-1, self.name, self.container.name), exc_info=True)
+            raise e
     
     def download_fileobj(self, config=None):
         """Download S3 object using the download fileobj function"""
@@ -313,6 +340,7 @@ class S3Object(DataObject):
 
     def head(self):
         """Check if an object exists or not"""
+        import botocore.exceptions
         try:
             response = self._object.load()
             return True
@@ -337,6 +365,7 @@ class S3Object(DataObject):
 class GoogleObject(DataObject):
 
     def __init__(self, container_obj, object_name, store_connection):
+        import google.cloud.storage as gcstorage
         super(GoogleObject, self).__init__(container_obj, object_name, store_connection)
         self._object = gcstorage.blob.Blob(str(self.name), self.container._bucket)
     
@@ -348,6 +377,14 @@ class GoogleObject(DataObject):
         except Exception as e:
           print(e)
           raise e
+
+    def get_range(self, offset, size):
+        """Get size bytes of an object from offset"""
+        try:
+            return self._object.download_as_string(start=offset, end=offset+size-1)
+        except Exception as e:
+            logger.error("Failed to GET range {}-{} of an object {} from google container {}".format(offset, offset+size-1, self.name, self.container.name), exc_info=True)
+            raise e
     
     def put(self, contents):
         """Put an object"""
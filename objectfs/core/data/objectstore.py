@@ -39,6 +39,14 @@ class ObjectStore(object):
         else:  
             return self.container.object(inode_id).get(object_block_id)
 
+    def get_dnode_range(self, inode_id, offset, size, log_object_name=None):
+        """Return size bytes of the data node for this inode from offset with one ranged request"""
+        logger.debug('GET Dnode range {}-{} for inode {}'.format(offset, offset+size-1, inode_id))
+        if log_object_name:
+            return self.container.object(log_object_name).get_range(offset, size)
+        else:
+            return self.container.object(inode_id).get_range(offset, size)
+
     def put_dnode(self, inode_id, data, log_object_name=None):
         """Insert a data node for this inode"""
         logger.debug('PUT Dnode for inode {}'.format(inode_id))
@@ -90,6 +98,31 @@ class ObjectStore(object):
         else:
             return self.container.object(inode_id).complete_multipart_upload(multipart_id, etag_part_list)
 
+    def put_object(self, object_name, data):
+        """Insert an object which is not a data node, like a metadata checkpoint"""
+        logger.debug('PUT object {}'.format(object_name))
+        return self.container.object(object_name).put(data)
+
+    def get_object(self, object_name):
+        """Return an object which is not a data node"""
+        logger.debug('GET object {}'.format(object_name))
+        return self.container.object(object_name).get()
+
+    def delete_object(self, object_name):
+        """Delete an object which is not a data node"""
+        logger.debug('DELETE object {}'.format(object_name))
+        return self.container.object(object_name).delete()
+
+    def delete_objects(self, object_name_list):
+        """Delete data nodes and other objects by name in batches"""
+        logger.debug('DELETE {} objects'.format(len(object_name_list)))
+        return self.container.delete_objects([str(object_name) for object_name in object_name_list])
+
+    def list_objects(self, prefix):
+        """Return the names of the objects starting with prefix"""
+        logger.debug('LIST objects with prefix {}'.format(prefix))
+        return [object_item.name for object_item in self.container.list_objects(prefix=prefix, full_listing=True)]
+
     @property
     def container(self):
         return self.__class__.load_container()(self._container_name, self.__class__.connection()())
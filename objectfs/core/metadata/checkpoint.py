@@ -0,0 +1,137 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import json
+import zlib
+import struct
+from time import time
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.data.objectstore import ObjectStoreFactory
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+# checkpoint objects are named checkpoint%<checkpoint id>%<chunk>. Data objects are named by inode id
+CHECKPOINT_PREFIX = 'checkpoint'
+DELIMITER = '%'
+# points at the id of the last complete checkpoint
+LATEST_CHECKPOINT = 'latest'
+MANIFEST = 'manifest'
+# every record of a chunk is the key length, the value length, the key and the dumped value
+RECORD_STRUCT = struct.Struct('!HI')
+# favour speed, the dumped values are already compact
+COMPRESSION_LEVEL = 1
+
+class Checkpoint(object):
+    """Snapshot of the metadata of a file-system stored as compressed chunks in its container"""
+
+    def __init__(self, fs_name, meta_store=None, object_store=None):
+        self._fs_name = fs_name
+        self._meta_store = meta_store if meta_store is not None else MetaStoreFactory.create_store(fs_name)
+        self._object_store = object_store if object_store is not None else ObjectStoreFactory.create_store(fs_name)
+
+    def _object_name(self, checkpoint_id, name):
+        return DELIMITER.join([CHECKPOINT_PREFIX, str(checkpoint_id), str(name)])
+
+    @staticmethod
+    def encode_chunk(record_list):
+        """Pack and compress the key and value pairs of a chunk"""
+        return zlib.compress(''.join(RECORD_STRUCT.pack(len(key), len(value)) + key + value for (key, value) in record_list), COMPRESSION_LEVEL)
+
+    @staticmethod
+    def decode_chunk(chunk):
+        """Return the key and value pairs of a chunk"""
+        data = zlib.decompress(chunk)
+        record_list = []
+        offset = 0
+        while offset < len(data):
+            (key_length, value_length) = RECORD_STRUCT.unpack_from(data, offset)
+            offset += RECORD_STRUCT.size
+            record_list.append((data[offset:offset+key_length], data[offset+key_length:offset+key_length+value_length]))
+            offset += key_length+value_length
+        return record_list
+
+    def _save_chunk(self, (checkpoint_id, chunk_id, key_list)):
+        """Dump a batch of keys and upload them as one chunk
+           Return the number of keys saved"""
+        record_list = self._meta_store.dump_keys(key_list)
+        self._object_store.put_object(self._object_name(checkpoint_id, chunk_id), Checkpoint.encode_chunk(record_list))
+        return len(record_list)
+
+    def _load_chunk(self, (checkpoint_id, chunk_id)):
+        """Download a chunk and load its keys
+           Return the number of keys loaded"""
+        record_list = Checkpoint.decode_chunk(self._object_store.get_object(self._object_name(checkpoint_id, chunk_id)))
+        self._meta_store.restore_keys(record_list)
+        return len(record_list)
+
+    def save(self, chunk_size=settings.META_CHECKPOINT_CHUNK_SIZE, num_threads=settings.META_CHECKPOINT_NUM_THREADS):
+        """Stream all the inode, directory and superblock keys into a new checkpoint. Chunks are dumped and
+           uploaded in parallel. The checkpoint becomes the latest one once all its chunks are stored
+           Return the checkpoint id"""
+        checkpoint_id = int(time() * 1000)
+        logger.info("Save checkpoint {} for file-system {}".format(checkpoint_id, self._fs_name))
+        pool = ThreadPool(num_threads)
+        try:
+            key_batches = ((checkpoint_id, chunk_id, key_list) for (chunk_id, key_list) in enumerate(self._meta_store.scan_metadata_keys(chunk_size)))
+            # only a few batches are scanned ahead of the uploads so that memory stays bounded for any number of keys
+            count_list = []
+            while True:
+                batch_list = list(islice(key_batches, num_threads * 2))
+                if not batch_list:
+                    break
+                count_list.extend(pool.map(self._save_chunk, batch_list))
+        except Exception as e:
+            logger.error("Failed to save checkpoint {} for file-system {}".format(checkpoint_id, self._fs_name), exc_info=True)
+            raise e
+        finally:
+            pool.terminate()
+        manifest = {'id': checkpoint_id, 'chunks': len(count_list), 'keys': sum(count_list)}
+        self._object_store.put_object(self._object_name(checkpoint_id, MANIFEST), json.dumps(manifest))
+        self._object_store.put_object(DELIMITER.join([CHECKPOINT_PREFIX, LATEST_CHECKPOINT]), str(checkpoint_id))
+        logger.info("Saved checkpoint {} with {} keys in {} chunks for file-system {}".format(checkpoint_id, manifest['keys'], manifest['chunks'], self._fs_name))
+        return checkpoint_id
+
+    def latest(self):
+        """Return the id of the latest checkpoint"""
+        return int(self._object_store.get_object(DELIMITER.join([CHECKPOINT_PREFIX, LATEST_CHECKPOINT])))
+
+    def manifest(self, checkpoint_id):
+        """Return the manifest of a checkpoint with its number of chunks and keys"""
+        return json.loads(self._object_store.get_object(self._object_name(checkpoint_id, MANIFEST)))
+
+    def load(self, checkpoint_id=None, num_threads=settings.META_CHECKPOINT_NUM_THREADS, manifest=None):
+        """Load the keys of a checkpoint, by default the latest one. Chunks are downloaded and loaded in parallel
+           with pipelined restores. Keys which exist are replaced. The manifest is fetched unless it is given
+           Return the number of keys loaded"""
+        if checkpoint_id is None:
+            checkpoint_id = self.latest()
+        if manifest is None:
+            manifest = self.manifest(checkpoint_id)
+        logger.info("Load checkpoint {} with {} keys for file-system {}".format(checkpoint_id, manifest['keys'], self._fs_name))
+        pool = ThreadPool(num_threads)
+        try:
+            loaded = sum(pool.imap_unordered(self._load_chunk, ((checkpoint_id, chunk_id) for chunk_id in range(manifest['chunks']))))
+        except Exception as e:
+            logger.error("Failed to load checkpoint {} for file-system {}".format(checkpoint_id, self._fs_name), exc_info=True)
+            raise e
+        finally:
+            pool.terminate()
+        logger.info("Loaded checkpoint {} with {} keys for file-system {}".format(checkpoint_id, loaded, self._fs_name))
+        return loaded
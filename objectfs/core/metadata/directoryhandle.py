@@ -0,0 +1,63 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function, absolute_import
+import collections
+from itertools import islice
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+class DirectoryHandle(object):
+    """Listing cursor of an open directory. A readdir which continues where the last one stopped
+       resumes the pinned scan, so listing a directory reads every entry once and holds at most
+       one batch of entries in memory"""
+
+    def __init__(self, meta_store, inode_id, batch_size=settings.META_READDIR_BATCH_SIZE):
+        self._meta_store = meta_store
+        self._inode_id = inode_id
+        self._batch_size = batch_size
+        # offset the pinned scan continues from, None until the first readdir
+        self._offset = None
+        self._entry_scan = None
+        # fetched entries with their child inodes not returned yet
+        self._entry_batch = collections.deque()
+
+    @property
+    def inode_id(self):
+        return self._inode_id
+
+    def read(self, offset):
+        """Yield the name, child inode and next offset of the entries after a readdir offset. Child inodes
+           are fetched a batch at a time. An entry yielded last is kept for the next readdir unless the
+           caller asked for the one after it, since the caller may have had no room for it"""
+        if offset != self._offset:
+            # first readdir or a seek, start a new scan at the offset
+            logger.debug("Start scan of inode:{} list at offset:{}".format(self._inode_id, offset))
+            self._entry_scan = self._meta_store.scan_inode_id_list(self._inode_id, offset=offset)
+            self._entry_batch.clear()
+            self._offset = offset
+        while True:
+            if not self._entry_batch:
+                entry_list = list(islice(self._entry_scan, self._batch_size))
+                if not entry_list:
+                    break
+                inode_list = self._meta_store.get_inodes([inode_child_id for (inode_child_id, file_name, next_offset) in entry_list])
+                self._entry_batch.extend((file_name, inode, next_offset) for ((inode_child_id, file_name, next_offset), inode) in zip(entry_list, inode_list))
+            entry = self._entry_batch[0]
+            yield entry
+            self._entry_batch.popleft()
+            self._offset = entry[2]
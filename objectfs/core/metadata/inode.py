@@ -17,22 +17,37 @@ from __future__ import print_function, absolute_import
 import os
 import llfuse
 import stat
+import struct
 import cPickle as pickle
 from time import time
 import logging
 logger = logging.getLogger(__name__)
 
+# version byte at the start of every encoded inode. Inodes stored before
+# the binary encoding are pickles and never start with this byte
+FORMAT_VERSION = 1
+# version, flags, id, mode, parent inode id, size, open count, lookup count,
+# uid, gid, atime, mtime, ctime, rdev, nlink
+INODE_STRUCT = struct.Struct('!BBQIQQiiIIqqqQi')
+# length prefix for the name and the symlink target
+LENGTH_STRUCT = struct.Struct('!H')
+FLAG_NAME = 0x1
+FLAG_TARGET = 0x2
+
 class Inode(object):
 
-    def __init__(self, fs_name, node_id, mode, object_name=None, parent_inode_id=llfuse.ROOT_INODE, size=0, uid=os.getuid(), gid=os.getgid(), atime=None, mtime=None, ctime=None, target=None, rdev=0, nlink=1):
+    __slots__ = ('_id', '_mode', '_fs_name', '_name', '_parent_inode_id', '_size', '_open_count', '_lookup_count',
+                 '_uid', '_gid', '_atime', '_mtime', '_ctime', '_rdev', '_target', '_nlink', '_session')
+
+    def __init__(self, fs_name, node_id, mode, object_name=None, parent_inode_id=llfuse.ROOT_INODE, size=0, uid=os.getuid(), gid=os.getgid(), atime=None, mtime=None, ctime=None, target=None, rdev=0, nlink=1, open_count=0, lookup_count=0):
         self._id = node_id
         self._mode = mode
         self._fs_name = fs_name
         self._name = object_name
         self._parent_inode_id = parent_inode_id
         self._size = size
-        self._open_count = 0
-        self._lookup_count = 0
+        self._open_count = open_count
+        self._lookup_count = lookup_count
         self._uid = uid
         self._gid = gid
         self._atime = self._get_time()
@@ -41,25 +56,70 @@ class Inode(object):
         self._rdev = rdev
         self._target = target
         self._nlink = nlink
-        self._inode_id_list = []
+        # inode session collecting the changes, if any
+        self._session = None
     
     @staticmethod
-    def from_string(object_string):
-        """Serialization method. Converts object to string"""
-        return pickle.loads(object_string)
+    def from_string(object_string, fs_name):
+        """Deserialization method. Converts string to object"""
+        if object_string[:1] != chr(FORMAT_VERSION):
+            # inode stored before the binary encoding
+            return pickle.loads(object_string)
+        inode = Inode.__new__(Inode)
+        (version, flags, inode._id, inode._mode, inode._parent_inode_id, inode._size, inode._open_count, inode._lookup_count,
+         inode._uid, inode._gid, inode._atime, inode._mtime, inode._ctime, inode._rdev, inode._nlink) = INODE_STRUCT.unpack_from(object_string)
+        offset = INODE_STRUCT.size
+        (inode._name, offset) = Inode._decode_field(object_string, offset, flags & FLAG_NAME)
+        (inode._target, offset) = Inode._decode_field(object_string, offset, flags & FLAG_TARGET)
+        inode._fs_name = fs_name
+        inode._session = None
+        return inode
 
     @staticmethod
     def to_string(inode_object):
-        """Deserialization method. Converts string to object"""
-        return pickle.dumps(inode_object)
-    
+        """Serialization method. Converts object to string"""
+        flags = (FLAG_NAME if inode_object.name is not None else 0) | (FLAG_TARGET if inode_object.target is not None else 0)
+        return ''.join([INODE_STRUCT.pack(FORMAT_VERSION, flags, inode_object.id, inode_object.mode, inode_object.parent_inode_id,
+                                          inode_object.size, inode_object.open_count, inode_object.lookup_count, inode_object.uid,
+                                          inode_object.gid, inode_object.atime, inode_object.mtime, inode_object.ctime,
+                                          inode_object.rdev, inode_object.nlink),
+                        Inode._encode_field(inode_object.name),
+                        Inode._encode_field(inode_object.target)])
+
+    @staticmethod
+    def is_encoded(object_string):
+        """Check if the string uses the current encoding"""
+        return object_string[:1] == chr(FORMAT_VERSION)
+
+    @staticmethod
+    def _encode_field(value):
+        """Length prefixed encoding of a name or target"""
+        if value is None:
+            return ''
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        return LENGTH_STRUCT.pack(len(value)) + value
+
+    @staticmethod
+    def _decode_field(object_string, offset, present):
+        """Return the name or target at offset and the offset after it"""
+        if not present:
+            return (None, offset)
+        (length,) = LENGTH_STRUCT.unpack_from(object_string, offset)
+        offset += LENGTH_STRUCT.size
+        return (object_string[offset:offset+length], offset+length)
+
     def __getstate__(self):
-        """Called to pickle class"""
-        return self.__dict__
+        """Called to pickle and copy class"""
+        # the session is local to the operation and is never stored
+        return dict((slot, getattr(self, slot)) for slot in self.__slots__ if slot != '_session')
 
     def __setstate__(self, state):
-        """Called to unpickle class"""
-        self.__dict__.update(state)
+        """Called to unpickle and copy class"""
+        for slot in self.__slots__:
+            if slot in state:
+                setattr(self, slot, state[slot])
+        self._session = None
     
     def _get_time(self):
         """Return the time since epoch as expected by FUSE"""
@@ -113,6 +173,8 @@ class Inode(object):
         logger.debug("Set size as {}".format(value))
         self.update()
 
+    # the operations keep the open and lookup counts of a mount in an InodeCountTable.
+    # The fields stay in the stored format but are no longer updated
     @property
     def open_count(self):
         return self._open_count
@@ -235,6 +297,10 @@ class Inode(object):
         MetaStoreFactory.create_store(self.fs_name).remove_inode_id_from_list(self.id, existing_id)
 
     def update(self):
-        """Save the changed object to memory store"""
+        """Save the changed object to memory store. Within an inode session the
+        change is collected and written once when the session commits"""
+        if self._session is not None:
+            self._session.mark_dirty(self)
+            return
         from objectfs.core.metadata.metastore import MetaStoreFactory
         MetaStoreFactory.create_store(self.fs_name).update_inode(self)
@@ -0,0 +1,361 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function, absolute_import
+import os
+import copy
+import uuid
+import threading
+import collections
+from time import time, sleep
+import redis
+from objectfs.core.common.objectfsthread import ObjectFSThread
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+FS_DELIMITER = '%'
+# directory entries are hashes named <inode id>&dir by the meta store, followed by
+# &<bucket> for the buckets of a split directory
+DIRECTORY_SUFFIX = '&dir'
+# keyspace events for string commands, hash commands and generic commands like del
+KEYSPACE_EVENTS = 'K$hg'
+# a mount publishes markers on <fs name>%changes around the namespace scripts it runs. The keyspace
+# events in between are its own changes, which it invalidated when it made them
+CHANGE_CHANNEL = 'changes'
+BEGIN_MARKER = 'begin'
+END_MARKER = 'end'
+
+class InvalidationLog(object):
+    """Sequence numbers of the latest invalidations of the keys of a cache. A fill which started before
+       the last invalidation of its key may have read a stale value and is dropped. Only the latest
+       invalidations are remembered, fills which started before a forgotten one are dropped as well.
+       Called with the lock of the cache held"""
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._sequence = 0
+        # fills which started before this sequence are stale for every key
+        self._floor_sequence = 0
+        self._sequence_map = collections.OrderedDict()
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    def invalidate(self, key):
+        """Log an invalidation of the key"""
+        self._sequence += 1
+        self._sequence_map.pop(key, None)
+        self._sequence_map[key] = self._sequence
+        if len(self._sequence_map) > self._capacity:
+            (forgotten_key, self._floor_sequence) = self._sequence_map.popitem(last=False)
+
+    def clear(self):
+        """Log an invalidation of all the keys"""
+        self._sequence += 1
+        self._floor_sequence = self._sequence
+        self._sequence_map.clear()
+
+    def is_stale(self, key, sequence):
+        """Check if a fill of the key which started at sequence raced with an invalidation"""
+        return sequence < self._floor_sequence or self._sequence_map.get(key, 0) > sequence
+
+class InodeCache(object):
+    """Bounded LRU of decoded inodes and their entry attributes for a mounted file-system"""
+
+    __caches = {}
+    __lock = threading.Lock()
+
+    def __init__(self, fs_name, capacity):
+        self._fs_name = fs_name
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._inode_map = collections.OrderedDict()
+        self._entry_map = {}
+        # fills which started before an invalidation of their inode are dropped
+        self._invalidation_log = InvalidationLog(capacity)
+        # tells the changes of this mount apart from those of other mounts
+        self._mount_id = uuid.uuid4().hex
+        # cache is only valid in the process which enabled it and not in forked workers
+        self._pid = os.getpid()
+
+    @staticmethod
+    def enable(fs_name, capacity=settings.META_INODE_CACHE_SIZE):
+        """Enable the cache for the file-system in this process"""
+        if capacity <= 0:
+            logger.info("Inode cache is disabled for file-system {}".format(fs_name))
+            return None
+        with InodeCache.__lock:
+            cache = InodeCache(fs_name, capacity)
+            InodeCache.__caches[fs_name] = cache
+        logger.info("Enable inode cache with {} entries for file-system {}".format(capacity, fs_name))
+        if settings.META_STORE == 'ShardedRedis':
+            address_list = settings.META_SHARD_LIST
+        elif settings.META_STORE == 'Sqlite':
+            # the database is local to the mount, every change goes through this cache
+            address_list = []
+        else:
+            address_list = [(settings.REDIS_HOST, settings.REDIS_PORT)]
+        # inodes can change on every server holding them
+        for (host, port) in address_list:
+            listener_thread = ObjectFSThread(target=cache._run_invalidation_listener, args=(host, port), name='InodeCache')
+            listener_thread.daemon = True
+            listener_thread.start()
+        return cache
+
+    @staticmethod
+    def disable(fs_name):
+        """Disable the cache for the file-system"""
+        with InodeCache.__lock:
+            InodeCache.__caches.pop(fs_name, None)
+
+    @staticmethod
+    def load(fs_name):
+        """Return the cache for the file-system if enabled in this process"""
+        cache = InodeCache.__caches.get(fs_name)
+        if cache is not None and cache._pid == os.getpid():
+            return cache
+        return None
+
+    @property
+    def epoch(self):
+        return self._invalidation_log.sequence
+
+    @property
+    def change_channel(self):
+        return '{}{}{}'.format(self._fs_name, FS_DELIMITER, CHANGE_CHANNEL)
+
+    @property
+    def begin_marker(self):
+        return '{}{}'.format(self._mount_id, BEGIN_MARKER)
+
+    @property
+    def end_marker(self):
+        return '{}{}'.format(self._mount_id, END_MARKER)
+
+    def __len__(self):
+        return len(self._inode_map)
+
+    def get(self, inode_id):
+        """Get a copy of a cached inode. The copy can be changed freely by the caller"""
+        inode_id = int(inode_id)
+        with self._lock:
+            inode = self._inode_map.pop(inode_id, None)
+            if inode is None:
+                return None
+            self._inode_map[inode_id] = inode
+        return copy.copy(inode)
+
+    def put(self, inode, epoch):
+        """Cache an inode read at epoch"""
+        inode = copy.copy(inode)
+        with self._lock:
+            if self._invalidation_log.is_stale(inode.id, epoch):
+                return
+            self._inode_map.pop(inode.id, None)
+            self._inode_map[inode.id] = inode
+            while len(self._inode_map) > self._capacity:
+                (evicted_id, evicted_inode) = self._inode_map.popitem(last=False)
+                self._entry_map.pop(evicted_id, None)
+
+    def get_entry(self, inode_id):
+        """Get the entry attributes built for a cached inode"""
+        return self._entry_map.get(int(inode_id))
+
+    def put_entry(self, inode_id, entry, epoch):
+        """Cache the entry attributes of an inode. Only kept while the inode is cached"""
+        inode_id = int(inode_id)
+        with self._lock:
+            if not self._invalidation_log.is_stale(inode_id, epoch) and inode_id in self._inode_map:
+                self._entry_map[inode_id] = entry
+
+    def invalidate(self, inode_id):
+        """Drop an inode from the cache"""
+        inode_id = int(inode_id)
+        with self._lock:
+            self._invalidation_log.invalidate(inode_id)
+            self._inode_map.pop(inode_id, None)
+            self._entry_map.pop(inode_id, None)
+
+    def clear(self):
+        """Drop all inodes from the cache"""
+        with self._lock:
+            self._invalidation_log.clear()
+            self._inode_map.clear()
+            self._entry_map.clear()
+
+    def _enable_keyspace_events(self, client):
+        """Turn on the keyspace notifications needed for invalidation"""
+        try:
+            events = client.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            if not set(KEYSPACE_EVENTS).issubset(events):
+                client.config_set('notify-keyspace-events', ''.join(set(events).union(KEYSPACE_EVENTS)))
+        except redis.ResponseError as e:
+            logger.warn("Cannot enable keyspace notifications. Inodes changed by other mounts will not be invalidated", exc_info=True)
+
+    def _run_invalidation_listener(self, host, port):
+        """Invalidate inodes changed by other mounts using Redis keyspace notifications"""
+        channel_prefix = '__keyspace@{}__:{}{}'.format(settings.REDIS_DB, self._fs_name, FS_DELIMITER)
+        while InodeCache.load(self._fs_name) is self:
+            try:
+                client = redis.StrictRedis(host=host, port=port, db=settings.REDIS_DB)
+                self._enable_keyspace_events(client)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe('{}*'.format(channel_prefix))
+                pubsub.subscribe(self.change_channel)
+                # events may have been missed while we were not subscribed
+                self.clear()
+                dentry_cache = DentryCache.load(self._fs_name)
+                if dentry_cache is not None:
+                    dentry_cache.clear()
+                own_changes = False
+                for message in pubsub.listen():
+                    # a script runs atomically, so no other events come between its markers
+                    if message['channel'] == self.change_channel:
+                        own_changes = message['data'] == self.begin_marker
+                        continue
+                    if own_changes:
+                        continue
+                    key = message['channel'][len(channel_prefix):]
+                    # buckets of a split directory are named <inode id>&dir&<bucket>
+                    (inode_id, suffix, bucket) = key.partition(DIRECTORY_SUFFIX)
+                    # only inode keys and directory entries are cached
+                    if key.isdigit():
+                        self.invalidate(key)
+                    elif suffix and inode_id.isdigit() and (not bucket or bucket[1:].isdigit()):
+                        dentry_cache = DentryCache.load(self._fs_name)
+                        if dentry_cache is not None:
+                            dentry_cache.invalidate_directory(inode_id)
+            except redis.ConnectionError as e:
+                logger.error("Lost the keyspace notifications for file-system {}".format(self._fs_name), exc_info=True)
+                sleep(1)
+
+class DentryCache(object):
+    """Bounded LRU of directory entries from parent inode id and name to inode id for a mounted
+       file-system. Missing names are cached as negative entries which expire after a TTL"""
+
+    __caches = {}
+    __lock = threading.Lock()
+
+    def __init__(self, fs_name, capacity, negative_ttl):
+        self._fs_name = fs_name
+        self._capacity = capacity
+        self._negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # (parent inode id, name) to inode id, or None for a missing name, and the expiry time
+        self._entry_map = collections.OrderedDict()
+        # names cached for each parent inode id, to drop a whole directory
+        self._directory_map = {}
+        # fills which started before an invalidation of their name or directory are dropped
+        self._invalidation_log = InvalidationLog(capacity)
+        # cache is only valid in the process which enabled it and not in forked workers
+        self._pid = os.getpid()
+
+    @staticmethod
+    def enable(fs_name, capacity=settings.META_DENTRY_CACHE_SIZE, negative_ttl=settings.META_DENTRY_NEGATIVE_TTL):
+        """Enable the cache for the file-system in this process. Entries changed by other mounts are
+           invalidated by the listener of the inode cache, which has to be enabled first"""
+        if capacity <= 0 or InodeCache.load(fs_name) is None:
+            logger.info("Dentry cache is disabled for file-system {}".format(fs_name))
+            return None
+        with DentryCache.__lock:
+            cache = DentryCache(fs_name, capacity, negative_ttl)
+            DentryCache.__caches[fs_name] = cache
+        logger.info("Enable dentry cache with {} entries for file-system {}".format(capacity, fs_name))
+        return cache
+
+    @staticmethod
+    def disable(fs_name):
+        """Disable the cache for the file-system"""
+        with DentryCache.__lock:
+            DentryCache.__caches.pop(fs_name, None)
+
+    @staticmethod
+    def load(fs_name):
+        """Return the cache for the file-system if enabled in this process"""
+        cache = DentryCache.__caches.get(fs_name)
+        if cache is not None and cache._pid == os.getpid():
+            return cache
+        return None
+
+    @property
+    def epoch(self):
+        return self._invalidation_log.sequence
+
+    def __len__(self):
+        return len(self._entry_map)
+
+    def get(self, parent_inode_id, name):
+        """Return if the entry is cached and its inode id, None for a missing name"""
+        key = (int(parent_inode_id), name)
+        with self._lock:
+            value = self._entry_map.pop(key, None)
+            if value is None:
+                return (False, None)
+            (inode_id, expiry_time) = value
+            if expiry_time is not None and expiry_time <= time():
+                self._remove_name(key)
+                return (False, None)
+            self._entry_map[key] = value
+        return (True, inode_id)
+
+    def put(self, parent_inode_id, name, inode_id, epoch):
+        """Cache an entry read at epoch. An inode id of None caches a missing name"""
+        if inode_id is None and self._negative_ttl <= 0:
+            return
+        key = (int(parent_inode_id), name)
+        expiry_time = time() + self._negative_ttl if inode_id is None else None
+        with self._lock:
+            if self._invalidation_log.is_stale(key, epoch) or self._invalidation_log.is_stale(key[0], epoch):
+                return
+            self._entry_map.pop(key, None)
+            self._entry_map[key] = (inode_id, expiry_time)
+            self._directory_map.setdefault(key[0], set()).add(name)
+            while len(self._entry_map) > self._capacity:
+                (evicted_key, evicted_value) = self._entry_map.popitem(last=False)
+                self._remove_name(evicted_key)
+
+    def _remove_name(self, key):
+        """Drop a name from its directory. Called with the lock held"""
+        name_set = self._directory_map.get(key[0])
+        if name_set is not None:
+            name_set.discard(key[1])
+            if not name_set:
+                del self._directory_map[key[0]]
+
+    def invalidate(self, parent_inode_id, name):
+        """Drop an entry from the cache"""
+        key = (int(parent_inode_id), name)
+        with self._lock:
+            self._invalidation_log.invalidate(key)
+            if self._entry_map.pop(key, None) is not None:
+                self._remove_name(key)
+
+    def invalidate_directory(self, parent_inode_id):
+        """Drop all the entries of a directory from the cache"""
+        parent_inode_id = int(parent_inode_id)
+        with self._lock:
+            self._invalidation_log.invalidate(parent_inode_id)
+            for name in self._directory_map.pop(parent_inode_id, ()):
+                self._entry_map.pop((parent_inode_id, name), None)
+
+    def clear(self):
+        """Drop all entries from the cache"""
+        with self._lock:
+            self._invalidation_log.clear()
+            self._entry_map.clear()
+            self._directory_map.clear()
@@ -0,0 +1,70 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function, absolute_import
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+class InodeCountTable(object):
+    """Lookup and open counts of the inodes referenced by the kernel through one mount.
+    The counts belong to the FUSE session so they are kept in memory and never stored
+    with the inode, which other mounts share"""
+
+    def __init__(self):
+        # inode id to [lookup count, open count]. Inodes without references are dropped
+        self._count_map = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._count_map)
+
+    def _update(self, inode_id, lookup_delta, open_delta):
+        """Change the counts of an inode. Return True if the inode is no longer referenced"""
+        with self._lock:
+            counts = self._count_map.get(inode_id)
+            if counts is None:
+                counts = self._count_map[inode_id] = [0, 0]
+            counts[0] = max(counts[0] + lookup_delta, 0)
+            counts[1] = max(counts[1] + open_delta, 0)
+            if counts[0] == 0 and counts[1] == 0:
+                del self._count_map[inode_id]
+                return True
+            return False
+
+    def incr_lookup(self, inode_id, value=1):
+        """The kernel got an entry for the inode"""
+        self._update(inode_id, value, 0)
+
+    def forget(self, inode_id, value):
+        """The kernel dropped entries of the inode. Return True if the inode is no longer referenced"""
+        return self._update(inode_id, -value, 0)
+
+    def incr_open(self, inode_id):
+        """The inode was opened"""
+        self._update(inode_id, 0, 1)
+
+    def decr_open(self, inode_id):
+        """A handle of the inode was released. Return True if the inode is no longer referenced"""
+        return self._update(inode_id, 0, -1)
+
+    def is_open(self, inode_id):
+        """Check if the inode has an open handle"""
+        counts = self._count_map.get(inode_id)
+        return counts is not None and counts[1] > 0
+
+    def is_referenced(self, inode_id):
+        """Check if the kernel holds an entry or a handle of the inode"""
+        return inode_id in self._count_map
@@ -0,0 +1,111 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function, absolute_import
+import functools
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+class InodeSession(object):
+    """Collects the inode changes made during a single FUSE operation and
+    publishes them to the meta store in one pipelined write"""
+
+    _local = threading.local()
+
+    def __init__(self, meta_store):
+        self._meta_store = meta_store
+        # inodes attached to this session by inode id
+        self._inodes = {}
+        # inode ids which have been modified
+        self._dirty_set = set()
+
+    @staticmethod
+    def current():
+        """Return the session bound to the calling thread, if any"""
+        return getattr(InodeSession._local, 'session', None)
+
+    def __enter__(self):
+        InodeSession._local.session = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            # only publish the changes if the operation succeeded
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.close()
+            InodeSession._local.session = None
+
+    def get_inode(self, inode_id):
+        """Get an inode. Returns the same object for every call within the session"""
+        inode = self._inodes.get(inode_id)
+        if inode is None:
+            inode = self._meta_store.get_inode(inode_id)
+            if inode is not None:
+                self.attach(inode)
+        return inode
+
+    def attach(self, inode):
+        """Attach an inode to the session so that its setters are collected"""
+        inode._session = self
+        self._inodes[inode.id] = inode
+
+    def mark_dirty(self, inode):
+        """Called by the inode setters"""
+        logger.debug("Mark inode:{} dirty".format(inode.id))
+        self._dirty_set.add(inode.id)
+
+    def mark_clean(self, inode_id):
+        """Called when the inode has been written outside of the commit"""
+        self._dirty_set.discard(inode_id)
+
+    def is_dirty(self, inode_id):
+        return inode_id in self._dirty_set
+
+    def discard(self, inode_id):
+        """Drop an inode from the session. Used when the inode is deleted"""
+        inode = self._inodes.pop(inode_id, None)
+        if inode is not None:
+            inode._session = None
+        self._dirty_set.discard(inode_id)
+
+    def commit(self):
+        """Publish all the dirty inodes in one write"""
+        if not self._dirty_set:
+            return
+        inode_list = [self._inodes[inode_id] for inode_id in self._dirty_set]
+        logger.debug("Commit {} inodes".format(len(inode_list)))
+        self._meta_store.update_inodes(inode_list)
+        self._dirty_set.clear()
+
+    def close(self):
+        """Detach all the inodes from the session"""
+        for inode in self._inodes.values():
+            inode._session = None
+        self._inodes.clear()
+        self._dirty_set.clear()
+
+def inode_session(func):
+    """Run a FUSE operation within an inode session on the operation's meta store.
+    Nested operations share the outermost session."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if InodeSession.current() is not None:
+            return func(self, *args, **kwargs)
+        with InodeSession(self._meta_store):
+            return func(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,240 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function, absolute_import
+import os
+import zlib
+import uuid
+import threading
+import cPickle as pickle
+from cStringIO import StringIO
+from time import time, sleep
+from multiprocessing.pool import ThreadPool
+from objectfs.core.common.objectfsthread import ObjectFSThread
+from objectfs.settings import Settings
+settings = Settings()
+import logging
+logger = logging.getLogger(__name__)
+
+# segment objects are named journal%<first record time>%<last record time>%<mount id>%<segment number>
+JOURNAL_PREFIX = 'journal'
+DELIMITER = '%'
+# every change sets the state of a key after the mutation, so replaying a change twice is harmless
+# (CHANGE_INODE, inode id, encoded inode)
+CHANGE_INODE = 'i'
+# (CHANGE_DELETE, inode id) deletes the inode and its directory
+CHANGE_DELETE = 'd'
+# (CHANGE_ENTRY, parent inode id, name, inode id) sets the entry, an inode id of None removes it
+CHANGE_ENTRY = 'e'
+# favour speed, segments are written on the critical path in sync mode
+COMPRESSION_LEVEL = 1
+# records applied to the meta store together during a replay
+REPLAY_BATCH_SIZE = 1000
+# seconds before an upload of a failed segment is retried
+RETRY_INTERVAL = 1
+
+class MetaJournal(object):
+    """Write-ahead log of the metadata changes of a mount. Changes are buffered in the process and
+       group committed as segment objects in the container of the file-system"""
+
+    __journals = {}
+    __lock = threading.Lock()
+
+    def __init__(self, fs_name, object_store, sync=settings.FS_JOURNAL_SYNC, commit_interval=settings.FS_JOURNAL_COMMIT_INTERVAL, segment_size=settings.FS_JOURNAL_SEGMENT_SIZE):
+        self._fs_name = fs_name
+        self._object_store = object_store
+        self._sync = sync
+        self._commit_interval = commit_interval
+        self._segment_size = segment_size
+        # segments of different mounts never share a name
+        self._mount_id = uuid.uuid4().hex[:12]
+        self._segment_number = 0
+        self._condition = threading.Condition()
+        # encoded records waiting for the next segment and their size in bytes
+        self._record_list = []
+        self._buffer_size = 0
+        # number of records appended and the number stored in committed segments
+        self._appended = 0
+        self._committed = 0
+        # number of records appended before the last failed upload, their sync appends fail
+        self._failed = 0
+        # one segment is uploaded at a time to keep the segments of a mount in order
+        self._commit_lock = threading.Lock()
+        self._running = True
+        # journal is only valid in the process which enabled it and not in forked workers
+        self._pid = os.getpid()
+
+    @staticmethod
+    def enable(fs_name, object_store, sync=settings.FS_JOURNAL_SYNC):
+        """Enable the journal for the file-system in this process"""
+        with MetaJournal.__lock:
+            journal = MetaJournal(fs_name, object_store, sync)
+            MetaJournal.__journals[fs_name] = journal
+        logger.info("Enable {} metadata journal for file-system {}".format('sync' if sync else 'time bounded', fs_name))
+        commit_thread = ObjectFSThread(target=journal._run_commit, name='MetaJournal')
+        commit_thread.daemon = True
+        commit_thread.start()
+        return journal
+
+    @staticmethod
+    def disable(fs_name):
+        """Disable the journal for the file-system and commit the buffered records"""
+        with MetaJournal.__lock:
+            journal = MetaJournal.__journals.pop(fs_name, None)
+        if journal is not None and journal._pid == os.getpid():
+            journal.stop()
+
+    @staticmethod
+    def load(fs_name):
+        """Return the journal for the file-system if enabled in this process"""
+        journal = MetaJournal.__journals.get(fs_name)
+        if journal is not None and journal._pid == os.getpid():
+            return journal
+        return None
+
+    @staticmethod
+    def encode_segment(record_list):
+        """Join and compress the encoded records of a segment"""
+        return zlib.compress(''.join(record_list), COMPRESSION_LEVEL)
+
+    @staticmethod
+    def decode_segment(segment):
+        """Return the time and change list of every record in a segment"""
+        data = zlib.decompress(segment)
+        stream = StringIO(data)
+        record_list = []
+        while stream.tell() < len(data):
+            record_list.append(pickle.load(stream))
+        return record_list
+
+    @staticmethod
+    def _encode_record(record):
+        """Pickle a record of a segment"""
+        return pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+
+    def append(self, change_list):
+        """Log the changes of one mutation. In sync mode wait until they are stored in the container, an
+           IOError is raised if their upload fails. The records stay buffered and are retried"""
+        record = MetaJournal._encode_record((int(time() * 1000), change_list))
+        with self._condition:
+            self._record_list.append(record)
+            self._buffer_size += len(record)
+            self._appended += 1
+            sequence = self._appended
+            # wake the commit thread for the first record of a segment, a full segment or a sync append
+            if self._sync or len(self._record_list) == 1 or self._buffer_size >= self._segment_size:
+                self._condition.notify_all()
+            if self._sync:
+                # every record appended while a segment is uploaded goes in the next one
+                while self._committed < sequence:
+                    if self._failed >= sequence:
+                        raise IOError("Failed to commit journal record {} for file-system {}".format(sequence, self._fs_name))
+                    self._condition.wait()
+
+    def commit(self):
+        """Upload the buffered records as one segment. Records of a failed upload stay buffered"""
+        with self._commit_lock:
+            with self._condition:
+                (record_list, self._record_list) = (self._record_list, [])
+                self._buffer_size = 0
+                sequence = self._appended
+            if not record_list:
+                return
+            try:
+                first_time = pickle.loads(record_list[0])[0]
+                last_time = pickle.loads(record_list[-1])[0]
+                object_name = DELIMITER.join([JOURNAL_PREFIX, str(first_time), str(last_time), self._mount_id, str(self._segment_number)])
+                self._object_store.put_object(object_name, MetaJournal.encode_segment(record_list))
+                self._segment_number += 1
+            except Exception as e:
+                logger.error("Failed to commit {} journal records for file-system {}".format(len(record_list), self._fs_name), exc_info=True)
+                with self._condition:
+                    self._record_list[:0] = record_list
+                    self._buffer_size += sum(len(record) for record in record_list)
+                    # sync appends waiting on these records fail rather than wait for the object store
+                    self._failed = sequence
+                    self._condition.notify_all()
+                raise e
+            with self._condition:
+                self._committed = sequence
+                self._condition.notify_all()
+
+    def stop(self):
+        """Stop the commit thread and commit the buffered records"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self.commit()
+
+    def _run_commit(self):
+        """Commit a segment a commit interval after its first record, or as soon as it is full or a sync append waits"""
+        while self._running:
+            with self._condition:
+                while self._running and not self._record_list:
+                    self._condition.wait()
+                if self._running and not self._sync and self._buffer_size < self._segment_size:
+                    self._condition.wait(self._commit_interval)
+            try:
+                self.commit()
+            except Exception as e:
+                sleep(RETRY_INTERVAL)
+
+    @staticmethod
+    def parse_segment_name(object_name):
+        """Return the first and last record time, mount id and segment number of a segment"""
+        (prefix, first_time, last_time, mount_id, segment_number) = object_name.split(DELIMITER)
+        return (int(first_time), int(last_time), mount_id, int(segment_number))
+
+    @staticmethod
+    def list_segments(object_store, since=0):
+        """Return the names of the segments with records from since onwards"""
+        return [object_name for object_name in object_store.list_objects(JOURNAL_PREFIX + DELIMITER)
+                if MetaJournal.parse_segment_name(object_name)[1] >= since]
+
+    @staticmethod
+    def replay(meta_store, object_store, since=0, num_threads=settings.META_CHECKPOINT_NUM_THREADS):
+        """Apply the records logged from since onwards, usually the id of the checkpoint loaded before,
+           in time order. Segments are downloaded in parallel
+           Return the number of records replayed"""
+        segment_list = MetaJournal.list_segments(object_store, since)
+        pool = ThreadPool(num_threads)
+        try:
+            data_list = pool.map(object_store.get_object, segment_list)
+        except Exception as e:
+            logger.error("Failed to download the journal segments", exc_info=True)
+            raise e
+        finally:
+            pool.terminate()
+        record_list = []
+        for (object_name, data) in zip(segment_list, data_list):
+            (first_time, last_time, mount_id, segment_number) = MetaJournal.parse_segment_name(object_name)
+            for (index, (record_time, change_list)) in enumerate(MetaJournal.decode_segment(data)):
+                if record_time >= since:
+                    record_list.append(((record_time, mount_id, segment_number, index), change_list))
+        record_list.sort()
+        for offset in range(0, len(record_list), REPLAY_BATCH_SIZE):
+            meta_store.apply_changes([change for (order, change_list) in record_list[offset:offset+REPLAY_BATCH_SIZE] for change in change_list])
+        logger.info("Replayed {} journal records from {} segments".format(len(record_list), len(segment_list)))
+        return len(record_list)
+
+    @staticmethod
+    def prune(object_store, before):
+        """Delete the segments with all their records before a checkpoint
+           Return the number of segments deleted"""
+        segment_list = [object_name for object_name in object_store.list_objects(JOURNAL_PREFIX + DELIMITER)
+                        if MetaJournal.parse_segment_name(object_name)[1] < before]
+        for object_name in segment_list:
+            object_store.delete_object(object_name)
+        return len(segment_list)
@@ -14,11 +14,23 @@
 # limitations under the License.
 
 from __future__ import print_function, absolute_import
+import os
+import errno
+import zlib
+import sqlite3
+import threading
 from abc import abstractmethod
+from contextlib import contextmanager
+from itertools import chain, islice
+from time import sleep
+import stat
 import redis
 import llfuse
 from objectfs.core.common.redispool import RedisPool
+from objectfs.core.common.objectfsthread import ObjectFSThread
 from objectfs.core.metadata.inode import Inode
+from objectfs.core.metadata.inodecache import InodeCache, DentryCache
+from objectfs.core.metadata.journal import MetaJournal, CHANGE_INODE, CHANGE_DELETE, CHANGE_ENTRY
 from objectfs.settings import Settings
 settings = Settings()
 import logging
@@ -27,6 +39,207 @@ logger = logging.getLogger(__name__)
 FS_DELIMITER = '%'
 NAME_DELIMITER = '#'
 LIST_DELMITER = '&'
+# readdir offsets pack the bucket, the hscan cursor and the position in the batch returned for it
+DIR_OFFSET_SHIFT = 20
+DIR_CURSOR_BITS = 32
+DIR_SCAN_COUNT = 1000
+# keys unlinked together when a file-system is deleted
+DELETE_BATCH_SIZE = 1000
+# a directory hash takes new names until it holds the split size, then it gets the split field
+# and new names go to bucket hashes picked by a hash of the name. The buckets spread a large
+# directory over keys and shards. A name is in the directory hash or in its bucket, never both.
+# Names never contain '/' so the field cannot clash with an entry
+DIR_SPLIT_FIELD = '/split'
+# returned by the atomic scripts for split directories. The mutation then runs as ordered steps
+SPLIT_RESPONSE = 'ESPLIT'
+
+# namespace mutations run as Lua scripts so that each one is a single atomic round trip.
+# The scripts return 0 or the name of the errno for the failure
+ADD_NAME_FUNCTION_LUA = """
+local function add_name(dir_key, name, inode_id, split_size)
+    redis.call('HSET', dir_key, name, inode_id)
+    if tonumber(split_size) > 0 and redis.call('HLEN', dir_key) >= tonumber(split_size) then
+        redis.call('HSET', dir_key, '/split', 1)
+    end
+end
+"""
+UNLINK_INODE_LUA = """
+local function unlink_inode(inode_key, dir_key, inode_string, delete_inode, size, counter_key, used_size_key)
+    if delete_inode == '1' then
+        redis.call('DEL', inode_key, dir_key)
+        redis.call('DECR', counter_key)
+        redis.call('DECRBY', used_size_key, size)
+    else
+        redis.call('SET', inode_key, inode_string)
+    end
+end
+"""
+# KEYS: parent directory, inode, directory of the inode
+# ARGV: name, inode id, encoded inode, parent inode id, is directory, split size
+CREATE_INODE_LUA = ADD_NAME_FUNCTION_LUA + """
+if redis.call('HEXISTS', KEYS[1], '/split') == 1 then
+    return 'ESPLIT'
+end
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return 'EEXIST'
+end
+redis.call('SET', KEYS[2], ARGV[3])
+add_name(KEYS[1], ARGV[1], ARGV[2], ARGV[6])
+if ARGV[5] == '1' then
+    redis.call('HMSET', KEYS[3], '.', ARGV[2], '..', ARGV[4])
+end
+return 0
+"""
+# KEYS: inode counter, max inodes, free inode id, free inode ranges
+# ARGV: lease size
+# the leased ids are counted as used inodes until they are returned
+LEASE_INODE_IDS_LUA = """
+local lease_size = math.min(tonumber(ARGV[1]), tonumber(redis.call('GET', KEYS[2]) or 0) - tonumber(redis.call('GET', KEYS[1]) or 0))
+if lease_size <= 0 then
+    return 'ENOSPC'
+end
+local start_id
+local end_id
+local free_range = redis.call('LPOP', KEYS[4])
+if free_range then
+    local delimiter = string.find(free_range, '-', 1, true)
+    local range_end_id = tonumber(string.sub(free_range, delimiter+1))
+    start_id = tonumber(string.sub(free_range, 1, delimiter-1))
+    end_id = math.min(range_end_id, start_id+lease_size-1)
+    if end_id < range_end_id then
+        redis.call('LPUSH', KEYS[4], (end_id+1) .. '-' .. range_end_id)
+    end
+else
+    end_id = redis.call('INCRBY', KEYS[3], lease_size)
+    start_id = end_id-lease_size+1
+end
+redis.call('INCRBY', KEYS[1], end_id-start_id+1)
+return {start_id, end_id}
+"""
+# KEYS: parent directory, inode, directory of the inode, inode counter, used size
+# ARGV: name, inode id, encoded inode, delete inode, size
+REMOVE_ENTRY_LUA = UNLINK_INODE_LUA + """
+if redis.call('HEXISTS', KEYS[1], '/split') == 1 or redis.call('HEXISTS', KEYS[3], '/split') == 1 then
+    return 'ESPLIT'
+end
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 'ENOENT'
+end
+if redis.call('HLEN', KEYS[3]) > 2 then
+    return 'ENOTEMPTY'
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+unlink_inode(KEYS[2], KEYS[3], ARGV[3], ARGV[4], ARGV[5], KEYS[4], KEYS[5])
+return 0
+"""
+# KEYS: new parent directory, inode
+# ARGV: new name, inode id, encoded inode, split size
+LINK_ENTRY_LUA = ADD_NAME_FUNCTION_LUA + """
+if redis.call('HEXISTS', KEYS[1], '/split') == 1 then
+    return 'ESPLIT'
+end
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return 'EEXIST'
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return 'ENOENT'
+end
+add_name(KEYS[1], ARGV[1], ARGV[2], ARGV[4])
+redis.call('SET', KEYS[2], ARGV[3])
+return 0
+"""
+# KEYS: old parent directory, new parent directory, inode, directory of the inode and when
+#       replacing an entry: replaced inode, directory of the replaced inode, inode counter, used size
+# ARGV: old name, new name, inode id, encoded inode, new parent inode id, split size and when replacing
+#       an entry: replaced inode id, encoded replaced inode, delete replaced inode, size of the replaced inode
+RENAME_ENTRY_LUA = ADD_NAME_FUNCTION_LUA + UNLINK_INODE_LUA + """
+if redis.call('HEXISTS', KEYS[1], '/split') == 1 or redis.call('HEXISTS', KEYS[2], '/split') == 1 or
+   (#KEYS == 8 and redis.call('HEXISTS', KEYS[6], '/split') == 1) then
+    return 'ESPLIT'
+end
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[3] then
+    return 'ENOENT'
+end
+local replaced_inode_id = redis.call('HGET', KEYS[2], ARGV[2])
+if #KEYS == 4 then
+    if replaced_inode_id then
+        return 'EEXIST'
+    end
+else
+    if replaced_inode_id ~= ARGV[7] then
+        return 'ENOENT'
+    end
+    if redis.call('HLEN', KEYS[6]) > 2 then
+        return 'ENOTEMPTY'
+    end
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+add_name(KEYS[2], ARGV[2], ARGV[3], ARGV[6])
+redis.call('SET', KEYS[3], ARGV[4])
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    redis.call('HSET', KEYS[4], '..', ARGV[5])
+end
+if #KEYS == 8 then
+    unlink_inode(KEYS[5], KEYS[6], ARGV[8], ARGV[9], ARGV[10], KEYS[7], KEYS[8])
+end
+return 0
+"""
+
+# a mutation spanning servers or split directories cannot run as one script. It runs
+# these single key steps instead, ordered so that a failure leaves at most an
+# unreachable inode behind and never an entry without its inode. On a split
+# directory they return ESPLIT if the name is not in the directory hash and the
+# step is repeated on the bucket of the name
+# KEYS: directory
+# ARGV: name, inode id, split size
+ADD_NAME_LUA = ADD_NAME_FUNCTION_LUA + """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return 'EEXIST'
+end
+if redis.call('HEXISTS', KEYS[1], '/split') == 1 then
+    return 'ESPLIT'
+end
+add_name(KEYS[1], ARGV[1], ARGV[2], ARGV[3])
+return 0
+"""
+# KEYS: directory
+# ARGV: name, inode id
+REMOVE_NAME_LUA = """
+local entry = redis.call('HGET', KEYS[1], ARGV[1])
+if not entry and redis.call('HEXISTS', KEYS[1], '/split') == 1 then
+    return 'ESPLIT'
+end
+if entry ~= ARGV[2] then
+    return 'ENOENT'
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return 0
+"""
+# KEYS: directory
+# ARGV: name, inode id of the entry, new inode id
+REPLACE_NAME_LUA = """
+local entry = redis.call('HGET', KEYS[1], ARGV[1])
+if not entry and redis.call('HEXISTS', KEYS[1], '/split') == 1 then
+    return 'ESPLIT'
+end
+if entry ~= ARGV[2] then
+    return 'ENOENT'
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+return 0
+"""
+
+# tables of the Sqlite meta store. The superblock keys are stored as the superblock names them
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inodes (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (position INTEGER PRIMARY KEY AUTOINCREMENT, parent_id INTEGER NOT NULL, name TEXT NOT NULL, id INTEGER NOT NULL,
+                                    UNIQUE (parent_id, name));
+CREATE INDEX IF NOT EXISTS entries_parent_id ON entries (parent_id);
+CREATE TABLE IF NOT EXISTS superblock (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS free_inode_ranges (start_id INTEGER NOT NULL, end_id INTEGER NOT NULL);
+"""
+# bound on the parameters of one statement in older SQLite builds
+SQLITE_MAX_VARIABLES = 900
 
 class MetaStore(object):
     
@@ -42,17 +255,60 @@ class MetaStore(object):
             # logger.error("Meta store in {} is not supported".format(memory_store))
             # raise e
 
+    def _invalidate_entry(self, parent_inode_id, file_name):
+        """Drop a directory entry from the dentry cache of this process"""
+        dentry_cache = DentryCache.load(self._fs_name)
+        if dentry_cache is not None:
+            dentry_cache.invalidate(parent_inode_id, file_name)
+
+    def _invalidate_directory(self, inode_id):
+        """Drop the entries of a directory from the dentry cache of this process"""
+        dentry_cache = DentryCache.load(self._fs_name)
+        if dentry_cache is not None:
+            dentry_cache.invalidate_directory(inode_id)
+
     @abstractmethod
     def get_inode(self, inode_id):
         """Get an inode using an inode id
            Return inode"""
         return NotImplemented
 
+    @abstractmethod
+    def get_inodes(self, inode_id_list):
+        """Get a batch of inodes using their inode ids
+           Return list of inodes"""
+        return NotImplemented
+
     @abstractmethod
     def put_inode(self, inode):
         """Put an inode"""
         return NotImplemented
     
+    @abstractmethod
+    def update_inodes(self, inode_list):
+        """Update a batch of inodes in one write"""
+        return NotImplemented
+
+    @abstractmethod
+    def create_inode(self, inode):
+        """Create a new inode along with its directory entries"""
+        return NotImplemented
+
+    @abstractmethod
+    def remove_entry(self, parent_inode_id, file_name, inode, delete_inode=False):
+        """Remove a directory entry and update or delete its inode"""
+        return NotImplemented
+
+    @abstractmethod
+    def link_entry(self, new_parent_inode_id, new_name, inode):
+        """Add a directory entry for an existing inode and update the inode"""
+        return NotImplemented
+
+    @abstractmethod
+    def rename_entry(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode, replaced_inode=None, delete_replaced_inode=False):
+        """Move a directory entry, replacing the entry at the new name if an inode is given for it"""
+        return NotImplemented
+
     @abstractmethod
     def build_index(self, parent_inode_id, inode_id, file_name):
         """Build an index from file_name to inode_id"""
@@ -68,27 +324,128 @@ class MetaStore(object):
         """Delete an inode based on inode id"""
         return NotImplemented
 
+    @abstractmethod
+    def delete_inodes(self, inode_id_list):
+        """Delete a batch of unlinked inodes along with their directories"""
+        return NotImplemented
+
+    @abstractmethod
+    def scan_metadata_keys(self, batch_size=1000):
+        """Scan the inode, directory and superblock keys of the file-system"""
+        return NotImplemented
+
+    @abstractmethod
+    def dump_keys(self, key_list):
+        """Serialize keys for a checkpoint"""
+        return NotImplemented
+
+    @abstractmethod
+    def restore_keys(self, record_list):
+        """Load keys serialized for a checkpoint"""
+        return NotImplemented
+
+    @abstractmethod
+    def apply_changes(self, change_list):
+        """Apply changes replayed from the metadata journal"""
+        return NotImplemented
+
+    @abstractmethod
+    def rebuild_superblock_counters(self, batch_size=1000):
+        """Recount the superblock counters from the inodes"""
+        return NotImplemented
+
 class RedisMetaStore(MetaStore):
 
+    # ids of the directories known to be split, per file-system
+    __split_directory_map = {}
+
     def __init__(self, fs_name):
         try:
             # logger.debug("Init file-system {}".format(fs_name))
             # super(RedisMetaStore, self).__init__()
             self._fs_name = fs_name
+            self._config = settings.config
+            self._dir_split_size = self._config.META_DIR_SPLIT_SIZE
+            self._dir_buckets = self._config.META_DIR_BUCKETS
             # self._client = redis.StrictRedis(connection_pool=RedisPool.blocking_pool)
-            self._client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
+            self._client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
             self._pipe = self._client.pipeline(transaction=False)
+            self._register_scripts()
         except redis.ConnectionError as e:
             logger.error("Cannot connect to Redis server", exc_info=True)
             raise e
+
+    def _register_scripts(self):
+        """Register the namespace scripts with the server holding the superblock"""
+        self._create_inode_script = self._client.register_script(CREATE_INODE_LUA)
+        self._lease_inode_ids_script = self._client.register_script(LEASE_INODE_IDS_LUA)
+        self._remove_entry_script = self._client.register_script(REMOVE_ENTRY_LUA)
+        self._link_entry_script = self._client.register_script(LINK_ENTRY_LUA)
+        self._rename_entry_script = self._client.register_script(RENAME_ENTRY_LUA)
+        self._add_name_script = self._client.register_script(ADD_NAME_LUA)
+        self._remove_name_script = self._client.register_script(REMOVE_NAME_LUA)
+        self._replace_name_script = self._client.register_script(REPLACE_NAME_LUA)
+
+    def _run_script(self, script, keys, args, client):
+        """Run a namespace script. With the inode cache enabled it runs between the change markers of
+           this mount in one transaction, so that the invalidation listener skips the changes which the
+           caller invalidates itself
+           Return the response of the script"""
+        inode_cache = InodeCache.load(self._fs_name)
+        if inode_cache is None:
+            return script(keys=keys, args=args, client=client)
+        pipe = client.pipeline(transaction=True)
+        pipe.publish(inode_cache.change_channel, inode_cache.begin_marker)
+        script(keys=keys, args=args, client=pipe)
+        pipe.publish(inode_cache.change_channel, inode_cache.end_marker)
+        return pipe.execute()[1]
+
+    def _get_client(self, inode_id):
+        """Client for the server holding the inode and its directory entries"""
+        return self._client
+
+    def _get_list_client(self, inode_id, bucket=0):
+        """Client for the server holding the directory hash or a bucket of a directory"""
+        return self._get_client(inode_id)
+
+    def _get_client_list(self):
+        """Clients for all the servers holding the file-system"""
+        return [self._client]
+
+    def _on_one_shard(self, inode_id_list, with_superblock=False):
+        """Check if the keys of the inodes, and the superblock if needed, are on one server"""
+        return True
+
+    def _get_pipeline(self, pipe_map, inode_id, bucket=0):
+        """Transaction for the server holding the inode or a bucket of its directory, shared by
+           all the keys of one write on that server"""
+        client = self._get_list_client(inode_id, bucket)
+        if id(client) not in pipe_map:
+            pipe_map[id(client)] = client.pipeline(transaction=True)
+        return pipe_map[id(client)]
+
+    def _execute_pipelines(self, pipe_map):
+        """Execute the transactions of one write"""
+        return [response for pipe in pipe_map.values() for response in pipe.execute()]
     
-    def _clean_store(self):
-        """Clean store"""
+    def _clean_store(self, batch_size=DELETE_BATCH_SIZE):
+        """Clean store. The keys are streamed with SCAN and removed with pipelined UNLINK in batches,
+           so the servers keep serving other file-systems and free the memory in the background
+           Return the number of keys deleted"""
         try:
-            file_system_keys = self._client.keys('{}{}*'.format(self._fs_name, FS_DELIMITER))
             logger.debug("Delete all keys for file-system {}".format(self._fs_name))
-            response = self._client.delete(*file_system_keys)
-            # response = self._client.flushdb()
+            deleted = 0
+            for client in self._get_client_list():
+                key_iter = client.scan_iter(match='{}{}*'.format(self._fs_name, FS_DELIMITER), count=batch_size)
+                while True:
+                    key_list = list(islice(key_iter, batch_size))
+                    if not key_list:
+                        break
+                    # the batch is unlinked before the scan goes on, which SCAN allows
+                    deleted += client.unlink(*key_list)
+            RedisMetaStore.__split_directory_map.pop(self._fs_name, None)
+            logger.info("Deleted {} keys for file-system {}".format(deleted, self._fs_name))
+            return deleted
         except Exception as e:
             logger.error("Failed to delete all keys for file-system {}".format(self._fs_name), exc_info=True)
             raise e
@@ -142,6 +499,22 @@ class RedisMetaStore(MetaStore):
             logger.debug("Failed to decrement superblock key:{} by value:{}".format(key, value), exc_info=True)
             raise e
     
+    def update_superblock_keys(self, incr_map, key_list):
+        """Increment superblock keys and get the values of superblock keys in one round trip
+           Return list of values"""
+        try:
+            logger.debug("Increment superblock keys:{} and get keys:{}".format(incr_map, key_list))
+            pipe = self._client.pipeline(transaction=True)
+            for (key, value) in incr_map.items():
+                if value:
+                    pipe.incrby(key, value)
+            pipe.mget(key_list)
+            response = pipe.execute()[-1]
+            return [int(value) if value else None for value in response]
+        except Exception as e:
+            logger.error("Failed to increment superblock keys:{} and get keys:{}".format(incr_map, key_list), exc_info=True)
+            raise e
+
     def delete_superblock_key(self, keys):
         """Delete the superblock keys"""
         try:
@@ -166,50 +539,675 @@ class RedisMetaStore(MetaStore):
         """Prepend the key with file-system name"""
         return '{}{}{}'.format(self._fs_name, FS_DELIMITER, key)
 
+    def _wrap_superblock_key(self, superblock_key):
+        """Superblock key for the file-system, as used by the superblock"""
+        return '{}{}{}{}{}'.format(FS_DELIMITER, self._fs_name, FS_DELIMITER, superblock_key, FS_DELIMITER)
+
+    def _check_script_response(self, response):
+        """Raise the errno returned by a namespace script"""
+        if response:
+            raise llfuse.FUSEError(getattr(errno, response))
+
+    def _add_entries(self, pipe_map, inode):
+        """Queue the directory entries for a new inode. Its name in the parent directory
+           and, for directories, the . and .. entries"""
+        # the root inode has no name
+        if inode.name is not None:
+            self._set_name(pipe_map, inode.parent_inode_id, inode.name, inode.id)
+        if stat.S_ISDIR(inode.mode):
+            pipe = self._get_pipeline(pipe_map, inode.id)
+            pipe.hset(self._inode_list_key(inode.id), '.', inode.id)
+            pipe.hset(self._inode_list_key(inode.id), '..', inode.parent_inode_id)
+
+    def _set_name(self, pipe_map, inode_id, file_name, new_id):
+        """Queue an entry which replaces the name wherever it is in the directory"""
+        bucket = self._get_bucket(file_name)
+        (set_bucket, del_bucket) = (bucket, 0) if self._is_split_hint(inode_id) else (0, bucket)
+        self._get_pipeline(pipe_map, inode_id, set_bucket).hset(self._inode_list_key(inode_id, set_bucket), file_name, new_id)
+        self._get_pipeline(pipe_map, inode_id, del_bucket).hdel(self._inode_list_key(inode_id, del_bucket), file_name)
+
+    def _del_name(self, pipe_map, inode_id, file_name):
+        """Queue the removal of a name wherever it is in the directory"""
+        bucket = self._get_bucket(file_name)
+        self._get_pipeline(pipe_map, inode_id).hdel(self._inode_list_key(inode_id), file_name)
+        self._get_pipeline(pipe_map, inode_id, bucket).hdel(self._inode_list_key(inode_id, bucket), file_name)
+
+    def _get_bucket(self, file_name):
+        """Bucket of a name once its directory is split, from 1 to the number of buckets"""
+        if isinstance(file_name, unicode):
+            file_name = file_name.encode('utf-8')
+        return (zlib.crc32(file_name) & 0xffffffff) % self._dir_buckets + 1
+
+    def _is_split_hint(self, inode_id):
+        """Check if the directory is known to be split in this process"""
+        return int(inode_id) in RedisMetaStore.__split_directory_map.get(self._fs_name, ())
+
+    def _set_split_hint(self, inode_id, split):
+        """Remember if the directory is split. A directory stays split until it is deleted"""
+        split_set = RedisMetaStore.__split_directory_map.setdefault(self._fs_name, set())
+        if split:
+            split_set.add(int(inode_id))
+        else:
+            split_set.discard(int(inode_id))
+
+    def _is_split(self, inode_id):
+        """Check if the directory is split"""
+        if self._is_split_hint(inode_id):
+            return True
+        split = self._get_list_client(inode_id).hexists(self._inode_list_key(inode_id), DIR_SPLIT_FIELD)
+        if split:
+            self._set_split_hint(inode_id, True)
+        return split
+
+    def _get_inode_id_string(self, parent_inode_id, file_name):
+        """Get the inode id of an entry as stored, looking in the bucket of the name if the directory is split"""
+        bucket = self._get_bucket(file_name)
+        if self._is_split_hint(parent_inode_id):
+            response = self._get_list_client(parent_inode_id, bucket).hget(self._inode_list_key(parent_inode_id, bucket), file_name)
+            if response is None:
+                response = self._get_list_client(parent_inode_id).hget(self._inode_list_key(parent_inode_id), file_name)
+            return response
+        (response, split) = self._get_list_client(parent_inode_id).hmget(self._inode_list_key(parent_inode_id), [file_name, DIR_SPLIT_FIELD])
+        if response is None and split is not None:
+            self._set_split_hint(parent_inode_id, True)
+            response = self._get_list_client(parent_inode_id, bucket).hget(self._inode_list_key(parent_inode_id, bucket), file_name)
+        return response
+
+    def _is_empty(self, inode):
+        """Check if a directory has no entries besides . and .."""
+        pipe = self._get_list_client(inode.id).pipeline(transaction=False)
+        pipe.hlen(self._inode_list_key(inode.id))
+        pipe.hexists(self._inode_list_key(inode.id), DIR_SPLIT_FIELD)
+        (length, split) = pipe.execute()
+        if length - int(split) > 2:
+            return False
+        return not split or self._length_buckets(inode.id) == 0
+
+    def _length_buckets(self, inode_id):
+        """Number of entries in the buckets of a split directory"""
+        pipe_map = {}
+        for bucket in range(1, self._dir_buckets+1):
+            self._get_pipeline(pipe_map, inode_id, bucket).hlen(self._inode_list_key(inode_id, bucket))
+        return sum(self._execute_pipelines(pipe_map))
+
+    def _add_name(self, inode_id, file_name, new_id):
+        """Add an entry to a directory. Fails with EEXIST if the name is taken
+           Return 0 or the name of the errno"""
+        response = self._run_script(self._add_name_script, keys=[self._inode_list_key(inode_id)], args=[file_name, new_id, self._dir_split_size],
+                                    client=self._get_list_client(inode_id))
+        if response == SPLIT_RESPONSE:
+            self._set_split_hint(inode_id, True)
+            bucket = self._get_bucket(file_name)
+            response = 0 if self._get_list_client(inode_id, bucket).hsetnx(self._inode_list_key(inode_id, bucket), file_name, new_id) else 'EEXIST'
+        return response
+
+    def _remove_name(self, inode_id, file_name, existing_id):
+        """Remove the entry of a directory if it names the inode. Fails with ENOENT otherwise
+           Return 0 or the name of the errno"""
+        response = self._run_script(self._remove_name_script, keys=[self._inode_list_key(inode_id)], args=[file_name, existing_id],
+                                    client=self._get_list_client(inode_id))
+        if response == SPLIT_RESPONSE:
+            bucket = self._get_bucket(file_name)
+            response = self._run_script(self._remove_name_script, keys=[self._inode_list_key(inode_id, bucket)], args=[file_name, existing_id],
+                                        client=self._get_list_client(inode_id, bucket))
+        return response
+
+    def _replace_name(self, inode_id, file_name, existing_id, new_id):
+        """Point the entry of a directory to a new inode if it names the inode. Fails with ENOENT otherwise
+           Return 0 or the name of the errno"""
+        response = self._run_script(self._replace_name_script, keys=[self._inode_list_key(inode_id)], args=[file_name, existing_id, new_id],
+                                    client=self._get_list_client(inode_id))
+        if response == SPLIT_RESPONSE:
+            bucket = self._get_bucket(file_name)
+            response = self._run_script(self._replace_name_script, keys=[self._inode_list_key(inode_id, bucket)], args=[file_name, existing_id, new_id],
+                                        client=self._get_list_client(inode_id, bucket))
+        return response
+
+    def _unlink_inode(self, inode, delete_inode):
+        """Update the inode or delete it along with its directory and count it as free"""
+        if delete_inode:
+            self._get_client(inode.id).delete(self._wrap_fs_delimiter(inode.id), self._inode_list_key(inode.id))
+            self._set_split_hint(inode.id, False)
+            pipe = self._client.pipeline(transaction=True)
+            pipe.decr(self._wrap_superblock_key(self._config.SB_INODE_COUNTER))
+            pipe.decrby(self._wrap_superblock_key(self._config.SB_USED_SIZE), inode.size)
+            pipe.execute()
+        else:
+            self._get_client(inode.id).set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+
+    def _create_inode_steps(self, inode):
+        """Create an inode whose keys are not on one server or whose parent is split. The inode
+           is written before its name is taken
+           Return 0 or the name of the errno"""
+        pipe_map = {}
+        self._get_pipeline(pipe_map, inode.id).set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+        if stat.S_ISDIR(inode.mode):
+            self._get_pipeline(pipe_map, inode.id).hmset(self._inode_list_key(inode.id), {'.': inode.id, '..': inode.parent_inode_id})
+        self._execute_pipelines(pipe_map)
+        response = self._add_name(inode.parent_inode_id, inode.name, inode.id)
+        if response:
+            self._get_client(inode.id).delete(self._wrap_fs_delimiter(inode.id), self._inode_list_key(inode.id))
+        return response
+
+    def _remove_entry_steps(self, parent_inode_id, file_name, inode, delete_inode):
+        """Remove an entry whose keys are not on one server or which involves a split directory
+           Return 0 or the name of the errno"""
+        if not self._is_empty(inode):
+            return 'ENOTEMPTY'
+        response = self._remove_name(parent_inode_id, file_name, inode.id)
+        if not response:
+            self._unlink_inode(inode, delete_inode)
+        return response
+
+    def _link_entry_steps(self, new_parent_inode_id, new_name, inode):
+        """Link an inode whose keys are not on one server or whose new parent is split
+           Return 0 or the name of the errno"""
+        if not self._get_client(inode.id).exists(self._wrap_fs_delimiter(inode.id)):
+            return 'ENOENT'
+        response = self._add_name(new_parent_inode_id, new_name, inode.id)
+        if not response:
+            self._get_client(inode.id).set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+        return response
+
+    def _rename_entry_steps(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode, replaced_inode, delete_replaced_inode):
+        """Move an entry whose keys are not on one server or which involves a split directory. The new
+           name is taken before the old one is dropped
+           Return 0 or the name of the errno"""
+        if self._get_inode_id_string(old_parent_inode_id, old_name) != str(inode.id):
+            return 'ENOENT'
+        if replaced_inode is None:
+            response = self._add_name(new_parent_inode_id, new_name, inode.id)
+        elif not self._is_empty(replaced_inode):
+            response = 'ENOTEMPTY'
+        else:
+            response = self._replace_name(new_parent_inode_id, new_name, replaced_inode.id, inode.id)
+        if response:
+            return response
+        response = self._remove_name(old_parent_inode_id, old_name, inode.id)
+        if response:
+            # the old entry is gone, give the new name back
+            if replaced_inode is None:
+                self._remove_name(new_parent_inode_id, new_name, inode.id)
+            else:
+                self._replace_name(new_parent_inode_id, new_name, inode.id, replaced_inode.id)
+            return response
+        pipe_map = {}
+        self._get_pipeline(pipe_map, inode.id).set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+        if stat.S_ISDIR(inode.mode):
+            self._get_pipeline(pipe_map, inode.id).hset(self._inode_list_key(inode.id), '..', new_parent_inode_id)
+        self._execute_pipelines(pipe_map)
+        if replaced_inode is not None:
+            self._unlink_inode(replaced_inode, delete_replaced_inode)
+        return 0
+
+    def _invalidate_inode(self, inode_id):
+        """Drop the inode from the inode cache of this process"""
+        inode_cache = InodeCache.load(self._fs_name)
+        if inode_cache is not None:
+            inode_cache.invalidate(inode_id)
+
+    def _journal(self, change_list):
+        """Log the changes of a mutation if the journal is enabled in this process"""
+        journal = MetaJournal.load(self._fs_name)
+        if journal is not None:
+            try:
+                journal.append(change_list)
+            except IOError as e:
+                logger.error("Failed to log the changes of file-system {}".format(self._fs_name), exc_info=True)
+                raise llfuse.FUSEError(errno.EIO)
+
+    def _inode_changes(self, inode):
+        """Journal changes for writing an inode"""
+        return [(CHANGE_INODE, inode.id, Inode.to_string(inode))]
+
+    def _entry_changes(self, inode):
+        """Journal changes for the directory entries of a new inode, as added by _add_entries"""
+        change_list = []
+        if inode.name is not None:
+            change_list.append((CHANGE_ENTRY, inode.parent_inode_id, inode.name, inode.id))
+        if stat.S_ISDIR(inode.mode):
+            change_list.extend([(CHANGE_ENTRY, inode.id, '.', inode.id), (CHANGE_ENTRY, inode.id, '..', inode.parent_inode_id)])
+        return change_list
+
+    def _unlink_changes(self, inode, delete_inode):
+        """Journal changes for updating or deleting an unlinked inode"""
+        if delete_inode:
+            return [(CHANGE_DELETE, inode.id)]
+        return self._inode_changes(inode)
+
+    def _rename_changes(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode, replaced_inode, delete_replaced_inode):
+        """Journal changes for moving a directory entry"""
+        change_list = [(CHANGE_ENTRY, old_parent_inode_id, old_name, None), (CHANGE_ENTRY, new_parent_inode_id, new_name, inode.id)]
+        change_list.extend(self._inode_changes(inode))
+        if stat.S_ISDIR(inode.mode):
+            change_list.append((CHANGE_ENTRY, inode.id, '..', new_parent_inode_id))
+        if replaced_inode is not None:
+            change_list.extend(self._unlink_changes(replaced_inode, delete_replaced_inode))
+        return change_list
+
     def get_inode(self, inode_id):
         """Get an inode using an inode id
            Return inode"""
         try:
             logger.debug("Get inode {} for file-system {}".format(inode_id, self._fs_name))
-            data = self._client.get(self._wrap_fs_delimiter(inode_id))
+            inode_cache = InodeCache.load(self._fs_name)
+            if inode_cache is not None:
+                inode = inode_cache.get(inode_id)
+                if inode is not None:
+                    return inode
+                epoch = inode_cache.epoch
+            data = self._get_client(inode_id).get(self._wrap_fs_delimiter(inode_id))
             if data is None:
                 return data
             else:
-                return Inode.from_string(data)
+                inode = Inode.from_string(data, self._fs_name)
+                if inode_cache is not None:
+                    inode_cache.put(inode, epoch)
+                return inode
         except Exception as e:
             logger.error("Falied to get inode {} for file-system {}".format(inode_id, self._fs_name), exc_info=True)
             raise e
 
+    def get_inodes(self, inode_id_list):
+        """Get a batch of inodes in one round trip
+           Return list of inodes with None for the missing inodes"""
+        try:
+            logger.debug("Get inodes {} for file-system {}".format(inode_id_list, self._fs_name))
+            inode_list = [None] * len(inode_id_list)
+            inode_cache = InodeCache.load(self._fs_name)
+            if inode_cache is not None:
+                epoch = inode_cache.epoch
+                for (index, inode_id) in enumerate(inode_id_list):
+                    inode_list[index] = inode_cache.get(inode_id)
+            missing_index_list = [index for (index, inode) in enumerate(inode_list) if inode is None]
+            if missing_index_list:
+                data_list = self._get_inode_strings([inode_id_list[index] for index in missing_index_list])
+                for (index, data) in zip(missing_index_list, data_list):
+                    if data is not None:
+                        inode_list[index] = Inode.from_string(data, self._fs_name)
+                        if inode_cache is not None:
+                            inode_cache.put(inode_list[index], epoch)
+            return inode_list
+        except Exception as e:
+            logger.error("Falied to get inodes {} for file-system {}".format(inode_id_list, self._fs_name), exc_info=True)
+            raise e
+
+    def _get_inode_strings(self, inode_id_list):
+        """Get the encoded inodes in one round trip
+           Return list of strings with None for the missing inodes"""
+        return self._client.mget([self._wrap_fs_delimiter(inode_id) for inode_id in inode_id_list])
+
     def put_inode(self, inode):
         """Put an inode"""
         try:
             logger.debug("Put inode {} for file-system {}".format(inode.id, self._fs_name))
-            response = self._client.set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
-            self.build_index(inode.parent_inode_id, inode.id, inode.name)
+            pipe_map = {}
+            self._get_pipeline(pipe_map, inode.id).set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+            self._add_entries(pipe_map, inode)
+            response = self._execute_pipelines(pipe_map)
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(inode.parent_inode_id, inode.name)
+            self._journal(self._inode_changes(inode) + self._entry_changes(inode))
             return response
         except Exception as e:
             logger.error("Failed to put inode {} for file-system {}".format(inode.id, self._fs_name), exc_info=True)
             raise e
     
+    def create_inode(self, inode):
+        """Create a new inode along with its directory entries in one atomic step if they are on one server
+           and the parent is not split. Fails with EEXIST if the name is taken. The inode id is counted when it is leased"""
+        try:
+            logger.debug("Create inode {} for file-system {}".format(inode.id, self._fs_name))
+            response = SPLIT_RESPONSE
+            if self._on_one_shard([inode.parent_inode_id, inode.id]) and not self._is_split_hint(inode.parent_inode_id):
+                response = self._run_script(self._create_inode_script, keys=[self._inode_list_key(inode.parent_inode_id), self._wrap_fs_delimiter(inode.id), self._inode_list_key(inode.id)],
+                                            args=[inode.name, inode.id, Inode.to_string(inode), inode.parent_inode_id, int(stat.S_ISDIR(inode.mode)),
+                                                  self._dir_split_size],
+                                            client=self._get_client(inode.parent_inode_id))
+            if response == SPLIT_RESPONSE:
+                response = self._create_inode_steps(inode)
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(inode.parent_inode_id, inode.name)
+        except Exception as e:
+            logger.error("Failed to create inode {} for file-system {}".format(inode.id, self._fs_name), exc_info=True)
+            raise e
+        self._check_script_response(response)
+        self._journal(self._inode_changes(inode) + self._entry_changes(inode))
+
+    def lease_inode_ids(self, lease_size):
+        """Lease a range of up to lease_size free inode ids in one atomic step. The ids are counted
+           as used inodes. Fails with ENOSPC if there are no free inodes
+           Return the first and last inode id of the range"""
+        try:
+            logger.debug("Lease {} inode ids for file-system {}".format(lease_size, self._fs_name))
+            response = self._lease_inode_ids_script(keys=[self._wrap_superblock_key(self._config.SB_INODE_COUNTER), self._wrap_superblock_key(self._config.SB_MAX_INODES),
+                                                          self._wrap_superblock_key(self._config.SB_FREE_INODE_ID), self._wrap_superblock_key(self._config.SB_FREE_INODE_RANGES)],
+                                                    args=[lease_size])
+        except Exception as e:
+            logger.error("Failed to lease {} inode ids for file-system {}".format(lease_size, self._fs_name), exc_info=True)
+            raise e
+        if not isinstance(response, list):
+            self._check_script_response(response)
+        return (int(response[0]), int(response[1]))
+
+    def return_inode_ids(self, inode_id_range_list):
+        """Return unused ranges of leased inode ids so that other leases reuse them"""
+        try:
+            logger.debug("Return inode ids {} for file-system {}".format(inode_id_range_list, self._fs_name))
+            pipe = self._client.pipeline(transaction=True)
+            for (start_id, end_id) in inode_id_range_list:
+                pipe.rpush(self._wrap_superblock_key(self._config.SB_FREE_INODE_RANGES), '{}-{}'.format(start_id, end_id))
+                pipe.decr(self._wrap_superblock_key(self._config.SB_INODE_COUNTER), end_id-start_id+1)
+            return pipe.execute()
+        except Exception as e:
+            logger.error("Failed to return inode ids {} for file-system {}".format(inode_id_range_list, self._fs_name), exc_info=True)
+            raise e
+
+    def remove_entry(self, parent_inode_id, file_name, inode, delete_inode=False):
+        """Remove a directory entry and update or delete its inode in one atomic step if the keys are on one
+           server and no directory is split. Fails with ENOTEMPTY for a directory with entries"""
+        try:
+            logger.debug("Remove entry for parent inode:{}, name:{}, delete inode:{}".format(parent_inode_id, file_name, delete_inode))
+            response = SPLIT_RESPONSE
+            if self._on_one_shard([parent_inode_id, inode.id], delete_inode) and not self._is_split_hint(parent_inode_id):
+                response = self._run_script(self._remove_entry_script, keys=[self._inode_list_key(parent_inode_id), self._wrap_fs_delimiter(inode.id), self._inode_list_key(inode.id),
+                                                                             self._wrap_superblock_key(self._config.SB_INODE_COUNTER), self._wrap_superblock_key(self._config.SB_USED_SIZE)],
+                                            args=[file_name, inode.id, Inode.to_string(inode), int(delete_inode), inode.size],
+                                            client=self._get_client(parent_inode_id))
+            if response == SPLIT_RESPONSE:
+                response = self._remove_entry_steps(parent_inode_id, file_name, inode, delete_inode)
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(parent_inode_id, file_name)
+        except Exception as e:
+            logger.error("Failed to remove entry for parent inode:{}, name:{}".format(parent_inode_id, file_name), exc_info=True)
+            raise e
+        self._check_script_response(response)
+        self._journal([(CHANGE_ENTRY, parent_inode_id, file_name, None)] + self._unlink_changes(inode, delete_inode))
+
+    def link_entry(self, new_parent_inode_id, new_name, inode):
+        """Add a directory entry for an existing inode and update the inode in one atomic step if they
+           are on one server and the new parent is not split"""
+        try:
+            logger.debug("Link inode:{} to parent inode:{}, name:{}".format(inode.id, new_parent_inode_id, new_name))
+            response = SPLIT_RESPONSE
+            if self._on_one_shard([new_parent_inode_id, inode.id]) and not self._is_split_hint(new_parent_inode_id):
+                response = self._run_script(self._link_entry_script, keys=[self._inode_list_key(new_parent_inode_id), self._wrap_fs_delimiter(inode.id)],
+                                            args=[new_name, inode.id, Inode.to_string(inode), self._dir_split_size],
+                                            client=self._get_client(new_parent_inode_id))
+            if response == SPLIT_RESPONSE:
+                response = self._link_entry_steps(new_parent_inode_id, new_name, inode)
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(new_parent_inode_id, new_name)
+        except Exception as e:
+            logger.error("Failed to link inode:{} to parent inode:{}, name:{}".format(inode.id, new_parent_inode_id, new_name), exc_info=True)
+            raise e
+        self._check_script_response(response)
+        self._journal([(CHANGE_ENTRY, new_parent_inode_id, new_name, inode.id)] + self._inode_changes(inode))
+
+    def rename_entry(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode, replaced_inode=None, delete_replaced_inode=False):
+        """Move a directory entry and update its inode in one atomic step if the keys are on one server and no
+           directory is split. If an inode is given for the new name its entry is replaced and the inode is updated
+           or deleted. Fails with ENOTEMPTY for a directory with entries"""
+        try:
+            logger.debug("Rename parent inode:{}, name:{} to parent inode:{}, name:{}".format(old_parent_inode_id, old_name, new_parent_inode_id, new_name))
+            inode_id_list = [old_parent_inode_id, new_parent_inode_id, inode.id]
+            if replaced_inode is not None:
+                inode_id_list.append(replaced_inode.id)
+            response = SPLIT_RESPONSE
+            if (self._on_one_shard(inode_id_list, replaced_inode is not None and delete_replaced_inode) and
+                    not self._is_split_hint(old_parent_inode_id) and not self._is_split_hint(new_parent_inode_id)):
+                key_list = [self._inode_list_key(old_parent_inode_id), self._inode_list_key(new_parent_inode_id), self._wrap_fs_delimiter(inode.id), self._inode_list_key(inode.id)]
+                arg_list = [old_name, new_name, inode.id, Inode.to_string(inode), new_parent_inode_id, self._dir_split_size]
+                if replaced_inode is not None:
+                    key_list.extend([self._wrap_fs_delimiter(replaced_inode.id), self._inode_list_key(replaced_inode.id),
+                                     self._wrap_superblock_key(self._config.SB_INODE_COUNTER), self._wrap_superblock_key(self._config.SB_USED_SIZE)])
+                    arg_list.extend([replaced_inode.id, Inode.to_string(replaced_inode), int(delete_replaced_inode), replaced_inode.size])
+                response = self._run_script(self._rename_entry_script, keys=key_list, args=arg_list, client=self._get_client(old_parent_inode_id))
+            if response == SPLIT_RESPONSE:
+                response = self._rename_entry_steps(old_parent_inode_id, old_name, new_parent_inode_id, new_name,
+                                                    inode, replaced_inode, delete_replaced_inode)
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(old_parent_inode_id, old_name)
+            self._invalidate_entry(new_parent_inode_id, new_name)
+            if replaced_inode is not None:
+                self._invalidate_inode(replaced_inode.id)
+        except Exception as e:
+            logger.error("Failed to rename parent inode:{}, name:{} to parent inode:{}, name:{}".format(old_parent_inode_id, old_name, new_parent_inode_id, new_name), exc_info=True)
+            raise e
+        self._check_script_response(response)
+        self._journal(self._rename_changes(old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode, replaced_inode, delete_replaced_inode))
+
     def update_inode(self, inode):
         """Update an inode"""
         try:
             logger.debug("Update inode {} for file-system {}".format(inode.id, self._fs_name))
-            response = self._client.set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+            inode_string = Inode.to_string(inode)
+            response = self._get_client(inode.id).set(self._wrap_fs_delimiter(inode.id), inode_string)
+            self._invalidate_inode(inode.id)
+            self._journal([(CHANGE_INODE, inode.id, inode_string)])
             return response
         except Exception as e:
             logger.error("Failed to update inode {} for file-system {}".format(inode.id, self._fs_name), exc_info=True)
             raise e
 
+    def update_inodes(self, inode_list):
+        """Update a batch of inodes in one pipelined write"""
+        try:
+            logger.debug("Update inodes {} for file-system {}".format([inode.id for inode in inode_list], self._fs_name))
+            pipe_map = {}
+            for inode in inode_list:
+                self._get_pipeline(pipe_map, inode.id).set(self._wrap_fs_delimiter(inode.id), Inode.to_string(inode))
+            response = self._execute_pipelines(pipe_map)
+            for inode in inode_list:
+                self._invalidate_inode(inode.id)
+            self._journal([change for inode in inode_list for change in self._inode_changes(inode)])
+            return response
+        except Exception as e:
+            logger.error("Failed to update inodes {} for file-system {}".format([inode.id for inode in inode_list], self._fs_name), exc_info=True)
+            raise e
+
+    def migrate_inodes(self, batch_size=1000):
+        """Re-encode the inodes stored in an older format. Run offline.
+           Return the number of inodes migrated"""
+        try:
+            logger.debug("Migrate inodes for file-system {}".format(self._fs_name))
+            prefix = '{}{}'.format(self._fs_name, FS_DELIMITER)
+            # only plain inode keys, not lists, indexes or blocks
+            inode_keys = (key for key in self._client.scan_iter(match='{}*'.format(prefix), count=batch_size) if key[len(prefix):].isdigit())
+            migrated = 0
+            while True:
+                key_list = list(islice(inode_keys, batch_size))
+                if not key_list:
+                    break
+                pipe = self._client.pipeline(transaction=False)
+                for (key, data) in zip(key_list, self._client.mget(key_list)):
+                    if data is not None and not Inode.is_encoded(data):
+                        pipe.set(key, Inode.to_string(Inode.from_string(data, self._fs_name)))
+                        migrated += 1
+                pipe.execute()
+            logger.info("Migrated {} inodes for file-system {}".format(migrated, self._fs_name))
+            return migrated
+        except Exception as e:
+            logger.error("Failed to migrate inodes for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def migrate_directories(self, batch_size=1000):
+        """Convert the directory lists and their reverse index keys to directory hashes. Run offline.
+           Return the number of directories migrated"""
+        try:
+            logger.debug("Migrate directories for file-system {}".format(self._fs_name))
+            prefix = '{}{}'.format(self._fs_name, FS_DELIMITER)
+            list_suffix = '{}{}'.format(LIST_DELMITER, 'list')
+            migrated = 0
+            for list_key in self._client.scan_iter(match='{}*{}'.format(prefix, list_suffix), count=batch_size):
+                inode_id = list_key[len(prefix):-len(list_suffix)]
+                if not inode_id.isdigit():
+                    continue
+                entry_map = {}
+                for inode_string in self._client.lrange(list_key, 0, -1):
+                    # names may contain the delimiter but the inode id cannot
+                    (child_inode_id, file_name) = inode_string.split(NAME_DELIMITER, 1)
+                    entry_map[file_name] = child_inode_id
+                pipe = self._client.pipeline(transaction=True)
+                if entry_map:
+                    pipe.hmset(self._inode_list_key(inode_id), entry_map)
+                pipe.delete(list_key)
+                pipe.execute()
+                migrated += 1
+            # the reverse index keys are replaced by the directory hashes
+            index_keys = (key for key in self._client.scan_iter(match='{}*{}*'.format(prefix, NAME_DELIMITER), count=batch_size)
+                          if key[len(prefix):].split(NAME_DELIMITER, 1)[0].isdigit())
+            while True:
+                key_list = list(islice(index_keys, batch_size))
+                if not key_list:
+                    break
+                self._client.delete(*key_list)
+            logger.info("Migrated {} directories for file-system {}".format(migrated, self._fs_name))
+            return migrated
+        except Exception as e:
+            logger.error("Failed to migrate directories for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def _get_key_client(self, key):
+        """Client for the server holding a metadata key"""
+        return self._client
+
+    def _is_metadata_key(self, key):
+        """Check if a key of the file-system is an inode, a directory or a bucket of a directory,
+           not a cache or block key"""
+        part_list = key[len(self._fs_name)+len(FS_DELIMITER):].split(LIST_DELMITER)
+        if len(part_list) > 1 and part_list[1] != 'dir':
+            return False
+        if len(part_list) > 2 and (len(part_list) > 3 or not part_list[2].isdigit()):
+            return False
+        return part_list[0].isdigit()
+
+    def scan_metadata_keys(self, batch_size=1000):
+        """Scan the inode, directory and superblock keys of the file-system. Keys changed
+           during the scan may or may not be returned
+           Yields lists of up to batch_size keys"""
+        try:
+            logger.debug("Scan metadata keys for file-system {}".format(self._fs_name))
+            for client in self._get_client_list():
+                key_iter = chain((key for key in client.scan_iter(match='{}{}*'.format(self._fs_name, FS_DELIMITER), count=batch_size) if self._is_metadata_key(key)),
+                                 client.scan_iter(match=self._wrap_superblock_key('*'), count=batch_size))
+                while True:
+                    key_list = list(islice(key_iter, batch_size))
+                    if not key_list:
+                        break
+                    yield key_list
+        except Exception as e:
+            logger.error("Failed to scan metadata keys for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def dump_keys(self, key_list):
+        """Serialize keys with DUMP in one round trip per server
+           Return list of key and value pairs without the keys deleted meanwhile"""
+        try:
+            logger.debug("Dump {} keys for file-system {}".format(len(key_list), self._fs_name))
+            client_map = {}
+            for key in key_list:
+                client = self._get_key_client(key)
+                client_map.setdefault(id(client), (client, []))[1].append(key)
+            record_list = []
+            for (client, client_key_list) in client_map.values():
+                pipe = client.pipeline(transaction=False)
+                for key in client_key_list:
+                    pipe.dump(key)
+                record_list.extend((key, value) for (key, value) in zip(client_key_list, pipe.execute()) if value is not None)
+            return record_list
+        except Exception as e:
+            logger.error("Failed to dump keys for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def restore_keys(self, record_list):
+        """Load keys serialized by dump_keys in one round trip per server. Existing keys are replaced"""
+        try:
+            logger.debug("Restore {} keys for file-system {}".format(len(record_list), self._fs_name))
+            pipe_map = {}
+            for (key, value) in record_list:
+                client = self._get_key_client(key)
+                if id(client) not in pipe_map:
+                    pipe_map[id(client)] = client.pipeline(transaction=False)
+                pipe_map[id(client)].restore(key, 0, value, replace=True)
+            self._execute_pipelines(pipe_map)
+        except Exception as e:
+            logger.error("Failed to restore keys for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def apply_changes(self, change_list):
+        """Apply changes replayed from the metadata journal in one round trip per server. The changes
+           of a key are applied in order"""
+        try:
+            logger.debug("Apply {} journal changes for file-system {}".format(len(change_list), self._fs_name))
+            pipe_map = {}
+            for change in change_list:
+                if change[0] == CHANGE_INODE:
+                    (kind, inode_id, inode_string) = change
+                    self._get_pipeline(pipe_map, inode_id).set(self._wrap_fs_delimiter(inode_id), inode_string)
+                elif change[0] == CHANGE_DELETE:
+                    # a deleted directory is empty, so its buckets are gone
+                    (kind, inode_id) = change
+                    self._get_pipeline(pipe_map, inode_id).delete(self._wrap_fs_delimiter(inode_id), self._inode_list_key(inode_id))
+                elif change[3] is None:
+                    (kind, parent_inode_id, file_name, inode_id) = change
+                    self._del_name(pipe_map, parent_inode_id, file_name)
+                else:
+                    (kind, parent_inode_id, file_name, inode_id) = change
+                    self._set_name(pipe_map, parent_inode_id, file_name, inode_id)
+            self._execute_pipelines(pipe_map)
+        except Exception as e:
+            logger.error("Failed to apply journal changes for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def rebuild_superblock_counters(self, batch_size=1000):
+        """Recount the inode counter and used size from the inodes, which a journal replay leaves behind.
+           The free inode id is moved past the largest inode id and the returned ranges of free inode
+           ids are dropped, since replayed inodes may use them
+           Return the number of inodes and the used size"""
+        try:
+            logger.debug("Rebuild superblock counters for file-system {}".format(self._fs_name))
+            (inode_counter, used_size, last_inode_id) = (0, 0, 0)
+            for client in self._get_client_list():
+                key_iter = (key for key in client.scan_iter(match=self._wrap_fs_delimiter('*'), count=batch_size)
+                            if key[len(self._fs_name)+len(FS_DELIMITER):].isdigit())
+                while True:
+                    key_list = list(islice(key_iter, batch_size))
+                    if not key_list:
+                        break
+                    for data in client.mget(key_list):
+                        if data is not None:
+                            inode = Inode.from_string(data, self._fs_name)
+                            inode_counter += 1
+                            used_size += inode.size
+                            last_inode_id = max(last_inode_id, inode.id)
+            free_inode_id = max(self.get_superblock_key(self._wrap_superblock_key(self._config.SB_FREE_INODE_ID)) or 0, last_inode_id)
+            pipe = self._client.pipeline(transaction=True)
+            pipe.set(self._wrap_superblock_key(self._config.SB_INODE_COUNTER), inode_counter)
+            pipe.set(self._wrap_superblock_key(self._config.SB_USED_SIZE), used_size)
+            pipe.set(self._wrap_superblock_key(self._config.SB_FREE_INODE_ID), free_inode_id)
+            pipe.delete(self._wrap_superblock_key(self._config.SB_FREE_INODE_RANGES))
+            pipe.execute()
+            return (inode_counter, used_size)
+        except Exception as e:
+            logger.error("Failed to rebuild superblock counters for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
     def get_inode_id(self, parent_inode_id, file_name):
         """Get an inode id based on parent inode id and file_name"""
         try:
             logger.debug("Get inode for parent:{}, name:{}".format(parent_inode_id, file_name))
-            response = self._client.get(self._wrap_fs_delimiter(self._inode_reverse_key(parent_inode_id, file_name)))
-            if response:
-                return int(response)
-            else:
-                return None
+            dentry_cache = DentryCache.load(self._fs_name)
+            if dentry_cache is not None:
+                (cached, inode_id) = dentry_cache.get(parent_inode_id, file_name)
+                if cached:
+                    return inode_id
+                epoch = dentry_cache.epoch
+            response = self._get_inode_id_string(parent_inode_id, file_name)
+            inode_id = int(response) if response else None
+            if dentry_cache is not None:
+                dentry_cache.put(parent_inode_id, file_name, inode_id, epoch)
+            return inode_id
         except Exception as e:
             logger.error("Failed to get inode for parent:{}, name:{}".format(parent_inode_id, file_name), exc_info=True)
             raise e
@@ -219,19 +1217,43 @@ class RedisMetaStore(MetaStore):
         try:
             logger.debug("Delete inode:{}".format(inode_id))
             inode = self.get_inode(inode_id)
-            response = self._client.delete(self._wrap_fs_delimiter(inode_id))
+            response = self._get_client(inode_id).delete(self._wrap_fs_delimiter(inode_id))
+            self._invalidate_inode(inode_id)
             self.clean_index(inode.parent_inode_id, inode.name)
             self.delete_inode_id_list(inode_id)
+            self._journal([(CHANGE_ENTRY, inode.parent_inode_id, inode.name, None), (CHANGE_DELETE, inode_id)])
             return response
         except Exception as e:
             logger.error("Failed to delete inode:{}".format(inode_id), exc_info=True)
             raise e
 
+    def delete_inodes(self, inode_id_list):
+        """Delete a batch of unlinked inodes along with their directories in one round trip per server.
+           Their names were removed when they were unlinked"""
+        try:
+            logger.debug("Delete inodes:{}".format(inode_id_list))
+            pipe_map = {}
+            for inode_id in inode_id_list:
+                self._get_pipeline(pipe_map, inode_id).delete(self._wrap_fs_delimiter(inode_id), self._inode_list_key(inode_id))
+            response = self._execute_pipelines(pipe_map)
+            for inode_id in inode_id_list:
+                self._invalidate_inode(inode_id)
+                self._invalidate_directory(inode_id)
+                self._set_split_hint(inode_id, False)
+            self._journal([(CHANGE_DELETE, inode_id) for inode_id in inode_id_list])
+            return response
+        except Exception as e:
+            logger.error("Failed to delete inodes:{}".format(inode_id_list), exc_info=True)
+            raise e
+
     def build_index(self, parent_inode_id, inode_id, file_name):
-        """Build an index from file_name to inode_id"""
+        """Build an index from file_name to inode_id. The directory entries are the index"""
         try:
             logger.debug("Build index for parent inode:{}, inode:{}, file_name:{}".format(parent_inode_id, inode_id, file_name))
-            response = self._client.set(self._wrap_fs_delimiter(self._inode_reverse_key(parent_inode_id, file_name)), inode_id)
+            pipe_map = {}
+            self._set_name(pipe_map, parent_inode_id, file_name, inode_id)
+            response = self._execute_pipelines(pipe_map)
+            self._invalidate_entry(parent_inode_id, file_name)
             return response
         except Exception as e:
             logger.error("Failed to build index for parent inode:{}, inode:{}, file_name:{}".format(parent_inode_id, inode_id, file_name), exc_info=True)
@@ -241,26 +1263,50 @@ class RedisMetaStore(MetaStore):
         """Clean an index based on parent node id and file name"""
         try:
             logger.debug("Clean index for parent inode:{}, file-name:{}".format(parent_inode_id, file_name))
-            response = self._client.delete(self._wrap_fs_delimiter(self._inode_reverse_key(parent_inode_id, file_name)))
+            pipe_map = {}
+            self._del_name(pipe_map, parent_inode_id, file_name)
+            response = self._execute_pipelines(pipe_map)
+            self._invalidate_entry(parent_inode_id, file_name)
             return response
         except Exception as e:
             logger.error("Failed to clean index for parent inode:{}, file-name:{}".format(parent_inode_id, file_name), exc_info=True)
             raise e
     
-    def _inode_list_key(self, inode_id):
-        return '{}{}{}{}{}'.format(self._fs_name, FS_DELIMITER, inode_id, LIST_DELMITER, 'list')
-    
-    def _inode_reverse_key(self, parent_inode_id, file_name):
-        return '{}{}{}'.format(parent_inode_id, NAME_DELIMITER, file_name)
+    def _inode_list_key(self, inode_id, bucket=0):
+        """Hash of the directory entries from file name to inode id, or of the entries in a bucket of a split directory"""
+        if bucket:
+            return '{}{}{}{}{}{}{}'.format(self._fs_name, FS_DELIMITER, inode_id, LIST_DELMITER, 'dir', LIST_DELMITER, bucket)
+        return '{}{}{}{}{}'.format(self._fs_name, FS_DELIMITER, inode_id, LIST_DELMITER, 'dir')
 
     def get_inode_id_list(self, inode_id, offset=0):
         """Get inode id list for inode"""
+        for (child_inode_id, file_name, next_offset) in self.scan_inode_id_list(inode_id, offset):
+            yield(child_inode_id, file_name)
+
+    def scan_inode_id_list(self, inode_id, offset=0):
+        """Scan the inode id list for inode starting at a readdir offset. The buckets of a
+           split directory are scanned after the directory hash.
+           Yields the inode id, name and the offset of the next entry"""
         try:
-            logger.debug("Get inode:{} from list at offset:{}".format(inode_id, offset))
-            response = self._client.lrange(self._inode_list_key(inode_id), offset, -1)
-            for inode_string in response:
-                (inode_id, file_name) = inode_string.split(NAME_DELIMITER)
-                yield(int(inode_id), file_name)
+            logger.debug("Scan inode:{} list at offset:{}".format(inode_id, offset))
+            (position, index) = divmod(offset, 1 << DIR_OFFSET_SHIFT)
+            (bucket, cursor) = divmod(position, 1 << DIR_CURSOR_BITS)
+            split = bucket > 0
+            while True:
+                (next_cursor, response) = self._get_list_client(inode_id, bucket).hscan(self._inode_list_key(inode_id, bucket), cursor, count=DIR_SCAN_COUNT)
+                if response.pop(DIR_SPLIT_FIELD, None) is not None:
+                    split = True
+                # sorted so that the position in the batch is repeatable
+                for (batch_index, (file_name, child_inode_id)) in enumerate(sorted(response.items())[index:], index+1):
+                    yield(int(child_inode_id), file_name, (((bucket << DIR_CURSOR_BITS) | cursor) << DIR_OFFSET_SHIFT) + batch_index)
+                (cursor, index) = (next_cursor, 0)
+                if next_cursor == 0:
+                    # a scan resumed past the split field has not seen it
+                    if bucket == 0 and not split and offset:
+                        split = self._is_split(inode_id)
+                    if not split or bucket == self._dir_buckets:
+                        break
+                    bucket += 1
         except Exception as e:
             logger.error("Error in fetching inode id list for inode {}".format(inode_id), exc_info=True)
             raise e
@@ -269,8 +1315,10 @@ class RedisMetaStore(MetaStore):
         """Add new id to inode id list"""
         try:
             logger.debug("Add new:{}, name:{} to list for inode:{} list".format(new_id, new_name, inode_id))
-            # this has to be appended to the list not prepended
-            response = self._client.rpush(self._inode_list_key(inode_id), self._inode_reverse_key(new_id, new_name))
+            pipe_map = {}
+            self._set_name(pipe_map, inode_id, new_name, new_id)
+            response = self._execute_pipelines(pipe_map)
+            self._invalidate_entry(inode_id, new_name)
             return response
         except Exception as e:
             logger.error("Failed to add new:{}, name:{} to list for inode:{} list".format(new_id, new_name, inode_id), exc_info=True)
@@ -280,7 +1328,10 @@ class RedisMetaStore(MetaStore):
         """Remove existing id from inode list"""
         try:
             logger.debug("Remove id:{},name:{} from inode:{} list".format(existing_id, existing_name, inode_id))
-            response = self._client.lrem(self._inode_list_key(inode_id), 1, self._inode_reverse_key(existing_id, existing_name))
+            pipe_map = {}
+            self._del_name(pipe_map, inode_id, existing_name)
+            response = self._execute_pipelines(pipe_map)
+            self._invalidate_entry(inode_id, existing_name)
             return response
         except Exception as e:
             logger.error("Failed to remove inode:{},name:{} from inode:{} list".format(existing_id, existing_name, inode_id), exc_info=True)
@@ -290,7 +1341,14 @@ class RedisMetaStore(MetaStore):
         """Delete inode id list"""
         try:
             logger.debug("Delete inode:{} list".format(inode_id))
-            self._client.delete(self._inode_list_key(inode_id))
+            if self._is_split(inode_id):
+                pipe_map = {}
+                for bucket in range(1, self._dir_buckets+1):
+                    self._get_pipeline(pipe_map, inode_id, bucket).delete(self._inode_list_key(inode_id, bucket))
+                self._execute_pipelines(pipe_map)
+                self._set_split_hint(inode_id, False)
+            self._get_client(inode_id).delete(self._inode_list_key(inode_id))
+            self._invalidate_directory(inode_id)
         except Exception as e:
             logger.error("Failed to Delete inode list for inode:{}".format(inode_id), exc_info=True)
             raise e
@@ -299,8 +1357,11 @@ class RedisMetaStore(MetaStore):
         """Get the length of the inode id list"""
         try:
             logger.debug("Get length of inode:{} list".format(inode_id))
-            response = self._client.llen(self._inode_list_key(inode_id))
-            if response:
+            response = self._get_client(inode_id).hlen(self._inode_list_key(inode_id))
+            if response and self._is_split(inode_id):
+                # the split field is not an entry
+                return int(response) - 1 + self._length_buckets(inode_id)
+            elif response:
                 return int(response)
             else:
                 return 0
@@ -308,10 +1369,687 @@ class RedisMetaStore(MetaStore):
             logger.error("Get length of inode:{} list".format(inode_id), exc_info=True)
             raise e
 
+class ShardedRedisMetaStore(RedisMetaStore):
+    """Redis meta store spread over several servers. An inode and the entries of the directory
+       it names live on the shard picked by its inode id, the buckets of a split directory on
+       the shards following it and the superblock lives on the first shard"""
+
+    def __init__(self, fs_name):
+        super(ShardedRedisMetaStore, self).__init__(fs_name)
+        try:
+            self._shard_client_list = [redis.StrictRedis(host=host, port=port, db=settings.REDIS_DB) for (host, port) in settings.META_SHARD_LIST]
+            self._client = self._shard_client_list[0]
+            self._register_scripts()
+        except redis.ConnectionError as e:
+            logger.error("Cannot connect to Redis shards", exc_info=True)
+            raise e
+
+    def _get_client(self, inode_id):
+        """Client for the shard holding the inode and its directory entries"""
+        return self._shard_client_list[int(inode_id) % len(self._shard_client_list)]
+
+    def _get_list_client(self, inode_id, bucket=0):
+        """Client for the shard holding the directory hash or a bucket of a directory"""
+        return self._shard_client_list[(int(inode_id) + bucket) % len(self._shard_client_list)]
+
+    def _get_client_list(self):
+        """Clients for all the shards"""
+        return self._shard_client_list
+
+    def _get_key_client(self, key):
+        """Client for the shard holding a metadata key"""
+        if key.startswith(FS_DELIMITER):
+            return self._client
+        part_list = key[len(self._fs_name)+len(FS_DELIMITER):].split(LIST_DELMITER)
+        return self._get_list_client(part_list[0], int(part_list[2]) if len(part_list) > 2 else 0)
+
+    def _on_one_shard(self, inode_id_list, with_superblock=False):
+        """Check if the keys of the inodes, and the superblock if needed, are on one shard"""
+        client_list = [self._get_client(inode_id) for inode_id in inode_id_list]
+        if with_superblock:
+            client_list.append(self._client)
+        return all(client is client_list[0] for client in client_list)
+
+    def _get_inode_strings(self, inode_id_list):
+        """Get the encoded inodes in one round trip per shard
+           Return list of strings with None for the missing inodes"""
+        index_map = {}
+        for (index, inode_id) in enumerate(inode_id_list):
+            index_map.setdefault(int(inode_id) % len(self._shard_client_list), []).append(index)
+        data_list = [None] * len(inode_id_list)
+        for (shard, index_list) in index_map.items():
+            response = self._shard_client_list[shard].mget([self._wrap_fs_delimiter(inode_id_list[index]) for index in index_list])
+            for (index, data) in zip(index_list, response):
+                data_list[index] = data
+        return data_list
+
+class SqliteDatabase(object):
+    """Database of a file-system on local disk, shared by all the meta stores of the process.
+       Writes go into one open transaction which is committed once enough writes collected or
+       after the commit interval"""
+
+    __databases = {}
+    __lock = threading.Lock()
+
+    def __init__(self, fs_name):
+        self._fs_name = fs_name
+        self._config = settings.config
+        if not os.path.isdir(settings.META_SQLITE_PATH):
+            os.makedirs(settings.META_SQLITE_PATH)
+        self._path = os.path.join(settings.META_SQLITE_PATH, '{}.db'.format(fs_name))
+        # one connection serialized by the lock. Transactions are managed here and not by the module
+        self._connection = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        self._connection.text_factory = str
+        self._lock = threading.RLock()
+        self._in_batch = False
+        self._batch_writes = 0
+        self._pid = os.getpid()
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # writes are batched, so a crash of the process loses the writes of the open batch, at most
+        # sqlite_commit_batch writes or sqlite_commit_interval seconds. WAL with normal sync keeps the
+        # committed batches over a crash of the process, only a power loss can also drop the last of them
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('PRAGMA cache_size=-{}'.format(settings.META_SQLITE_CACHE_SIZE))
+        self._connection.executescript(SQLITE_SCHEMA)
+
+    @staticmethod
+    def load(fs_name):
+        """Return the database of the file-system, opening it once per process"""
+        with SqliteDatabase.__lock:
+            database = SqliteDatabase.__databases.get(fs_name)
+            # connections are not shared with forked workers
+            if database is None or database._pid != os.getpid():
+                logger.debug("Open database {}".format(fs_name))
+                database = SqliteDatabase(fs_name)
+                SqliteDatabase.__databases[fs_name] = database
+                commit_thread = ObjectFSThread(target=database._run_commit, name='SqliteCommit')
+                commit_thread.daemon = True
+                commit_thread.start()
+            return database
+
+    @staticmethod
+    def close(fs_name):
+        """Commit the pending writes and close the database of the file-system"""
+        with SqliteDatabase.__lock:
+            database = SqliteDatabase.__databases.pop(fs_name, None)
+        if database is not None:
+            database.commit()
+            database._connection.close()
+
+    @contextmanager
+    def read(self):
+        """Cursor which sees the pending writes"""
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def write(self):
+        """Cursor for one write. The write is undone if it fails without dropping the rest of the batch"""
+        with self._lock:
+            if not self._in_batch:
+                self._connection.execute('BEGIN')
+                self._in_batch = True
+            self._connection.execute('SAVEPOINT write')
+            cursor = self._connection.cursor()
+            try:
+                yield cursor
+            except:
+                self._connection.execute('ROLLBACK TO write')
+                self._connection.execute('RELEASE write')
+                raise
+            finally:
+                cursor.close()
+            self._connection.execute('RELEASE write')
+            self._batch_writes += 1
+            if self._batch_writes >= self._config.META_SQLITE_COMMIT_BATCH:
+                self.commit()
+
+    def commit(self):
+        """Commit the pending writes"""
+        with self._lock:
+            if self._in_batch:
+                logger.debug("Commit {} writes for database {}".format(self._batch_writes, self._fs_name))
+                self._connection.execute('COMMIT')
+                self._in_batch = False
+                self._batch_writes = 0
+
+    def _run_commit(self):
+        """Commit the pending writes every commit interval"""
+        while SqliteDatabase.__databases.get(self._fs_name) is self:
+            sleep(self._config.META_SQLITE_COMMIT_INTERVAL)
+            try:
+                self.commit()
+            except sqlite3.Error as e:
+                logger.error("Failed to commit database {}".format(self._fs_name), exc_info=True)
+
+class SqliteMetaStore(MetaStore):
+    """Meta store on an embedded SQLite database for namespaces larger than memory. The database
+       is local to the mount. Decoded inodes are kept hot in the inode cache"""
+
+    def __init__(self, fs_name):
+        try:
+            self._fs_name = fs_name
+            self._config = settings.config
+            self._database = SqliteDatabase.load(fs_name)
+        except sqlite3.Error as e:
+            logger.error("Cannot open the database for file-system {}".format(fs_name), exc_info=True)
+            raise e
+
+    def _clean_store(self):
+        """Clean store"""
+        try:
+            logger.debug("Delete all keys for file-system {}".format(self._fs_name))
+            with self._database.write() as cursor:
+                for table in ['inodes', 'entries', 'superblock', 'free_inode_ranges']:
+                    cursor.execute('DELETE FROM {}'.format(table))
+        except Exception as e:
+            logger.error("Failed to delete all keys for file-system {}".format(self._fs_name), exc_info=True)
+            raise e
+
+    def _wrap_superblock_key(self, superblock_key):
+        """Superblock key for the file-system, as used by the superblock"""
+        return '{}{}{}{}{}'.format(FS_DELIMITER, self._fs_name, FS_DELIMITER, superblock_key, FS_DELIMITER)
+
+    def _check_response(self, response):
+        """Raise the errno returned by a namespace mutation"""
+        if response:
+            raise llfuse.FUSEError(getattr(errno, response))
+
+    def _invalidate_inode(self, inode_id):
+        """Drop the inode from the inode cache of this process"""
+        inode_cache = InodeCache.load(self._fs_name)
+        if inode_cache is not None:
+            inode_cache.invalidate(inode_id)
+
+    def _incr_superblock_key(self, cursor, key, value):
+        """Increment the superblock key by value within a write"""
+        cursor.execute('INSERT OR IGNORE INTO superblock (key, value) VALUES (?, 0)', (key,))
+        cursor.execute('UPDATE superblock SET value = value + ? WHERE key = ?', (value, key))
+
+    def _read_superblock_key(self, cursor, key):
+        """Get the superblock key within a read or write"""
+        row = cursor.execute('SELECT value FROM superblock WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_superblock_key(self, key, value):
+        """Set the superblock key"""
+        try:
+            logger.debug("Set superblock key:{} to value:{}".format(key, value))
+            with self._database.write() as cursor:
+                cursor.execute('INSERT OR REPLACE INTO superblock (key, value) VALUES (?, ?)', (key, value))
+            return True
+        except Exception as e:
+            logger.error("Failed to set superblock key:{} to value:{}".format(key, value), exc_info=True)
+            raise e
+
+    def get_superblock_key(self, key):
+        """Get the superblock key"""
+        try:
+            logger.debug("Get superblock key:{}".format(key))
+            with self._database.read() as cursor:
+                return self._read_superblock_key(cursor, key)
+        except Exception as e:
+            logger.error("Failed to get superblock key:{}".format(key), exc_info=True)
+            raise e
+
+    def incr_superblock_key(self, key, value):
+        """Increment the superblock key by value"""
+        try:
+            logger.debug("Increment superblock key:{} by value:{}".format(key, value))
+            with self._database.write() as cursor:
+                self._incr_superblock_key(cursor, key, value)
+                return self._read_superblock_key(cursor, key)
+        except Exception as e:
+            logger.error("Failed to increment superblock key:{} by value:{}".format(key, value), exc_info=True)
+            raise e
+
+    def decr_superblock_key(self, key, value):
+        """Decrement the superblock key by value"""
+        try:
+            logger.debug("Decrement superblock key:{} by value:{}".format(key, value))
+            with self._database.write() as cursor:
+                self._incr_superblock_key(cursor, key, -value)
+                return self._read_superblock_key(cursor, key)
+        except Exception as e:
+            logger.debug("Failed to decrement superblock key:{} by value:{}".format(key, value), exc_info=True)
+            raise e
+
+    def update_superblock_keys(self, incr_map, key_list):
+        """Increment superblock keys and get the values of superblock keys in one transaction
+           Return list of values"""
+        try:
+            logger.debug("Increment superblock keys:{} and get keys:{}".format(incr_map, key_list))
+            with self._database.write() as cursor:
+                for (key, value) in incr_map.items():
+                    if value:
+                        self._incr_superblock_key(cursor, key, value)
+                return [self._read_superblock_key(cursor, key) for key in key_list]
+        except Exception as e:
+            logger.error("Failed to increment superblock keys:{} and get keys:{}".format(incr_map, key_list), exc_info=True)
+            raise e
+
+    def delete_superblock_key(self, keys):
+        """Delete the superblock keys"""
+        try:
+            logger.debug("Delete superblock key:{}".format(keys))
+            with self._database.write() as cursor:
+                cursor.executemany('DELETE FROM superblock WHERE key = ?', [(key,) for key in keys])
+                if self._wrap_superblock_key(self._config.SB_FREE_INODE_RANGES) in keys:
+                    cursor.execute('DELETE FROM free_inode_ranges')
+            return len(keys)
+        except Exception as e:
+            logger.error("Failed to delete superblock key:{}".format(keys), exc_info=True)
+            raise e
+
+    def exists(self, key):
+        """Check if keys exist or not"""
+        try:
+            logger.debug("Check if key:{} exists".format(key))
+            return self.get_superblock_key(key) is not None
+        except Exception as e:
+            logger.error("Failed to check if key:{} exists".format(key), exc_info=True)
+            raise e
+
+    def lease_inode_ids(self, lease_size):
+        """Lease a range of up to lease_size free inode ids in one transaction. The ids are counted
+           as used inodes. Fails with ENOSPC if there are no free inodes
+           Return the first and last inode id of the range"""
+        try:
+            logger.debug("Lease {} inode ids for file-system {}".format(lease_size, self._fs_name))
+            counter_key = self._wrap_superblock_key(self._config.SB_INODE_COUNTER)
+            with self._database.write() as cursor:
+                lease_size = min(lease_size, (self._read_superblock_key(cursor, self._wrap_superblock_key(self._config.SB_MAX_INODES)) or 0) -
+                                             (self._read_superblock_key(cursor, counter_key) or 0))
+                if lease_size <= 0:
+                    response = 'ENOSPC'
+                else:
+                    response = 0
+                    row = cursor.execute('SELECT rowid, start_id, end_id FROM free_inode_ranges ORDER BY rowid LIMIT 1').fetchone()
+                    if row:
+                        (rowid, start_id, range_end_id) = row
+                        end_id = min(range_end_id, start_id+lease_size-1)
+                        if end_id < range_end_id:
+                            cursor.execute('UPDATE free_inode_ranges SET start_id = ? WHERE rowid = ?', (end_id+1, rowid))
+                        else:
+                            cursor.execute('DELETE FROM free_inode_ranges WHERE rowid = ?', (rowid,))
+                    else:
+                        self._incr_superblock_key(cursor, self._wrap_superblock_key(self._config.SB_FREE_INODE_ID), lease_size)
+                        end_id = self._read_superblock_key(cursor, self._wrap_superblock_key(self._config.SB_FREE_INODE_ID))
+                        start_id = end_id-lease_size+1
+                    self._incr_superblock_key(cursor, counter_key, end_id-start_id+1)
+        except Exception as e:
+            logger.error("Failed to lease {} inode ids for file-system {}".format(lease_size, self._fs_name), exc_info=True)
+            raise e
+        self._check_response(response)
+        return (start_id, end_id)
+
+    def return_inode_ids(self, inode_id_range_list):
+        """Return unused ranges of leased inode ids so that other leases reuse them"""
+        try:
+            logger.debug("Return inode ids {} for file-system {}".format(inode_id_range_list, self._fs_name))
+            with self._database.write() as cursor:
+                for (start_id, end_id) in inode_id_range_list:
+                    cursor.execute('INSERT INTO free_inode_ranges (start_id, end_id) VALUES (?, ?)', (start_id, end_id))
+                    self._incr_superblock_key(cursor, self._wrap_superblock_key(self._config.SB_INODE_COUNTER), -(end_id-start_id+1))
+        except Exception as e:
+            logger.error("Failed to return inode ids {} for file-system {}".format(inode_id_range_list, self._fs_name), exc_info=True)
+            raise e
+
+    def _put_inode(self, cursor, inode):
+        """Write an inode within a write"""
+        cursor.execute('INSERT OR REPLACE INTO inodes (id, data) VALUES (?, ?)', (inode.id, buffer(Inode.to_string(inode))))
+
+    def _add_entries(self, cursor, inode):
+        """Add the directory entries for a new inode. Its name in the parent directory
+           and, for directories, the . and .. entries"""
+        entry_list = []
+        # the root inode has no name
+        if inode.name is not None:
+            entry_list.append((inode.parent_inode_id, inode.name, inode.id))
+        if stat.S_ISDIR(inode.mode):
+            entry_list.extend([(inode.id, '.', inode.id), (inode.id, '..', inode.parent_inode_id)])
+        cursor.executemany('INSERT OR REPLACE INTO entries (parent_id, name, id) VALUES (?, ?, ?)', entry_list)
+
+    def _get_entry(self, cursor, parent_inode_id, file_name):
+        """Get the inode id of an entry within a read or write"""
+        row = cursor.execute('SELECT id FROM entries WHERE parent_id = ? AND name = ?', (parent_inode_id, file_name)).fetchone()
+        return row[0] if row else None
+
+    def _is_empty(self, cursor, inode_id):
+        """Check if a directory has no entries besides . and .."""
+        return cursor.execute('SELECT COUNT(*) FROM entries WHERE parent_id = ?', (inode_id,)).fetchone()[0] <= 2
+
+    def _unlink_inode(self, cursor, inode, delete_inode):
+        """Update the inode or delete it along with its directory and count it as free"""
+        if delete_inode:
+            cursor.execute('DELETE FROM inodes WHERE id = ?', (inode.id,))
+            cursor.execute('DELETE FROM entries WHERE parent_id = ?', (inode.id,))
+            self._incr_superblock_key(cursor, self._wrap_superblock_key(self._config.SB_INODE_COUNTER), -1)
+            self._incr_superblock_key(cursor, self._wrap_superblock_key(self._config.SB_USED_SIZE), -inode.size)
+        else:
+            self._put_inode(cursor, inode)
+
+    def get_inode(self, inode_id):
+        """Get an inode using an inode id
+           Return inode"""
+        return self.get_inodes([inode_id])[0]
+
+    def get_inodes(self, inode_id_list):
+        """Get a batch of inodes in one query
+           Return list of inodes with None for the missing inodes"""
+        try:
+            logger.debug("Get inodes {} for file-system {}".format(inode_id_list, self._fs_name))
+            inode_list = [None] * len(inode_id_list)
+            inode_cache = InodeCache.load(self._fs_name)
+            if inode_cache is not None:
+                epoch = inode_cache.epoch
+                for (index, inode_id) in enumerate(inode_id_list):
+                    inode_list[index] = inode_cache.get(inode_id)
+            missing_id_list = [int(inode_id_list[index]) for (index, inode) in enumerate(inode_list) if inode is None]
+            data_map = {}
+            with self._database.read() as cursor:
+                for start in range(0, len(missing_id_list), SQLITE_MAX_VARIABLES):
+                    id_list = missing_id_list[start:start+SQLITE_MAX_VARIABLES]
+                    data_map.update(cursor.execute('SELECT id, data FROM inodes WHERE id IN ({})'.format(','.join('?' * len(id_list))), id_list))
+            for (index, inode) in enumerate(inode_list):
+                data = data_map.get(int(inode_id_list[index])) if inode is None else None
+                if data is not None:
+                    inode_list[index] = Inode.from_string(str(data), self._fs_name)
+                    if inode_cache is not None:
+                        inode_cache.put(inode_list[index], epoch)
+            return inode_list
+        except Exception as e:
+            logger.error("Falied to get inodes {} for file-system {}".format(inode_id_list, self._fs_name), exc_info=True)
+            raise e
+
+    def put_inode(self, inode):
+        """Put an inode"""
+        try:
+            logger.debug("Put inode {} for file-system {}".format(inode.id, self._fs_name))
+            with self._database.write() as cursor:
+                self._put_inode(cursor, inode)
+                self._add_entries(cursor, inode)
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(inode.parent_inode_id, inode.name)
+        except Exception as e:
+            logger.error("Failed to put inode {} for file-system {}".format(inode.id, self._fs_name), exc_info=True)
+            raise e
+
+    def create_inode(self, inode):
+        """Create a new inode along with its directory entries in one transaction.
+           Fails with EEXIST if the name is taken. The inode id is counted when it is leased"""
+        try:
+            logger.debug("Create inode {} for file-system {}".format(inode.id, self._fs_name))
+            response = 'EEXIST'
+            with self._database.write() as cursor:
+                if self._get_entry(cursor, inode.parent_inode_id, inode.name) is None:
+                    self._put_inode(cursor, inode)
+                    self._add_entries(cursor, inode)
+                    response = 0
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(inode.parent_inode_id, inode.name)
+        except Exception as e:
+            logger.error("Failed to create inode {} for file-system {}".format(inode.id, self._fs_name), exc_info=True)
+            raise e
+        self._check_response(response)
+
+    def remove_entry(self, parent_inode_id, file_name, inode, delete_inode=False):
+        """Remove a directory entry and update or delete its inode in one transaction.
+           Fails with ENOTEMPTY for a directory with entries"""
+        try:
+            logger.debug("Remove entry for parent inode:{}, name:{}, delete inode:{}".format(parent_inode_id, file_name, delete_inode))
+            with self._database.write() as cursor:
+                if self._get_entry(cursor, parent_inode_id, file_name) != inode.id:
+                    response = 'ENOENT'
+                elif not self._is_empty(cursor, inode.id):
+                    response = 'ENOTEMPTY'
+                else:
+                    cursor.execute('DELETE FROM entries WHERE parent_id = ? AND name = ?', (parent_inode_id, file_name))
+                    self._unlink_inode(cursor, inode, delete_inode)
+                    response = 0
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(parent_inode_id, file_name)
+        except Exception as e:
+            logger.error("Failed to remove entry for parent inode:{}, name:{}".format(parent_inode_id, file_name), exc_info=True)
+            raise e
+        self._check_response(response)
+
+    def link_entry(self, new_parent_inode_id, new_name, inode):
+        """Add a directory entry for an existing inode and update the inode in one transaction"""
+        try:
+            logger.debug("Link inode:{} to parent inode:{}, name:{}".format(inode.id, new_parent_inode_id, new_name))
+            with self._database.write() as cursor:
+                if self._get_entry(cursor, new_parent_inode_id, new_name) is not None:
+                    response = 'EEXIST'
+                elif cursor.execute('SELECT 1 FROM inodes WHERE id = ?', (inode.id,)).fetchone() is None:
+                    response = 'ENOENT'
+                else:
+                    cursor.execute('INSERT INTO entries (parent_id, name, id) VALUES (?, ?, ?)', (new_parent_inode_id, new_name, inode.id))
+                    self._put_inode(cursor, inode)
+                    response = 0
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(new_parent_inode_id, new_name)
+        except Exception as e:
+            logger.error("Failed to link inode:{} to parent inode:{}, name:{}".format(inode.id, new_parent_inode_id, new_name), exc_info=True)
+            raise e
+        self._check_response(response)
+
+    def rename_entry(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode, replaced_inode=None, delete_replaced_inode=False):
+        """Move a directory entry and update its inode in one transaction. If an inode is given for the new name
+           its entry is replaced and the inode is updated or deleted. Fails with ENOTEMPTY for a directory with entries"""
+        try:
+            logger.debug("Rename parent inode:{}, name:{} to parent inode:{}, name:{}".format(old_parent_inode_id, old_name, new_parent_inode_id, new_name))
+            with self._database.write() as cursor:
+                replaced_inode_id = self._get_entry(cursor, new_parent_inode_id, new_name)
+                if self._get_entry(cursor, old_parent_inode_id, old_name) != inode.id:
+                    response = 'ENOENT'
+                elif replaced_inode is None and replaced_inode_id is not None:
+                    response = 'EEXIST'
+                elif replaced_inode is not None and replaced_inode_id != replaced_inode.id:
+                    response = 'ENOENT'
+                elif replaced_inode is not None and not self._is_empty(cursor, replaced_inode.id):
+                    response = 'ENOTEMPTY'
+                else:
+                    cursor.execute('DELETE FROM entries WHERE parent_id = ? AND name = ?', (old_parent_inode_id, old_name))
+                    cursor.execute('INSERT OR REPLACE INTO entries (parent_id, name, id) VALUES (?, ?, ?)', (new_parent_inode_id, new_name, inode.id))
+                    self._put_inode(cursor, inode)
+                    cursor.execute('UPDATE entries SET id = ? WHERE parent_id = ? AND name = ?', (new_parent_inode_id, inode.id, '..'))
+                    if replaced_inode is not None:
+                        self._unlink_inode(cursor, replaced_inode, delete_replaced_inode)
+                    response = 0
+            self._invalidate_inode(inode.id)
+            self._invalidate_entry(old_parent_inode_id, old_name)
+            self._invalidate_entry(new_parent_inode_id, new_name)
+            if replaced_inode is not None:
+                self._invalidate_inode(replaced_inode.id)
+        except Exception as e:
+            logger.error("Failed to rename parent inode:{}, name:{} to parent inode:{}, name:{}".format(old_parent_inode_id, old_name, new_parent_inode_id, new_name), exc_info=True)
+            raise e
+        self._check_response(response)
+
+    def update_inode(self, inode):
+        """Update an inode"""
+        return self.update_inodes([inode])
+
+    def update_inodes(self, inode_list):
+        """Update a batch of inodes in one transaction"""
+        try:
+            logger.debug("Update inodes {} for file-system {}".format([inode.id for inode in inode_list], self._fs_name))
+            with self._database.write() as cursor:
+                for inode in inode_list:
+                    self._put_inode(cursor, inode)
+            for inode in inode_list:
+                self._invalidate_inode(inode.id)
+        except Exception as e:
+            logger.error("Failed to update inodes {} for file-system {}".format([inode.id for inode in inode_list], self._fs_name), exc_info=True)
+            raise e
+
+    def scan_metadata_keys(self, batch_size=1000):
+        """Checkpoints are taken of the Redis stores. The database is a file which can be copied as is"""
+        raise NotImplementedError("Meta store Sqlite does not support checkpoints")
+
+    def dump_keys(self, key_list):
+        """Checkpoints are taken of the Redis stores"""
+        raise NotImplementedError("Meta store Sqlite does not support checkpoints")
+
+    def restore_keys(self, record_list):
+        """Checkpoints are taken of the Redis stores"""
+        raise NotImplementedError("Meta store Sqlite does not support checkpoints")
+
+    def apply_changes(self, change_list):
+        """The database is durable on its own and is not journalled"""
+        raise NotImplementedError("Meta store Sqlite does not support the journal")
+
+    def rebuild_superblock_counters(self, batch_size=1000):
+        """The database is durable on its own and is not journalled"""
+        raise NotImplementedError("Meta store Sqlite does not support the journal")
+
+    def migrate_inodes(self, batch_size=1000):
+        """Inodes are always stored in the current format
+           Return the number of inodes migrated"""
+        return 0
+
+    def migrate_directories(self, batch_size=1000):
+        """Directories are always stored in the current format
+           Return the number of directories migrated"""
+        return 0
+
+    def get_inode_id(self, parent_inode_id, file_name):
+        """Get an inode id based on parent inode id and file_name"""
+        try:
+            logger.debug("Get inode for parent:{}, name:{}".format(parent_inode_id, file_name))
+            dentry_cache = DentryCache.load(self._fs_name)
+            if dentry_cache is not None:
+                (cached, inode_id) = dentry_cache.get(parent_inode_id, file_name)
+                if cached:
+                    return inode_id
+                epoch = dentry_cache.epoch
+            with self._database.read() as cursor:
+                inode_id = self._get_entry(cursor, parent_inode_id, file_name)
+            if dentry_cache is not None:
+                dentry_cache.put(parent_inode_id, file_name, inode_id, epoch)
+            return inode_id
+        except Exception as e:
+            logger.error("Failed to get inode for parent:{}, name:{}".format(parent_inode_id, file_name), exc_info=True)
+            raise e
+
+    def delete_inode(self, inode_id):
+        """Delete an inode based on inode id"""
+        try:
+            logger.debug("Delete inode:{}".format(inode_id))
+            inode = self.get_inode(inode_id)
+            with self._database.write() as cursor:
+                cursor.execute('DELETE FROM inodes WHERE id = ?', (inode_id,))
+                cursor.execute('DELETE FROM entries WHERE parent_id = ?', (inode_id,))
+                if inode is not None:
+                    cursor.execute('DELETE FROM entries WHERE parent_id = ? AND name = ?', (inode.parent_inode_id, inode.name))
+            self._invalidate_inode(inode_id)
+            self._invalidate_directory(inode_id)
+            if inode is not None:
+                self._invalidate_entry(inode.parent_inode_id, inode.name)
+        except Exception as e:
+            logger.error("Failed to delete inode:{}".format(inode_id), exc_info=True)
+            raise e
+
+    def delete_inodes(self, inode_id_list):
+        """Delete a batch of unlinked inodes along with their directories in one transaction.
+           Their names were removed when they were unlinked"""
+        try:
+            logger.debug("Delete inodes:{}".format(inode_id_list))
+            with self._database.write() as cursor:
+                cursor.executemany('DELETE FROM inodes WHERE id = ?', [(inode_id,) for inode_id in inode_id_list])
+                cursor.executemany('DELETE FROM entries WHERE parent_id = ?', [(inode_id,) for inode_id in inode_id_list])
+            for inode_id in inode_id_list:
+                self._invalidate_inode(inode_id)
+                self._invalidate_directory(inode_id)
+        except Exception as e:
+            logger.error("Failed to delete inodes:{}".format(inode_id_list), exc_info=True)
+            raise e
+
+    def build_index(self, parent_inode_id, inode_id, file_name):
+        """Build an index from file_name to inode_id. The directory entries are the index"""
+        try:
+            logger.debug("Build index for parent inode:{}, inode:{}, file_name:{}".format(parent_inode_id, inode_id, file_name))
+            with self._database.write() as cursor:
+                cursor.execute('INSERT OR REPLACE INTO entries (parent_id, name, id) VALUES (?, ?, ?)', (parent_inode_id, file_name, inode_id))
+            self._invalidate_entry(parent_inode_id, file_name)
+        except Exception as e:
+            logger.error("Failed to build index for parent inode:{}, inode:{}, file_name:{}".format(parent_inode_id, inode_id, file_name), exc_info=True)
+            raise e
+
+    def clean_index(self, parent_inode_id, file_name):
+        """Clean an index based on parent node id and file name"""
+        try:
+            logger.debug("Clean index for parent inode:{}, file-name:{}".format(parent_inode_id, file_name))
+            with self._database.write() as cursor:
+                cursor.execute('DELETE FROM entries WHERE parent_id = ? AND name = ?', (parent_inode_id, file_name))
+            self._invalidate_entry(parent_inode_id, file_name)
+        except Exception as e:
+            logger.error("Failed to clean index for parent inode:{}, file-name:{}".format(parent_inode_id, file_name), exc_info=True)
+            raise e
+
+    def get_inode_id_list(self, inode_id, offset=0):
+        """Get inode id list for inode"""
+        for (child_inode_id, file_name, next_offset) in self.scan_inode_id_list(inode_id, offset):
+            yield(child_inode_id, file_name)
+
+    def scan_inode_id_list(self, inode_id, offset=0):
+        """Scan the inode id list for inode starting at a readdir offset. The offset is the position of
+           the last entry returned. Positions are never reused, so entries added or removed meanwhile do not move it.
+           Yields the inode id, name and the offset of the next entry"""
+        try:
+            logger.debug("Scan inode:{} list at offset:{}".format(inode_id, offset))
+            while True:
+                with self._database.read() as cursor:
+                    row_list = cursor.execute('SELECT position, id, name FROM entries WHERE parent_id = ? AND position > ? ORDER BY position LIMIT ?',
+                                              (inode_id, offset, DIR_SCAN_COUNT)).fetchall()
+                for (offset, child_inode_id, file_name) in row_list:
+                    yield(child_inode_id, file_name, offset)
+                if len(row_list) < DIR_SCAN_COUNT:
+                    break
+        except Exception as e:
+            logger.error("Error in fetching inode id list for inode {}".format(inode_id), exc_info=True)
+            raise e
+
+    def add_inode_id_to_list(self, inode_id, new_id, new_name):
+        """Add new id to inode id list"""
+        return self.build_index(inode_id, new_id, new_name)
+
+    def remove_inode_id_from_list(self, inode_id, existing_id, existing_name):
+        """Remove existing id from inode list"""
+        return self.clean_index(inode_id, existing_name)
+
+    def delete_inode_id_list(self, inode_id):
+        """Delete inode id list"""
+        try:
+            logger.debug("Delete inode:{} list".format(inode_id))
+            with self._database.write() as cursor:
+                cursor.execute('DELETE FROM entries WHERE parent_id = ?', (inode_id,))
+            self._invalidate_directory(inode_id)
+        except Exception as e:
+            logger.error("Failed to Delete inode list for inode:{}".format(inode_id), exc_info=True)
+            raise e
+
+    def length_inode_id_list(self, inode_id):
+        """Get the length of the inode id list"""
+        try:
+            logger.debug("Get length of inode:{} list".format(inode_id))
+            with self._database.read() as cursor:
+                return cursor.execute('SELECT COUNT(*) FROM entries WHERE parent_id = ?', (inode_id,)).fetchone()[0]
+        except Exception as e:
+            logger.error("Get length of inode:{} list".format(inode_id), exc_info=True)
+            raise e
+
 class MetaStoreFactory(object):
 
     __store_classes = {
           'Redis': RedisMetaStore,
+          'ShardedRedis': ShardedRedisMetaStore,
+          'Sqlite': SqliteMetaStore,
     }
 
     @staticmethod
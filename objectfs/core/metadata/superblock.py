@@ -16,7 +16,9 @@
 from __future__ import absolute_import, print_function
 import llfuse
 import errno
+import threading
 from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.common.objectfsthread import ObjectFSThread
 from objectfs.settings import Settings
 settings = Settings()
 import logging
@@ -30,6 +32,7 @@ class SuperBlock(object):
     def __init__(self, name):
         """Init the class object"""
         self._name = name
+        self._config = settings.config
         self._meta_store = MetaStoreFactory.create_store(name)
         self._max_inodes = self._wrap_with_delimiter(settings.SB_MAX_INODES)
         self._inode_counter = self._wrap_with_delimiter(settings.SB_INODE_COUNTER)
@@ -37,6 +40,12 @@ class SuperBlock(object):
         self._free_inode_id = self._wrap_with_delimiter(settings.SB_FREE_INODE_ID)
         self._total_size = self._wrap_with_delimiter(settings.SB_TOTAL_SIZE)
         self._used_size = self._wrap_with_delimiter(settings.SB_USED_SIZE)
+        self._free_inode_ranges = self._wrap_with_delimiter(settings.SB_FREE_INODE_RANGES)
+        # inode ids leased by this mount
+        self._lease_lock = threading.Lock()
+        self._next_inode_id = None
+        self._last_inode_id = None
+        self._returned_inode_id_list = []
     
     def init_superblock(self, used_size=0, free_inode_id=1, inode_counter=1, block_size=0):
         """Init the superblock with pre-set values"""
@@ -55,7 +64,7 @@ class SuperBlock(object):
         return [self._max_inodes, self._inode_counter, self._block_size, self._free_inode_id, self._total_size, self._used_size]
 
     def delete_superblock(self):
-        self._meta_store.delete_superblock_key(self._generate_key_list())
+        self._meta_store.delete_superblock_key(self._generate_key_list()+[self._free_inode_ranges])
     
     def exists(self):
         """Check if all the values have been intialized or not"""
@@ -89,10 +98,45 @@ class SuperBlock(object):
         self._meta_store.set_superblock_key(self._free_inode_id, value)
 
     def fetch_free_inode_id(self):
-        # call this here since we have to fetch an unique id everytime we create one
-        self.incr_inode_counter()
-        logger.debug("Fetch next free inode number")
-        return self._meta_store.incr_superblock_key(self._free_inode_id, 1)
+        """Fetch an inode id from the ids leased by this mount. A new range is leased when they run out"""
+        with self._lease_lock:
+            if self._returned_inode_id_list:
+                return self._returned_inode_id_list.pop()
+            if self._next_inode_id is None or self._next_inode_id > self._last_inode_id:
+                # the inode counter is incremented by the leased ids
+                (self._next_inode_id, self._last_inode_id) = self._meta_store.lease_inode_ids(self._config.FS_INODE_LEASE_SIZE)
+                logger.debug("Leased inode ids {} to {}".format(self._next_inode_id, self._last_inode_id))
+            logger.debug("Fetch next free inode number")
+            inode_id = self._next_inode_id
+            self._next_inode_id += 1
+            return inode_id
+
+    @property
+    def leased_inode_count(self):
+        """Number of inode ids leased by this mount which have not been used yet"""
+        with self._lease_lock:
+            leased_inode_count = len(self._returned_inode_id_list)
+            if self._next_inode_id is not None:
+                leased_inode_count += self._last_inode_id - self._next_inode_id + 1
+            return leased_inode_count
+
+    def return_free_inode_id(self, inode_id):
+        """Return an inode id which was not used, for example when the create failed"""
+        with self._lease_lock:
+            self._returned_inode_id_list.append(inode_id)
+
+    def release_inode_ids(self):
+        """Return the unused inode ids leased by this mount. Called on unmount"""
+        with self._lease_lock:
+            inode_id_range_list = [(inode_id, inode_id) for inode_id in self._returned_inode_id_list]
+            if self._next_inode_id is not None and self._next_inode_id <= self._last_inode_id:
+                inode_id_range_list.append((self._next_inode_id, self._last_inode_id))
+            if inode_id_range_list:
+                logger.debug("Return inode ids {}".format(inode_id_range_list))
+                self._meta_store.return_inode_ids(inode_id_range_list)
+            self._next_inode_id = None
+            self._last_inode_id = None
+            self._returned_inode_id_list = []
 
     @property
     def inode_counter(self):
@@ -154,3 +198,127 @@ class SuperBlock(object):
     def decr_used_size(self, value):
         logger.debug("Decrease used size by {}".format(value))
         self._meta_store.decr_superblock_key(self._used_size, value)
+
+class CachedSuperBlock(SuperBlock):
+    """Superblock for a mount. Changes to the used size and the inode counter are accumulated
+    locally and flushed periodically, and the values are read from a snapshot taken at the flush"""
+
+    def __init__(self, name):
+        super(CachedSuperBlock, self).__init__(name)
+        self._delta_lock = threading.Lock()
+        self._used_size_delta = 0
+        self._inode_counter_delta = 0
+        # changes being flushed, counted until the snapshot which includes them is installed
+        self._flushing_used_size = 0
+        self._flushing_inode_counter = 0
+        # values of the superblock keys at the last flush
+        self._snapshot = None
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flush_thread = None
+
+    def start(self):
+        """Start flushing the changes in the background"""
+        self._flush_thread = ObjectFSThread(target=self._run_flush, name='SuperBlockFlush')
+        self._flush_thread.daemon = True
+        self._flush_thread.start()
+
+    def stop(self):
+        """Stop the background flush and flush the remaining changes"""
+        flush_thread = self._flush_thread
+        self._flush_thread = None
+        if flush_thread is not None:
+            self._flush_event.set()
+            flush_thread.join()
+        self.flush()
+
+    def _run_flush(self):
+        """Flush on every interval or when woken up by a large change"""
+        while self._flush_thread is not None:
+            self._flush_event.wait(self._config.FS_SB_FLUSH_INTERVAL)
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # the changes are kept and flushed with the next try
+                logger.error("Failed to flush superblock for file-system {}".format(self._name), exc_info=True)
+
+    def flush(self):
+        """Publish the local changes and refresh the snapshot in one round trip"""
+        with self._flush_lock:
+            with self._delta_lock:
+                (used_size_delta, inode_counter_delta) = (self._used_size_delta, self._inode_counter_delta)
+                self._flushing_used_size = used_size_delta
+                self._flushing_inode_counter = inode_counter_delta
+                self._used_size_delta = 0
+                self._inode_counter_delta = 0
+            try:
+                value_list = self._meta_store.update_superblock_keys({self._used_size: used_size_delta, self._inode_counter: inode_counter_delta},
+                                                                     self._generate_key_list())
+            except Exception as e:
+                with self._delta_lock:
+                    self._used_size_delta += used_size_delta
+                    self._inode_counter_delta += inode_counter_delta
+                    self._flushing_used_size = 0
+                    self._flushing_inode_counter = 0
+                raise e
+            with self._delta_lock:
+                self._snapshot = dict(zip(self._generate_key_list(), value_list))
+                self._flushing_used_size = 0
+                self._flushing_inode_counter = 0
+
+    def _get_snapshot_value(self, key):
+        if self._snapshot is None:
+            self.flush()
+        return self._snapshot[key]
+
+    @property
+    def max_inodes(self):
+        return self._get_snapshot_value(self._max_inodes)
+
+    @property
+    def block_size(self):
+        return self._get_snapshot_value(self._block_size)
+
+    @property
+    def total_size(self):
+        total_size = self._get_snapshot_value(self._total_size)
+        return total_size if total_size else 0
+
+    @property
+    def inode_counter(self):
+        self._get_snapshot_value(self._inode_counter)
+        with self._delta_lock:
+            return (self._snapshot[self._inode_counter] or 0) + self._flushing_inode_counter + self._inode_counter_delta
+
+    @property
+    def used_size(self):
+        self._get_snapshot_value(self._used_size)
+        with self._delta_lock:
+            return (self._snapshot[self._used_size] or 0) + self._flushing_used_size + self._used_size_delta
+
+    def decr_inode_counter(self):
+        logger.debug("Decrement inode counter")
+        with self._delta_lock:
+            self._inode_counter_delta -= 1
+
+    def incr_used_size(self, value):
+        total_size = self.total_size
+        # the other mounts' changes are not in the snapshot so
+        # close to the limit the used size is checked in Redis
+        if value > 0 and self.used_size + value > total_size * self._config.FS_SB_SOFT_LIMIT:
+            self.flush()
+        with self._delta_lock:
+            used_size = (self._snapshot[self._used_size] or 0) + self._flushing_used_size + self._used_size_delta
+            if value > 0 and used_size + value > total_size:
+                logger.warn("No space left on device")
+                raise llfuse.FUSEError(errno.ENOSPC)
+            logger.debug("Increase used size by {}".format(value))
+            self._used_size_delta += value
+            if abs(self._used_size_delta) >= self._config.FS_SB_FLUSH_THRESHOLD:
+                self._flush_event.set()
+
+    def decr_used_size(self, value):
+        logger.debug("Decrease used size by {}".format(value))
+        with self._delta_lock:
+            self._used_size_delta -= value
@@ -23,24 +23,31 @@ import stat
 import copy
 import math
 import collections
+from itertools import count
 from sets import Set
 from time import time, sleep
 from llfuse import FUSEError
 from argparse import ArgumentParser
-from multiprocessing import Pool
 from multiprocessing.sharedctypes import Value
 from objectfs.core.data.objectstore import ObjectStoreFactory
 from objectfs.core.metadata.metastore import MetaStoreFactory
 from objectfs.core.cache.cachestore import CacheStoreFactory
 from objectfs.core.metadata.inode import Inode
-from objectfs.core.metadata.superblock import SuperBlock
-from objectfs.core.cache.cachequeue import CacheQueue
+from objectfs.core.metadata.inodecount import InodeCountTable
+from objectfs.core.metadata.inodesession import InodeSession, inode_session
+from objectfs.core.metadata.inodecache import InodeCache, DentryCache
+from objectfs.core.metadata.directoryhandle import DirectoryHandle
+from objectfs.core.metadata.journal import MetaJournal
+from objectfs.core.metadata.superblock import CachedSuperBlock
+from objectfs.core.cache.ioscheduler import IOScheduler, WRITEBACK, MERGE
+from objectfs.core.cache.blockfetcher import BlockFetcher
+from objectfs.core.cache.readahead import Readahead
 from objectfs.core.common.fragmentmap import FragmentMap
 from objectfs.core.common.blockset import CleanSet, DirtySet
 from objectfs.core.common.mergequeue import MergeQueue
-from objectfs.core.common.snslistenser import SnsHttpFactory
 from objectfs.core.common.objectfsthread import ObjectFSThread
-from objectfs.core.cache.cachetask import upload_object_block, prefetch_object_block, multipart_upload_object_block
+from objectfs.core.common.reclaimer import InodeReclaimer
+from objectfs.core.cache.cachetask import upload_object_block, multipart_upload_object_block, merge_log_objects
 from objectfs.settings import Settings
 settings = Settings()
 import logging
@@ -56,45 +63,120 @@ class ObjectFsOperations(llfuse.Operations):
         """Setup the filesystem"""
         super(ObjectFsOperations, self).__init__()
         self._fs_name = fs_name
+        # typed settings read on the I/O path
+        self._config = settings.config
         # loading the meta-store
         self._meta_store = MetaStoreFactory.create_store(self.fs_name)
-        # loading the superblock
-        self._super_block = SuperBlock(self.fs_name)
+        # loading the superblock. Counter changes are flushed in the background once mounted
+        self._super_block = CachedSuperBlock(self.fs_name)
         # loading the data-store aka object-store
         self._data_store = ObjectStoreFactory.create_store(self.fs_name)
         # loading the cache store
         self._cache_store = CacheStoreFactory.create_store(self.fs_name)
-        # load the cache queue
-        # TODO needs to be renamed
-        self._cache_queue = CacheQueue(self.fs_name)
+        # the data of deleted files is removed in the background once mounted
+        self._reclaimer = InodeReclaimer(self.fs_name, self._data_store, self._cache_store)
         self._cache_flag = True
+        # the block size does not change once the file-system is made
+        self._block_size = None
+        # listing cursors of the open directories by handle
+        self._dir_handle_map = {}
+        self._dir_handle_counter = count(1)
+        # lookup and open counts of the inodes referenced by the kernel through this mount
+        self._inode_counts = InodeCountTable()
 
     @property
     def fs_name(self):
         return self._fs_name
     
+    def _get_inode(self, inode_id):
+        """Get an inode through the inode session of the current operation"""
+        session = InodeSession.current()
+        if session is not None:
+            return session.get_inode(inode_id)
+        return self._meta_store.get_inode(inode_id)
+
+    def _put_inode(self, inode):
+        """Create a new inode along with its directory entries in one atomic step"""
+        self._meta_store.create_inode(inode)
+        session = InodeSession.current()
+        if session is not None:
+            session.attach(inode)
+
+    def _mark_written(self, inode):
+        """Drop the pending changes of an inode once a namespace mutation has written it"""
+        session = InodeSession.current()
+        if session is not None:
+            session.mark_clean(inode.id)
+
+    def _discard_inode(self, inode):
+        """Drop an inode deleted by a namespace mutation and remove its data"""
+        session = InodeSession.current()
+        if session is not None:
+            session.discard(inode.id)
+        # remove object from the object-store if it is a file
+        if stat.S_ISREG(inode.mode):
+            self._reclaimer.reclaim(inode.id, inode.size)
 
     def setup_root_inode(self):
         """Setup root inode"""
         logger.debug("Setting up ROOT inode")
         root_inode = Inode(self.fs_name, llfuse.ROOT_INODE, DIR_MODE, parent_inode_id=llfuse.ROOT_INODE)
-        self._meta_store.add_inode_id_to_list(llfuse.ROOT_INODE, llfuse.ROOT_INODE, '..')
-        self._meta_store.add_inode_id_to_list(llfuse.ROOT_INODE, llfuse.ROOT_INODE, '.')
+        # the . and .. entries are added along with the inode
         self._meta_store.put_inode(root_inode)
 
+    def init(self):
+        """Called when the filesystem is mounted and starts handling requests"""
+        # decoded inodes are only cached in the mount process
+        InodeCache.enable(self.fs_name)
+        DentryCache.enable(self.fs_name)
+        if self._config.FS_JOURNAL_ENABLED:
+            MetaJournal.enable(self.fs_name, self._data_store)
+        self._super_block.start()
+        self._reclaimer.start()
+
     def destroy(self):
         """Called when filesystem exits"""
-        pass
+        InodeCache.disable(self.fs_name)
+        DentryCache.disable(self.fs_name)
+        # store the changes still buffered in the journal
+        MetaJournal.disable(self.fs_name)
+        # remove the data of the files deleted since the last reclaim
+        self._reclaimer.stop()
+        # unused leased inode ids can be leased by other mounts
+        self._super_block.release_inode_ids()
+        self._super_block.stop()
         # KL TODO remove this after testing
         # cleaning memory store for now
         # self._meta_store._clean_store()
         # delete all the objects from the object store
         # super(ObjectFs, self).__del__()
 
+    @property
+    def block_size(self):
+        if self._block_size is None:
+            self._block_size = self._super_block.block_size
+        return self._block_size
+
+    @inode_session
     def getattr(self, inode_id, ctx=None):
         """Return attr"""
         logger.debug("GETATTR for inode:{}".format(inode_id))
-        inode = self._meta_store.get_inode(inode_id)
+        # entry attributes are cached along with the inode unless it was changed in this operation
+        inode_cache = InodeCache.load(self.fs_name)
+        if inode_cache is not None and not InodeSession.current().is_dirty(inode_id):
+            entry = inode_cache.get_entry(inode_id)
+            if entry is not None:
+                return entry
+            epoch = inode_cache.epoch
+        else:
+            inode_cache = None
+        entry = self._build_entry(self._get_inode(inode_id))
+        if inode_cache is not None:
+            inode_cache.put_entry(inode_id, entry, epoch)
+        return entry
+
+    def _build_entry(self, inode):
+        """Build the entry attributes for an inode"""
         entry = llfuse.EntryAttributes()
         # unique inode number
         entry.st_ino = inode.id
@@ -107,7 +189,7 @@ class ObjectFsOperations(llfuse.Operations):
         entry.st_mtime_ns = inode.mtime
         entry.st_rdev = inode.rdev
         entry.st_nlink = inode.nlink
-        entry.st_blksize = self._super_block.block_size
+        entry.st_blksize = self.block_size
         entry.st_blocks = math.ceil(entry.st_size / entry.st_blksize)
         # generation number for this entry
         # KL TODO this might be an issue for NFS
@@ -118,10 +200,11 @@ class ObjectFsOperations(llfuse.Operations):
         entry.attr_timeout = 10
         return entry
     
+    @inode_session
     def setattr(self, inode_id, attr, fields, fh, ctx):
         """Change the attributes of an inode"""
         logger.debug("SETATTR inode:{}".format(inode_id))
-        inode = self._meta_store.get_inode(inode_id)
+        inode = self._get_inode(inode_id)
         
         if fields.update_mode:
             inode.mode = attr.st_mode
@@ -143,74 +226,98 @@ class ObjectFsOperations(llfuse.Operations):
 
         return self.getattr(inode.id)
 
+    @inode_session
     def lookup(self, parent_inode_id, name, ctx=None):
         """Lookup the file using name and parent inode"""
         logger.debug("LOOKUP entry for parent inode:{},name:{}".format(parent_inode_id, name))
         if name == '.':
             inode_id = parent_inode_id
         elif name == '..':
-            inode_id = self._meta_store.get_inode(parent_inode_id).id
+            inode_id = self._get_inode(parent_inode_id).id
         else: 
             inode_id = self._meta_store.get_inode_id(parent_inode_id, name)
             if inode_id is None:
-                logger.error("Entry not found for parent inode:{},name:{} in LOOKUP".format(parent_inode_id, name))
+                # probes for missing names are common, build tools and imports search many paths
+                logger.debug("Entry not found for parent inode:{},name:{} in LOOKUP".format(parent_inode_id, name))
                 raise llfuse.FUSEError(errno.ENOENT)
-            self._meta_store.get_inode(inode_id).lookup_count += 1
+        entry = self.getattr(inode_id, ctx)
         # increment lookup counter when we lookup file/folder
-        return self.getattr(inode_id, ctx)
+        self._inode_counts.incr_lookup(inode_id)
+        return entry
     
     def opendir(self, inode_id, ctx):
+        """Open a directory. Return a new handle with its own listing cursor"""
         logger.debug("OPENDIR inode:{}".format(inode_id))
-        return inode_id
-    
+        inode_cache = InodeCache.load(self.fs_name)
+        # directories larger than the cache would only evict each other
+        if self._config.META_OPENDIR_PREFETCH and inode_cache is not None and self._meta_store.length_inode_id_list(inode_id) <= self._config.META_INODE_CACHE_SIZE:
+            prefetch_thread = ObjectFSThread(target=self._prefetch_directory, args=(inode_id,), name='OpendirPrefetch')
+            prefetch_thread.daemon = True
+            prefetch_thread.start()
+        dir_handle = next(self._dir_handle_counter)
+        self._dir_handle_map[dir_handle] = DirectoryHandle(self._meta_store, inode_id)
+        return dir_handle
+
+    def releasedir(self, dir_handle):
+        """Release a directory handle and its listing cursor"""
+        logger.debug("RELEASEDIR handle:{}".format(dir_handle))
+        self._dir_handle_map.pop(dir_handle, None)
+
+    def _prefetch_directory(self, inode_id):
+        """Fetch the child inodes of a directory into the inode cache"""
+        try:
+            for entry in DirectoryHandle(self._meta_store, inode_id).read(0):
+                continue
+        except Exception as e:
+            # only a prefetch, readdir will fetch the inodes again
+            logger.warn("Failed to prefetch directory inode:{}".format(inode_id), exc_info=True)
+
+    @inode_session
     def open(self, inode_id, flags, ctx):
         """Open the file using inode id"""
         logger.debug("OPEN inode:{}".format(inode_id))
         # increment open counter when we open file
-        self._meta_store.get_inode(inode_id).open_count += 1
-        # increment lookup counter when we open file
-        # self._meta_store.get_inode(inode_id).lookup_count += 1
+        self._inode_counts.incr_open(inode_id)
+        # the cached blocks are not evicted under an open file
+        self._cache_store.pin_inode(inode_id)
         return inode_id
     
+    @inode_session
     def create(self, parent_inode_id, name, mode, flags, ctx):
         """Create a file with permissions mode and open with flags"""
         logger.debug("CREATE parent inode:{},name:{}".format(parent_inode_id, name))
         entry = self._create(parent_inode_id, name, mode, flags, ctx)
+        # open counter is incremented when we create file
+        self._inode_counts.incr_open(entry.st_ino)
+        self._cache_store.pin_inode(entry.st_ino)
         return (entry.st_ino, entry)
     
     def _create(self, parent_inode_id, name, mode, ctx, rdev=0, target=None):
         """Common create function"""
-        # check if file/dir exists already
-        if self._meta_store.get_inode_id(parent_inode_id, name):
-            raise llfuse.FUSEError(errno.EEXIST)
         # check if the inode has a parent node or not
         if self.getattr(parent_inode_id).st_nlink == 0:
             logger.error("Attempting to create entry {} with unlinked parent node {}".format(name, parent_inode_id))
             raise FUSEError(errno.EINVAL)
         # get a new node id
         new_inode_id = self._super_block.fetch_free_inode_id()
-        # creating entry in inode map
         new_inode = Inode(self.fs_name, new_inode_id, mode, name, parent_inode_id=parent_inode_id, rdev=0, target=target)
-        self._meta_store.put_inode(new_inode)
-        # add the inode in the base directory list
-        self._meta_store.add_inode_id_to_list(parent_inode_id, new_inode.id, name)
-        # check if the inode is a file or a directory
-        if stat.S_ISREG(new_inode.mode):
-            # creating an empty object
-            # if self._cache_flag:
-                # self._cache_store.put_inode(new_inode_id, '')
-            # else:
-                # self._data_store.put_dnode(new_inode_id, '')
-            # increment open counter when we create file
-            self._meta_store.get_inode(new_inode_id).open_count += 1
-        if stat.S_ISDIR(new_inode.mode):
-            # insert . and .. in the inode id list
-            self._meta_store.add_inode_id_to_list(new_inode_id, new_inode_id, '.')
-            self._meta_store.add_inode_id_to_list(new_inode_id, parent_inode_id, '..')
-        # increment lookup counter when we create, symlink, mkdir, mknod file/folder
-        self._meta_store.get_inode(new_inode_id).lookup_count += 1
+        # creating entry in inode map and adding it to the base directory, along with . and .. for directories.
+        # Fails if the file/dir exists already
+        try:
+            self._put_inode(new_inode)
+        except llfuse.FUSEError as e:
+            self._super_block.return_free_inode_id(new_inode_id)
+            raise
+        # lookup counter is incremented when we create, symlink, mkdir, mknod file/folder
+        self._inode_counts.incr_lookup(new_inode_id)
+        # creating an empty object
+        # if self._cache_flag:
+            # self._cache_store.put_inode(new_inode_id, '')
+        # else:
+            # self._data_store.put_dnode(new_inode_id, '')
         return self.getattr(new_inode.id)
     
+    @inode_session
     def symlink(self, parent_inode_id, name, target, ctx):
         """Create a symbolic link"""
         mode = (stat.S_IFLNK | stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR |
@@ -218,14 +325,18 @@ class ObjectFsOperations(llfuse.Operations):
                 stat.S_IWOTH | stat.S_IXOTH)
         return self._create(parent_inode_id, name, mode, ctx, target=target)
 
-    def readdir(self, inode_id, off):
+    def readdir(self, dir_handle, off):
         """Returns name, attr, next"""
-        logger.debug("READDIR inode:{}, offset:{}".format(inode_id, off))
-        # iterate over the inode_id_list to return all the inode id's in the root directory
-        for (list_offset, (inode_child_id, file_name)) in enumerate(self._meta_store.get_inode_id_list(inode_id, offset=off)):
-            logger.debug("READDIR yield: file:{}, child inode:{}, offset:{}".format(file_name, inode_child_id, list_offset+off+1))
-            yield(file_name, self.getattr(inode_child_id), list_offset+off+1)
+        logger.debug("READDIR handle:{}, offset:{}".format(dir_handle, off))
+        # continue the scan pinned to the handle from the offset of the last entry returned
+        for (file_name, inode, next_offset) in self._dir_handle_map[dir_handle].read(off):
+            # removed since the directory was scanned
+            if inode is None:
+                continue
+            logger.debug("READDIR yield: file:{}, child inode:{}, offset:{}".format(file_name, inode.id, next_offset))
+            yield(file_name, self._build_entry(inode), next_offset)
     
+    @inode_session
     def mkdir(self, parent_inode_id, name, mode, ctx):
         """Create a directory"""
         logger.debug("MKDIR parent inode:{}, name:{}".format(parent_inode_id, name))
@@ -233,6 +344,7 @@ class ObjectFsOperations(llfuse.Operations):
             raise llfuse.FUSEError(errno.ENAMETOOLONG)
         return self._create(parent_inode_id, name, mode, ctx)
     
+    @inode_session
     def rmdir(self, parent_inode_id, name, ctx):
         """Remove directory"""
         logger.debug("RMDIR parent inode {}, name:{}".format(parent_inode_id, name))
@@ -246,40 +358,20 @@ class ObjectFsOperations(llfuse.Operations):
     
     def _remove(self, parent_inode_id, name, entry):
         """Common remove function"""
-        # count the number of nodes which this node points to
-        if self._meta_store.length_inode_id_list(entry.st_ino) > 2:
-            raise llfuse.FUSEError(errno.ENOTEMPTY)
-        
-        # if entry.st_nlink > 1 and self._meta_store.get_inode(entry.st_ino).open_count == 0:
-            # self._meta_store.clean_index(parent_inode_id, name)
-            # # KL TODO check if this works
-            # self.memory_store.get_inode(entry.st_ino).nlink -= 1
-
-        # remove inode_id from the inode_list of the parent_inode
-        self._meta_store.remove_inode_id_from_list(parent_inode_id, entry.st_ino, name)
-        # remove the name from the lookup index
-        self._meta_store.clean_index(parent_inode_id, name)
-        self._meta_store.get_inode(entry.st_ino).nlink -= 1
-        
-        # only remove the inode when there is a single nlink to the inode
-        if entry.st_nlink == 1 and self._meta_store.get_inode(entry.st_ino).lookup_count == 0:
-            inode = self._meta_store.get_inode(entry.st_ino)
-            # fetch parent inode id of the inode
-            parent_inode_id = inode.parent_inode_id
-            
-            # remove object from the object-store if it is a file
-            if stat.S_ISREG(inode.mode):
-                self._data_store.delete_dnode(inode.id)
-                if self._cache_flag:
-                    self._cache_store.remove_inode(inode.id)
-            # remove inode from memory store
-            self._meta_store.delete_inode(entry.st_ino)
-            # decrease the size of the inode removed from used size
-            self._super_block.decr_used_size(inode.size)
-            # reduce the inode counter
-            self._super_block.decr_inode_counter()
-        
+        inode = self._get_inode(entry.st_ino)
+        inode.nlink -= 1
+        # only remove the inode when there is a single nlink to the inode. An inode still
+        # referenced by the kernel is kept without a name and removed by forget
+        delete_inode = inode.nlink == 0 and not self._inode_counts.is_referenced(inode.id)
+        # remove the name from the parent and update or remove the inode, along with the
+        # used size and inode counter, in one step. Fails if a directory is not empty
+        self._meta_store.remove_entry(parent_inode_id, name, inode, delete_inode)
+        if delete_inode:
+            self._discard_inode(inode)
+        else:
+            self._mark_written(inode)
 
+    @inode_session
     def read(self, inode_id, off, size):
         """Read a file"""
         logger.debug("READ inode:{}, offset:{}, size:{}".format(inode_id, off, size))
@@ -287,17 +379,23 @@ class ObjectFsOperations(llfuse.Operations):
         # inode = self._meta_store.get_inode(inode_id)
         # fetch object from object-store and read object
     
+    @inode_session
     def readlink(self, inode_id, ctx):
         """Read the link for a file"""
-        return self._meta_store.get_inode(inode_id).target
+        return self._get_inode(inode_id).target
 
+    @inode_session
     def write(self, inode_id, offset, buf):
         """Write a file"""
         logger.debug("WRITE inode:{}, offset:{}, buffer length:{}".format(inode_id, offset, len(buf)))
 
+    @inode_session
     def release(self, inode_id):
         """Relase a file"""
         logger.debug("RELEASE inode:{}".format(inode_id))
+        # the kernel holds a lookup reference while the file is open, so an unlinked file is removed by forget
+        self._inode_counts.decr_open(inode_id)
+        self._cache_store.unpin_inode(inode_id)
         # # self._meta_store.get_inode(inode_id).nlink -= 1
         # # KL TODO not sure if this is correct
         # # self._meta_store.clean_index(inode.parent_inode_id, inode.name)
@@ -305,20 +403,24 @@ class ObjectFsOperations(llfuse.Operations):
             # self._meta_store.delete_inode(inode.id)
             # # TODO remove from object-store??
     
+    @inode_session
     def link(self, inode_id, new_parent_inode_id, new_name, ctx):
         logger.debug("LINK inode:{}, new parent:{}, new name:{}".format(inode_id, new_parent_inode_id, new_name))
         parent_entry = self.getattr(new_parent_inode_id)
         if parent_entry.st_nlink == 0:
             logger.error('Attempted to create entry {} with unlinked parent {}'.format(new_name, parent_inode_id))
             raise FUSEError(errno.EINVAL)
-        # add the lookup index for the new name
-        self._meta_store.build_index(new_parent_inode_id, inode_id, new_name)
-        self._meta_store.add_inode_id_to_list(new_parent_inode_id, inode_id, new_name)
-        self._meta_store.get_inode(inode_id).nlink +=1
+        inode = self._get_inode(inode_id)
+        inode.nlink +=1
+        # add the new name to the parent directory and update the inode in one step
+        self._meta_store.link_entry(new_parent_inode_id, new_name, inode)
+        self._mark_written(inode)
+        entry = self.getattr(inode_id)
         # incremeting lookup count
-        self._meta_store.get_inode(inode_id).lookup_count += 1
-        return self.getattr(inode_id)
+        self._inode_counts.incr_lookup(inode_id)
+        return entry
 
+    @inode_session
     def unlink(self, parent_inode_id, name, ctx):
         logger.debug("UNLINK parent inode{}, name:{}".format(parent_inode_id, name))
         entry = self._get_entry(parent_inode_id, name, ctx)
@@ -335,6 +437,7 @@ class ObjectFsOperations(llfuse.Operations):
             raise llfuse.FUSEError(errno.ENOENT)
         return self.getattr(inode_id, ctx)
 
+    @inode_session
     def rename(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, ctx):
         """Rename directories"""
         logger.debug("RENAME parent inode:{}, name:{} to parent inode:{}, name:{}".format(old_parent_inode_id, old_name, new_parent_inode_id, new_name))
@@ -349,52 +452,41 @@ class ObjectFsOperations(llfuse.Operations):
             target_exists = True
 
         if target_exists:
+            # both names are links to the same inode
+            if old_entry.st_ino == new_entry.st_ino:
+                return
             self._replace(old_parent_inode_id, old_name, new_parent_inode_id, new_name, old_entry, new_entry)
         else:
-            # remove inode from old parent id list
-            self._meta_store.remove_inode_id_from_list(old_parent_inode_id, old_entry.st_ino, old_name)
-            # add inode to new parent id list
-            self._meta_store.add_inode_id_to_list(new_parent_inode_id, old_entry.st_ino, new_name)
-            # update the name stored in inode
-            inode = self._meta_store.get_inode(old_entry.st_ino)
+            # update the name and parent stored in inode
+            inode = self._get_inode(old_entry.st_ino)
             inode.name = new_name
-            # remove old lookup key
-            self._meta_store.clean_index(old_parent_inode_id, old_name)
-            # insert the new lookup key
-            self._meta_store.build_index(new_parent_inode_id, old_entry.st_ino, new_name)
+            inode.parent_inode_id = new_parent_inode_id
+            # move the inode from the old parent to the new parent, and point .. to the new parent for directories, in one step
+            self._meta_store.rename_entry(old_parent_inode_id, old_name, new_parent_inode_id, new_name, inode)
+            self._mark_written(inode)
 
     def _replace(self, old_parent_inode_id, old_name, new_parent_inode_id, new_name, old_entry, new_entry):
-        # check if the destination is empty for not
-        # check if the destination inode has child inodes or not
-        if next(self._meta_store.get_inode_id_list(new_entry.st_ino), None):
-            logger.error("RENAME inode:{} not empty".format(new_entry.st_ino))
-            raise llfuse.FUSEError(errno.ENOTEMPTY)
-        
-        # KL TODO optimize when both the parents are the same
-        # intialize the old and new inodes
-        # old_inode = self._meta_store.get_inode(old_entry.st_ino)
-        new_inode = self._meta_store.get_inode(new_entry.st_ino)
+        # a directory can only replace a directory and a file only a file
+        if stat.S_ISDIR(old_entry.st_mode) and not stat.S_ISDIR(new_entry.st_mode):
+            raise llfuse.FUSEError(errno.ENOTDIR)
+        if not stat.S_ISDIR(old_entry.st_mode) and stat.S_ISDIR(new_entry.st_mode):
+            raise llfuse.FUSEError(errno.EISDIR)
+        # update the name and parent stored in the old inode
+        old_inode = self._get_inode(old_entry.st_ino)
+        old_inode.name = new_name
+        old_inode.parent_inode_id = new_parent_inode_id
         # reduce the nlink to new_inode
+        new_inode = self._get_inode(new_entry.st_ino)
         new_inode.nlink -= 1
-        # remove old_inode_id from old_parent_id_list
-        self._meta_store.remove_inode_id_from_list(old_parent_inode_id, old_entry.st_ino, old_name)
-        # remove new_inode_id from new_parent_id_list
-        self._meta_store.remove_inode_id_from_list(new_parent_inode_id, new_entry.st_ino, new_name)
-        # add old_inode_id to new_parent_id_list
-        self._meta_store.add_inode_id_to_list(new_parent_inode_id, old_entry.st_ino, old_name)
-        # remove lookup key for new_inode_id
-        self._meta_store.clean_index(new_parent_inode_id, new_name)
-        # remove old lookup key for old_inode_id
-        self._meta_store.clean_index(old_parent_inode_id, old_name)
-        # # remove existing object from the object store
-        # self._data_store.delete_dnode(new_inode.id)
-        if self._cache_flag:
-            # remove inode data from cache
-            self._cache_store.remove_inode(new_inode.id)
-        # # delete the new node from memory store
-        # self._meta_store.delete_inode(new_entry.st_ino)
-        # insert new lookup key for old_inode_id
-        self._meta_store.build_index(new_parent_inode_id, old_entry.st_ino, old_name)
+        delete_inode = new_inode.nlink == 0 and not self._inode_counts.is_referenced(new_inode.id)
+        # move the old inode over the new name and update or remove the new inode in one step.
+        # Fails if the destination directory is not empty
+        self._meta_store.rename_entry(old_parent_inode_id, old_name, new_parent_inode_id, new_name, old_inode, new_inode, delete_inode)
+        self._mark_written(old_inode)
+        if delete_inode:
+            self._discard_inode(new_inode)
+        else:
+            self._mark_written(new_inode)
 
     def statfs(self, ctx):
         """Return stats on the file-system"""
@@ -405,6 +497,7 @@ class ObjectFsOperations(llfuse.Operations):
         # fragment size / fundamental file system block size
         stat_fs.f_frsize = stat_fs.f_bsize
         
+        # the superblock values are served from the snapshot taken at the last flush
         # fetch total and used size from superblock
         total_size = self._super_block.total_size
         used_size = self._super_block.used_size
@@ -417,8 +510,8 @@ class ObjectFsOperations(llfuse.Operations):
         
         # total of file nodes/inodes on the system
         stat_fs.f_files = self._super_block.max_inodes
-        # total of free file nodes/inodes
-        stat_fs.f_ffree = (stat_fs.f_files - self._super_block.inode_counter)
+        # total of free file nodes/inodes. The inode counter includes the ids leased by this mount
+        stat_fs.f_ffree = (stat_fs.f_files - self._super_block.inode_counter + self._super_block.leased_inode_count)
         # total number of avaliable of free nodes/inodes avaliable to non-privileged processes
         stat_fs.f_favail = stat_fs.f_ffree
 
@@ -427,32 +520,35 @@ class ObjectFsOperations(llfuse.Operations):
     def _get_time(self):
         return int(time() * 1e9)
 
+    @inode_session
     def forget(self, inode_list):
-        """Forget the inode"""
+        """Forget the inodes. The unlinked inodes whose last reference was dropped are deleted
+           in one batch and their data is removed in the background"""
+        released_id_list = []
         for (inode_id, lookup_count) in inode_list:
             logger.debug("FORGET inode:{} with lookup_count:{}".format(inode_id, lookup_count))
-            inode = self._meta_store.get_inode(inode_id)
-            if inode.nlink == 0 and inode.lookup_count - lookup_count == 0:
-                logger.debug("Deleting inode:{}".format(inode_id))
-                # fetch parent inode id of the inode
-                parent_inode_id = inode.parent_inode_id
-                # remove object from the object-store if it is a file
-                if stat.S_ISREG(inode.mode):
-                    self._data_store.delete_dnode(inode.id)
-                    if self._cache_flag:
-                        for object_block_id in range(inode.size // settings.DATA_BLOCK_SIZE):
-                            self._cache_store.remove_inode(inode.id, object_block_id)
-                # remove inode from memory store
-                self._meta_store.delete_inode(inode.id)
-                # decrease the size of the inode removed from used size
-                self._super_block.decr_used_size(inode.size)
-                # reduce the inode counter
-                self._super_block.decr_inode_counter()
-            # else:
-                # # evict the inode from cache
-                # logger.debug("Evicting inode:{} from cache".format(inode_id))
-                # self._cache_store.remove_inode(inode_id)
+            # the meta store is only read once the last reference to the inode is dropped
+            if self._inode_counts.forget(inode_id, lookup_count):
+                released_id_list.append(inode_id)
+        if not released_id_list:
+            return
+        # fetch the released inodes in one round trip
+        deleted_list = [inode for inode in self._meta_store.get_inodes(released_id_list) if inode is not None and inode.nlink == 0]
+        if not deleted_list:
+            return
+        logger.debug("Deleting inodes:{}".format([inode.id for inode in deleted_list]))
+        # remove inodes from memory store
+        self._meta_store.delete_inodes([inode.id for inode in deleted_list])
+        for inode in deleted_list:
+            # decrease the size of the inode removed from used size
+            self._super_block.decr_used_size(inode.size)
+            # reduce the inode counter
+            self._super_block.decr_inode_counter()
+            # remove object from the object-store if it is a file
+            if stat.S_ISREG(inode.mode):
+                self._reclaimer.reclaim(inode.id, inode.size)
 
+    @inode_session
     def mknod(self, parent_inode_id, name, mode, rdev, ctx):
         logger.debug("MKNOD parent inode:{}, name:{}, rdev:{}".format(parent_inode_id, name, rdev))
         return self._create(parent_inode_id, name, mode, ctx, rdev=rdev)
@@ -497,10 +593,12 @@ class ObjectFsOperationsNoCache(ObjectFsOperations):
     def __init__(self, fs_name):
         super(self.__class__, self).__init__(fs_name)
 
+    @inode_session
     def setattr(self, inode_id, attr, fields, fh, ctx):
         """Change the attributes of an inode"""
         super(self.__class__, self).setattr(inode_id, attr, fields, fh, ctx)
         if fields.update_size:
+            inode = self._get_inode(inode_id)
             data = self._data_store.get_dnode(inode_id)
             if data is None:
                 data = b''
@@ -513,6 +611,7 @@ class ObjectFsOperationsNoCache(ObjectFsOperations):
             # update the object in the object store
             self._data_store.put_dnode(inode_id, data)
     
+    @inode_session
     def read(self, inode_id, off, size):
         """Read a file"""
         super(self.__class__, self).read(inode_id, off, size)
@@ -521,10 +620,11 @@ class ObjectFsOperationsNoCache(ObjectFsOperations):
             return b''
         return data[off:off+size]
 
+    @inode_session
     def write(self, inode_id, offset, buf):
         """Write a file"""
         super(self.__class__, self).write(inode_id, offset, buf)
-        inode = self._meta_store.get_inode(inode_id)
+        inode = self._get_inode(inode_id)
         data = self._data_store.get_dnode(inode_id)
         if data is None:
             data = b''
@@ -544,6 +644,7 @@ class ObjectFsOperationsCache(ObjectFsOperations):
     def __init__(self, fs_name):
         super(self.__class__, self).__init__(fs_name) 
     
+    @inode_session
     def setattr(self, inode_id, attr, fields, fh, ctx):
         """Change the attributes of an inode"""
         # if fields.update_size:
@@ -562,13 +663,22 @@ class ObjectFsOperationsCache(ObjectFsOperations):
         return super(self.__class__, self).setattr(inode_id, attr, fields, fh, ctx)
 
 
+    @inode_session
     def open(self, inode_id, flags, ctx):
         """Open the file using inode id"""
-        if self._cache_store.exists_inode(inode_id) is False:
-            data = self._data_store.get_dnode(inode_id)
-            self._cache_store.put_inode(inode_id, data)
-        return super(self.__class__, self).open(inode_id, flags, ctx)
+        # pinned first, so that the file is not evicted between its download and the first read or write
+        file_handle = super(self.__class__, self).open(inode_id, flags, ctx)
+        try:
+            if self._cache_store.exists_inode(inode_id) is False:
+                data = self._data_store.get_dnode(inode_id)
+                self._cache_store.put_inode(inode_id, data)
+        except Exception as e:
+            logger.error("Failed to open inode {}".format(inode_id), exc_info=True)
+            super(self.__class__, self).release(inode_id)
+            raise e
+        return file_handle
     
+    @inode_session
     def read(self, inode_id, off, size):
         """Read a file"""
         super(self.__class__, self).read(inode_id, off, size)
@@ -578,26 +688,26 @@ class ObjectFsOperationsCache(ObjectFsOperations):
         else:
             return b''
     
+    @inode_session
     def write(self, inode_id, offset, buf):
         """Write a file"""
         super(self.__class__, self).write(inode_id, offset, buf)
-        inode = self._meta_store.get_inode(inode_id)
+        inode = self._get_inode(inode_id)
         data_size = inode.size
         self._cache_store.write_inode(inode_id, offset, buf)
         inode.size = max(data_size, len(buf)+offset)
         self._super_block.incr_used_size(inode.size-data_size)
         return len(buf)
     
+    @inode_session
     def release(self, inode_id):
         """Relase a file"""
         super(self.__class__, self).release(inode_id)
-        # decrement inode open_count
-        inode = self._meta_store.get_inode(inode_id)
-        inode.open_count -= 1
         # check if the file is open or not
-        if inode.open_count == 0:
+        if not self._inode_counts.is_open(inode_id):
             data = self._cache_store.get_inode(inode_id)
             self._data_store.put_dnode(inode_id, data)
+            self._cache_store.clean_inode(inode_id)
             # self._cache_store.remove_inode(inode_id)
 
 
@@ -616,7 +726,10 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
         self._local_dirty_set = collections.defaultdict(Set)
         self._local_clean_set = collections.defaultdict(Set)
         self._local_fragment_map = collections.defaultdict(list)
-        self._pool = Pool(processes=4)
+        # transfers between the object store and the cache
+        self._io_scheduler = IOScheduler()
+        self._block_fetcher = BlockFetcher(self._io_scheduler, self._data_store, self._cache_store)
+        self._readahead = Readahead(fs_name, self._block_fetcher, self._cache_store)
         self._counter = 0
 
         # launch sns listener thread in background
@@ -626,6 +739,8 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
     
     def _run_notification_server(self):
         """Run the notificaiton server"""
+        # imported here since it loads boto3, which only this operation mode needs
+        from objectfs.core.common.snslistenser import SnsHttpFactory
         SnsHttpFactory.run_server(self)
 
     def process_notification(self, bucket_name, object_key):
@@ -633,14 +748,25 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
         print("Processing notification")
         print(bucket_name, object_key)
     
+    def destroy(self):
+        """Called when filesystem exits"""
+        # finish the write-backs and merges still queued
+        self._io_scheduler.stop()
+        super(self.__class__, self).destroy()
+
+    @inode_session
     def setattr(self, inode_id, attr, fields, fh, ctx):
         """Change the attributes of an inode"""
+        if fields.update_size:
+            # blocks read ahead may be past the new size
+            self._readahead.release(inode_id)
         return super(self.__class__, self).setattr(inode_id, attr, fields, fh, ctx)
     
+    @inode_session
     def open(self, inode_id, flags, ctx):
         """Open the file using inode id"""
         object_block_id = 0
-        inode = self._meta_store.get_inode(inode_id)
+        inode = self._get_inode(inode_id)
 
         # copy fragment map into local map
         # for fragment in self._fragment_map.get_fragment(inode_id, block_id):
@@ -661,59 +787,74 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
         # pool.map_async(prefetch_object_block, prefetch_list)
         return super(self.__class__, self).open(inode_id, flags, ctx)
     
+    @inode_session
     def read(self, inode_id, off, size):
-        """Read a file"""
+        """Read a file. Cached blocks are read from the cache and each run of adjacent uncached blocks is fetched with one ranged GET"""
         super(self.__class__, self).read(inode_id, off, size)
-        inode = self._meta_store.get_inode(inode_id)
+        inode = self._get_inode(inode_id)
         
         if off >= inode.size:
             return b''
         
-        object_block_id = off // settings.DATA_BLOCK_SIZE
-        new_off = off - (object_block_id*settings.DATA_BLOCK_SIZE)
-        # check if object block exists in cache
-        if self._cache_store.exists_inode(inode_id, object_block_id):
-            data = self._cache_store.read_inode(inode_id, new_off, size, object_block_id)
-        else:
-            # self._dirty_set.read()
-            prefetch_list = []
-            if object_block_id == 0:
-                for new_id in range(object_block_id+1, inode.size//settings.DATA_BLOCK_SIZE, 1):
-                    prefetch_list.append((self.fs_name, inode_id, new_id))
-                self._pool.map_async(prefetch_object_block, prefetch_list)
-            
-            data = self._data_store.get_dnode(inode_id, object_block_id)
-            self._cache_store.put_inode(inode_id, data, object_block_id=object_block_id)
-            data = data[new_off:size]
-
-            # fetch 4 blocks into cache same as s3fs
-            # insert into clean set
-            # update fragment map
-        # else:
-            # # enqueue a job to fetch the object block
-            # job = self._cache_queue.enqueue_download_task(inode_id, new_off, size, object_block_id)
-            # for new_id in range(object_block_id+1, inode.size//settings.DATA_BLOCK_SIZE, 1):
-                # self._cache_queue.enqueue_download_task(inode_id, new_off, size, new_id)
-            # while True:
-                # if job.status == 'finished':
-                    # data = job.result
-                    # break
-                # elif job.status == 'failed':
-                    # data = None
-                    # break
-        if data:
-            return data
-        else:
-            return b''
+        size = min(size, inode.size - off)
+        block_size = self._config.DATA_BLOCK_SIZE
+        first_block_id = off // block_size
+        last_block_id = (off + size - 1) // block_size
+        reply = bytearray(size)
+        reply_view = memoryview(reply)
+        miss_block_list = []
+        for object_block_id in range(first_block_id, last_block_id+1):
+            if not self._cache_store.exists_inode(inode_id, object_block_id):
+                miss_block_list.append(object_block_id)
+                continue
+            block_off = object_block_id * block_size
+            start = max(off, block_off)
+            end = min(off + size, block_off + block_size)
+            data = self._cache_store.read_inode(inode_id, start - block_off, end - block_off - 1, object_block_id)
+            if not data:
+                # evicted since the check
+                miss_block_list.append(object_block_id)
+                continue
+            data = data[:end-start]
+            reply_view[start-off:start-off+len(data)] = data
+        
+        self._readahead.read(inode_id, first_block_id, last_block_id, inode.size, miss_block_list)
+        if not miss_block_list:
+            return bytes(reply)
+        
+        # blocks being fetched by other reads or readahead are waited on, the others are fetched with one ranged GET per run
+        try:
+            view_map = self._block_fetcher.get(inode_id, miss_block_list, inode.size)
+        except Exception as e:
+            # errors of the object store client, like a failed ranged GET, come back from the fetch as they are
+            logger.error("Failed to read inode {}".format(inode_id), exc_info=True)
+            raise FUSEError(errno.EIO)
+        for object_block_id, block_view in view_map.items():
+            block_off = object_block_id * block_size
+            start = max(off, block_off)
+            end = min(off + size, block_off + len(block_view))
+            if end > start:
+                reply_view[start-off:end-off] = block_view[start-block_off:end-block_off]
+        return bytes(reply)
     
+    @inode_session
     def write(self, inode_id, offset, buf):
         """Write a file"""
         super(self.__class__, self).write(inode_id, offset, buf)
-        inode = self._meta_store.get_inode(inode_id)
-        object_block_id = offset // settings.DATA_BLOCK_SIZE
-        new_offset = offset - (object_block_id*settings.DATA_BLOCK_SIZE)
+        inode = self._get_inode(inode_id)
+        block_size = self._config.DATA_BLOCK_SIZE
+        object_block_id = offset // block_size
+        new_offset = offset - (object_block_id*block_size)
         
         data_size = inode.size
+        # a block evicted before the file was opened is read in first, a partial write would leave holes in it
+        block_data_size = min(block_size, data_size - object_block_id*block_size)
+        if block_data_size > 0 and (new_offset > 0 or new_offset+len(buf) < block_data_size) and not self._cache_store.exists_inode(inode_id, object_block_id):
+            try:
+                self._block_fetcher.get(inode_id, [object_block_id], data_size)
+            except Exception as e:
+                logger.error("Failed to read in inode {} object-block {} for a write".format(inode_id, object_block_id), exc_info=True)
+                raise FUSEError(errno.EIO)
         # adding data as cache block
         self._cache_store.write_inode(inode_id, new_offset, buf, object_block_id)
         # adding cache fragment index
@@ -729,20 +870,21 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
         # enqueue block for upload
         if object_block_id > self._counter:
             # import pdb; pdb.set_trace()
-            self._pool.map_async(upload_object_block, [(self.fs_name, inode_id, object_block_id-1)])
+            self._io_scheduler.submit(WRITEBACK, (inode_id, 'upload', object_block_id-1), upload_object_block, ((self.fs_name, inode_id, object_block_id-1),))
             # self._pool.map(upload_object_block, [(self.fs_name, inode_id, object_block_id-1)])
             # upload_object_block((self.fs_name, inode_id, object_block_id-1))
             self._counter += 1
 
         return len(buf)
    
+    @inode_session
     def fsync(self, inode_id, datasync):
         """Implementing fsync"""
         self._sync(inode_id)
 
     def _sync(self, inode_id):
         """Flush to log"""
-        inode = self._meta_store.get_inode(inode_id)
+        inode = self._get_inode(inode_id)
           
         block_list = []
         etag_part_list = []
@@ -768,9 +910,8 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
         
         if args_list == []:
             return
-        pool = Pool(processes=4)
-        job_result_list = pool.map(multipart_upload_object_block, args_list)
-        pool.close()
+        request_list = [self._io_scheduler.submit(WRITEBACK, (inode.id, 'multipart', args[4], args[2]), multipart_upload_object_block, (args,)) for args in args_list]
+        job_result_list = [request.wait() for request in request_list]
         # collect etags and coresponding part numbers from multi-part upload
         for job_result in job_result_list:
             etag_part_list.append({'ETag': job_result[0], 'PartNumber': job_result[1]})
@@ -788,7 +929,7 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
         self._dirty_set.remove(inode_id, block_list)
         self._clean_set.add(inode_id, block_list)
         # intiate merge task for inode
-        self._cache_queue.enqueue_merge_task(inode_id)
+        self._io_scheduler.submit(MERGE, (inode_id, 'merge', log_fragment_index), merge_log_objects, (self.fs_name, inode_id))
 
         # # contains the list of jobs which we have launched
         # job_list = []
@@ -813,19 +954,17 @@ class ObjectFsOperationsMultipart(ObjectFsOperations):
     def _sync2(inode_id):
         """Different sync"""
         sleep(4)
-        self._pool.map_async(upload_object_block, [(self.fs_name, inode_id, self._counter)])
-        self._cache_queue.enqueue_merge_task(inode_id)
+        self._io_scheduler.submit(WRITEBACK, (inode_id, 'upload', self._counter), upload_object_block, ((self.fs_name, inode_id, self._counter),))
+        self._io_scheduler.submit(MERGE, (inode_id, 'merge'), merge_log_objects, (self.fs_name, inode_id))
 
 
+    @inode_session
     def release(self, inode_id):
         """Relase a file"""
         super(self.__class__, self).release(inode_id)
-        # decrement inode open_count
-        inode = self._meta_store.get_inode(inode_id)
-        inode.open_count -= 1
-        
         # check if the file is open or not
-        if inode.open_count == 0:
+        if not self._inode_counts.is_open(inode_id):
+            self._readahead.release(inode_id)
             print("Merge")
             # self._sync(inode_id)
             # self._sync2(inode_id)
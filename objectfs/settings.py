@@ -17,6 +17,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 import os
 import sys
+import threading
 import logging
 from logging.config import fileConfig
 try:
@@ -24,13 +25,144 @@ try:
 except:
     from configparser import ConfigParser as SafeConfigParser
 
+class Config(object):
+    """Typed values of the settings read by the file-system operations, the stores and the tasks.
+       Made once per process with the settings file and read only, so that reading a value on the
+       I/O path is an attribute lookup instead of a parse of the settings file"""
+
+    __slots__ = (
+        'DATA_BLOCK_SIZE',
+        'NUM_THREADS',
+        'FILE_CACHE_MOUNT_POINT',
+        'FILE_CACHE_CAPACITY',
+        'FILE_CACHE_HIGH_WATERMARK',
+        'FILE_CACHE_LOW_WATERMARK',
+        'FILE_CACHE_EVICT_INTERVAL',
+        'CACHE_READAHEAD_MIN_BLOCKS',
+        'CACHE_READAHEAD_MAX_BLOCKS',
+        'CACHE_READAHEAD_MAX_INFLIGHT',
+        'CACHE_IO_THREADS',
+        'CACHE_IO_READ_THREADS',
+        'CACHE_IO_READAHEAD_THREADS',
+        'CACHE_IO_WRITEBACK_THREADS',
+        'CACHE_IO_MERGE_THREADS',
+        'FS_INODE_LEASE_SIZE',
+        'FS_SB_FLUSH_INTERVAL',
+        'FS_SB_FLUSH_THRESHOLD',
+        'FS_SB_SOFT_LIMIT',
+        'FS_JOURNAL_ENABLED',
+        'FS_JOURNAL_SYNC',
+        'FS_JOURNAL_COMMIT_INTERVAL',
+        'FS_JOURNAL_SEGMENT_SIZE',
+        'FS_RECLAIM_INTERVAL',
+        'FS_RECLAIM_BATCH_SIZE',
+        'META_STORE',
+        'META_INODE_CACHE_SIZE',
+        'META_DENTRY_CACHE_SIZE',
+        'META_DENTRY_NEGATIVE_TTL',
+        'META_DIR_SPLIT_SIZE',
+        'META_DIR_BUCKETS',
+        'META_READDIR_BATCH_SIZE',
+        'META_OPENDIR_PREFETCH',
+        'META_SQLITE_COMMIT_BATCH',
+        'META_SQLITE_COMMIT_INTERVAL',
+        'SB_INODE_COUNTER',
+        'SB_MAX_INODES',
+        'SB_FREE_INODE_ID',
+        'SB_USED_SIZE',
+        'SB_FREE_INODE_RANGES',
+    )
+
+    def __init__(self, settings):
+        for name in self.__slots__:
+            object.__setattr__(self, name, getattr(settings, name))
+        self._validate(set(name for name in self.__slots__ if settings.is_set(name)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Config is read only. Change {} in the settings file".format(name))
+
+    def __delattr__(self, name):
+        raise AttributeError("Config is read only. Change {} in the settings file".format(name))
+
+    def _validate(self, set_name_set):
+        """Check the values set in the settings file once so that the operations can use them as they are"""
+        for name in ['DATA_BLOCK_SIZE', 'NUM_THREADS', 'FS_INODE_LEASE_SIZE', 'FS_SB_FLUSH_INTERVAL', 'FS_JOURNAL_COMMIT_INTERVAL', 'FS_JOURNAL_SEGMENT_SIZE', 'FS_RECLAIM_INTERVAL', 'FS_RECLAIM_BATCH_SIZE',
+                     'FILE_CACHE_EVICT_INTERVAL', 'CACHE_READAHEAD_MAX_BLOCKS', 'CACHE_READAHEAD_MAX_INFLIGHT', 'CACHE_IO_THREADS', 'CACHE_IO_READ_THREADS',
+                     'CACHE_IO_READAHEAD_THREADS', 'CACHE_IO_WRITEBACK_THREADS', 'CACHE_IO_MERGE_THREADS', 'META_DIR_BUCKETS', 'META_READDIR_BATCH_SIZE', 'META_SQLITE_COMMIT_BATCH']:
+            if name in set_name_set and getattr(self, name) <= 0:
+                raise ValueError("Setting {} should be greater than 0, got {}".format(name, getattr(self, name)))
+        for name in ['FS_SB_FLUSH_THRESHOLD', 'FILE_CACHE_CAPACITY', 'CACHE_READAHEAD_MIN_BLOCKS', 'META_INODE_CACHE_SIZE', 'META_DENTRY_CACHE_SIZE', 'META_DENTRY_NEGATIVE_TTL', 'META_DIR_SPLIT_SIZE', 'META_SQLITE_COMMIT_INTERVAL']:
+            if name in set_name_set and getattr(self, name) < 0:
+                raise ValueError("Setting {} should not be negative, got {}".format(name, getattr(self, name)))
+        if 'FS_SB_SOFT_LIMIT' in set_name_set and not 0 < self.FS_SB_SOFT_LIMIT <= 1:
+            raise ValueError("Setting FS_SB_SOFT_LIMIT should be a fraction in (0, 1], got {}".format(self.FS_SB_SOFT_LIMIT))
+        if (set_name_set & {'FILE_CACHE_LOW_WATERMARK', 'FILE_CACHE_HIGH_WATERMARK'} and
+                not 0 < self.FILE_CACHE_LOW_WATERMARK <= self.FILE_CACHE_HIGH_WATERMARK <= 1):
+            raise ValueError("Settings FILE_CACHE_LOW_WATERMARK and FILE_CACHE_HIGH_WATERMARK should be fractions with 0 < low <= high <= 1, got {} and {}".format(
+                self.FILE_CACHE_LOW_WATERMARK, self.FILE_CACHE_HIGH_WATERMARK))
+        if set_name_set & {'CACHE_READAHEAD_MIN_BLOCKS', 'CACHE_READAHEAD_MAX_BLOCKS'} and self.CACHE_READAHEAD_MIN_BLOCKS > self.CACHE_READAHEAD_MAX_BLOCKS:
+            raise ValueError("Setting CACHE_READAHEAD_MIN_BLOCKS should not be greater than CACHE_READAHEAD_MAX_BLOCKS, got {}".format(self.CACHE_READAHEAD_MIN_BLOCKS))
+        # the journal is replayed into the meta store, which the Sqlite meta store does not support
+        if self.FS_JOURNAL_ENABLED and self.META_STORE == 'Sqlite':
+            raise ValueError("Setting FS_JOURNAL_ENABLED is not supported by the Sqlite meta store")
+
 class Settings(object):
 
+    # options added after settings files were written, read with these defaults when a file lacks them
+    OPTION_DEFAULTS = {
+        'FS_INODE_LEASE_SIZE': ('file-system-mount', 'inode_lease_size', 1024),
+        'FS_SB_FLUSH_INTERVAL': ('file-system-mount', 'superblock_flush_interval', 1.0),
+        'FS_SB_FLUSH_THRESHOLD': ('file-system-mount', 'superblock_flush_threshold', 67108864),
+        'FS_SB_SOFT_LIMIT': ('file-system-mount', 'superblock_soft_limit', 0.9),
+        'FS_JOURNAL_ENABLED': ('file-system-mount', 'journal_enabled', False),
+        'FS_JOURNAL_SYNC': ('file-system-mount', 'journal_sync', False),
+        'FS_JOURNAL_COMMIT_INTERVAL': ('file-system-mount', 'journal_commit_interval', 0.1),
+        'FS_JOURNAL_SEGMENT_SIZE': ('file-system-mount', 'journal_segment_size', 1048576),
+        'FS_RECLAIM_INTERVAL': ('file-system-mount', 'reclaim_interval', 1.0),
+        'FS_RECLAIM_BATCH_SIZE': ('file-system-mount', 'reclaim_batch_size', 1000),
+        'SB_FREE_INODE_RANGES': ('file-system-superblock', 'free_inode_ranges', 'free_inode_ranges'),
+        'CACHE_READAHEAD_MIN_BLOCKS': ('cache', 'readahead_min_blocks', 2),
+        'CACHE_READAHEAD_MAX_BLOCKS': ('cache', 'readahead_max_blocks', 32),
+        'CACHE_READAHEAD_MAX_INFLIGHT': ('cache', 'readahead_max_inflight', 536870912),
+        'CACHE_IO_THREADS': ('cache', 'io_threads', 16),
+        'CACHE_IO_READ_THREADS': ('cache', 'io_read_threads', 12),
+        'CACHE_IO_READAHEAD_THREADS': ('cache', 'io_readahead_threads', 8),
+        'CACHE_IO_WRITEBACK_THREADS': ('cache', 'io_writeback_threads', 8),
+        'CACHE_IO_MERGE_THREADS': ('cache', 'io_merge_threads', 1),
+        'FILE_CACHE_CAPACITY': ('file-cache', 'capacity', 107374182400),
+        'FILE_CACHE_HIGH_WATERMARK': ('file-cache', 'high_watermark', 0.9),
+        'FILE_CACHE_LOW_WATERMARK': ('file-cache', 'low_watermark', 0.8),
+        'FILE_CACHE_EVICT_INTERVAL': ('file-cache', 'evict_interval', 1.0),
+        'META_SHARD_LIST': ('meta', 'shards', ''),
+        'META_SQLITE_PATH': ('meta', 'sqlite_path', '/var/lib/objectfs'),
+        'META_SQLITE_COMMIT_BATCH': ('meta', 'sqlite_commit_batch', 1000),
+        'META_SQLITE_COMMIT_INTERVAL': ('meta', 'sqlite_commit_interval', 0.1),
+        'META_SQLITE_CACHE_SIZE': ('meta', 'sqlite_cache_size', 262144),
+        'META_CHECKPOINT_CHUNK_SIZE': ('meta', 'checkpoint_chunk_size', 10000),
+        'META_CHECKPOINT_NUM_THREADS': ('meta', 'checkpoint_num_threads', 8),
+        'META_INODE_CACHE_SIZE': ('meta', 'inode_cache_size', 100000),
+        'META_DENTRY_CACHE_SIZE': ('meta', 'dentry_cache_size', 100000),
+        'META_DENTRY_NEGATIVE_TTL': ('meta', 'dentry_negative_ttl', 1.0),
+        'META_DIR_SPLIT_SIZE': ('meta', 'directory_split_size', 10000),
+        'META_DIR_BUCKETS': ('meta', 'directory_buckets', 64),
+        'META_READDIR_BATCH_SIZE': ('meta', 'readdir_batch_size', 128),
+        'META_OPENDIR_PREFETCH': ('meta', 'opendir_prefetch', False),
+    }
+
+    # every module makes its own settings. The file is read, the logging configured and the
+    # config made once per process and they are shared by all the settings of a file
+    __parsers = {}
+    __lock = threading.Lock()
+
     def __init__(self, file_name='settings.ini'):
-        self.parser = SafeConfigParser()
-        # reading the settings file
-        self._read_settings_file(file_name)
-        self._set_path()
+        with Settings.__lock:
+            if file_name not in Settings.__parsers:
+                self.parser = SafeConfigParser()
+                # reading the settings file
+                self._read_settings_file(file_name)
+                self._set_path()
+                Settings.__parsers[file_name] = (self.parser, self._file_name, Config(self))
+            (self.parser, self._file_name, self.config) = Settings.__parsers[file_name]
     
     def _read_settings_file(self, file_name):
         """Read the settings file"""
@@ -55,6 +187,20 @@ class Settings(object):
         return
         # BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), self.parser.get('path', 'BASE_PATH')))
     
+    def _get_option(self, get, name):
+        """Read the option of a setting, or its default if the settings file lacks it"""
+        (section, option, default) = Settings.OPTION_DEFAULTS[name]
+        if self.parser.has_option(section, option):
+            return get(section, option)
+        return default
+
+    def is_set(self, name):
+        """Check if a setting is in the settings file and not read with its default"""
+        if name not in Settings.OPTION_DEFAULTS:
+            return True
+        (section, option, default) = Settings.OPTION_DEFAULTS[name]
+        return self.parser.has_option(section, option)
+
     def _convert_list(self, values_list):
         """Converts the values to a list"""
         return [value.strip() for value in values_list.split(',')]
@@ -108,6 +254,46 @@ class Settings(object):
     def CACHE_STORE(self):
         return self.parser.get('cache', 'name')
     
+    @property
+    def CACHE_READAHEAD_MIN_BLOCKS(self):
+        """Blocks read ahead when a file starts being read sequentially, 0 disables readahead"""
+        return self._get_option(self.parser.getint, 'CACHE_READAHEAD_MIN_BLOCKS')
+
+    @property
+    def CACHE_READAHEAD_MAX_BLOCKS(self):
+        """Largest number of blocks read ahead of a sequential reader"""
+        return self._get_option(self.parser.getint, 'CACHE_READAHEAD_MAX_BLOCKS')
+
+    @property
+    def CACHE_READAHEAD_MAX_INFLIGHT(self):
+        """Bytes being read ahead by a mount at a time"""
+        return self._get_option(self.parser.getint, 'CACHE_READAHEAD_MAX_INFLIGHT')
+
+    @property
+    def CACHE_IO_THREADS(self):
+        """Threads of a mount moving blocks between the object store and the cache"""
+        return self._get_option(self.parser.getint, 'CACHE_IO_THREADS')
+
+    @property
+    def CACHE_IO_READ_THREADS(self):
+        """Threads fetching the blocks read by the file-system at a time"""
+        return self._get_option(self.parser.getint, 'CACHE_IO_READ_THREADS')
+
+    @property
+    def CACHE_IO_READAHEAD_THREADS(self):
+        """Threads reading blocks ahead at a time"""
+        return self._get_option(self.parser.getint, 'CACHE_IO_READAHEAD_THREADS')
+
+    @property
+    def CACHE_IO_WRITEBACK_THREADS(self):
+        """Threads uploading written blocks at a time"""
+        return self._get_option(self.parser.getint, 'CACHE_IO_WRITEBACK_THREADS')
+
+    @property
+    def CACHE_IO_MERGE_THREADS(self):
+        """Threads merging log objects at a time"""
+        return self._get_option(self.parser.getint, 'CACHE_IO_MERGE_THREADS')
+
     @property
     def CACHE_STORES_SUPPORTED(self):
         """List of supported cache stores"""
@@ -122,6 +308,79 @@ class Settings(object):
         """List of supported meta stores"""
         return self._convert_list(self.parser.get('meta', 'meta_stores_supported'))
 
+    @property
+    def META_SHARD_LIST(self):
+        """List of host and port of the Redis servers holding the sharded metadata"""
+        shards = self._get_option(self.parser.get, 'META_SHARD_LIST')
+        if not shards:
+            return [(self.REDIS_HOST, self.REDIS_PORT)]
+        return [(host, int(port)) for (host, port) in (shard.rsplit(':', 1) for shard in self._convert_list(shards))]
+
+    @property
+    def META_SQLITE_PATH(self):
+        """Directory of the databases used by the Sqlite meta store"""
+        return self._get_option(self.parser.get, 'META_SQLITE_PATH')
+
+    @property
+    def META_SQLITE_COMMIT_BATCH(self):
+        """Number of writes committed together by the Sqlite meta store"""
+        return self._get_option(self.parser.getint, 'META_SQLITE_COMMIT_BATCH')
+
+    @property
+    def META_SQLITE_COMMIT_INTERVAL(self):
+        """Seconds after which the pending writes of the Sqlite meta store are committed"""
+        return self._get_option(self.parser.getfloat, 'META_SQLITE_COMMIT_INTERVAL')
+
+    @property
+    def META_SQLITE_CACHE_SIZE(self):
+        """Page cache of each Sqlite database in kilobytes"""
+        return self._get_option(self.parser.getint, 'META_SQLITE_CACHE_SIZE')
+
+    @property
+    def META_CHECKPOINT_CHUNK_SIZE(self):
+        """Number of keys in each chunk of a metadata checkpoint"""
+        return self._get_option(self.parser.getint, 'META_CHECKPOINT_CHUNK_SIZE')
+
+    @property
+    def META_CHECKPOINT_NUM_THREADS(self):
+        """Number of checkpoint chunks saved or loaded in parallel"""
+        return self._get_option(self.parser.getint, 'META_CHECKPOINT_NUM_THREADS')
+
+    @property
+    def META_INODE_CACHE_SIZE(self):
+        """Number of decoded inodes cached in the mount process. 0 disables the cache"""
+        return self._get_option(self.parser.getint, 'META_INODE_CACHE_SIZE')
+
+    @property
+    def META_DENTRY_CACHE_SIZE(self):
+        """Number of directory entries cached in the mount process. 0 disables the cache"""
+        return self._get_option(self.parser.getint, 'META_DENTRY_CACHE_SIZE')
+
+    @property
+    def META_DENTRY_NEGATIVE_TTL(self):
+        """Seconds a missing name stays cached. 0 disables the negative entries"""
+        return self._get_option(self.parser.getfloat, 'META_DENTRY_NEGATIVE_TTL')
+
+    @property
+    def META_DIR_SPLIT_SIZE(self):
+        """Number of entries after which new names of a directory go to its buckets. 0 never splits"""
+        return self._get_option(self.parser.getint, 'META_DIR_SPLIT_SIZE')
+
+    @property
+    def META_DIR_BUCKETS(self):
+        """Number of buckets of a split directory"""
+        return self._get_option(self.parser.getint, 'META_DIR_BUCKETS')
+
+    @property
+    def META_READDIR_BATCH_SIZE(self):
+        """Number of child inodes fetched together by readdir"""
+        return self._get_option(self.parser.getint, 'META_READDIR_BATCH_SIZE')
+
+    @property
+    def META_OPENDIR_PREFETCH(self):
+        """Prefetch the child inodes of a directory into the inode cache on opendir"""
+        return self._get_option(self.parser.getboolean, 'META_OPENDIR_PREFETCH')
+
     @property
     def NUM_THREADS(self):
         return self.parser.getint('store', 'num_threads')
@@ -141,6 +400,56 @@ class Settings(object):
     @property
     def FS_MOUNT_POINT(self):
         return self.parser.get('file-system-mount', 'mount_point')
+
+    @property
+    def FS_INODE_LEASE_SIZE(self):
+        """Number of inode ids leased by a mount at a time"""
+        return self._get_option(self.parser.getint, 'FS_INODE_LEASE_SIZE')
+
+    @property
+    def FS_SB_FLUSH_INTERVAL(self):
+        """Seconds between flushes of the superblock counter changes of a mount"""
+        return self._get_option(self.parser.getfloat, 'FS_SB_FLUSH_INTERVAL')
+
+    @property
+    def FS_SB_FLUSH_THRESHOLD(self):
+        """Used size change in bytes which triggers an early flush"""
+        return self._get_option(self.parser.getint, 'FS_SB_FLUSH_THRESHOLD')
+
+    @property
+    def FS_SB_SOFT_LIMIT(self):
+        """Fraction of the total size above which the used size is checked in Redis"""
+        return self._get_option(self.parser.getfloat, 'FS_SB_SOFT_LIMIT')
+
+    @property
+    def FS_JOURNAL_ENABLED(self):
+        """Log the metadata changes of a mount to the container"""
+        return self._get_option(self.parser.getboolean, 'FS_JOURNAL_ENABLED')
+
+    @property
+    def FS_JOURNAL_SYNC(self):
+        """Wait until the journal segment holding a change is stored before the operation returns"""
+        return self._get_option(self.parser.getboolean, 'FS_JOURNAL_SYNC')
+
+    @property
+    def FS_JOURNAL_COMMIT_INTERVAL(self):
+        """Seconds after which the buffered journal records are stored as a segment"""
+        return self._get_option(self.parser.getfloat, 'FS_JOURNAL_COMMIT_INTERVAL')
+
+    @property
+    def FS_JOURNAL_SEGMENT_SIZE(self):
+        """Size in bytes of the buffered journal records which triggers an early commit"""
+        return self._get_option(self.parser.getint, 'FS_JOURNAL_SEGMENT_SIZE')
+
+    @property
+    def FS_RECLAIM_INTERVAL(self):
+        """Seconds between background removals of the data of deleted files"""
+        return self._get_option(self.parser.getfloat, 'FS_RECLAIM_INTERVAL')
+
+    @property
+    def FS_RECLAIM_BATCH_SIZE(self):
+        """Number of deleted files whose data is removed together"""
+        return self._get_option(self.parser.getint, 'FS_RECLAIM_BATCH_SIZE')
     
     @property
     def FS_NUM_INODES(self):
@@ -178,6 +487,26 @@ class Settings(object):
     def FILE_CACHE_MOUNT_POINT(self):
         return self.parser.get('file-cache', 'mount_point')
 
+    @property
+    def FILE_CACHE_CAPACITY(self):
+        """Bytes of blocks held by the file cache, 0 is unbounded"""
+        return self._get_option(self.parser.getint, 'FILE_CACHE_CAPACITY')
+
+    @property
+    def FILE_CACHE_HIGH_WATERMARK(self):
+        """Fraction of the capacity above which clean blocks are evicted"""
+        return self._get_option(self.parser.getfloat, 'FILE_CACHE_HIGH_WATERMARK')
+
+    @property
+    def FILE_CACHE_LOW_WATERMARK(self):
+        """Fraction of the capacity down to which clean blocks are evicted"""
+        return self._get_option(self.parser.getfloat, 'FILE_CACHE_LOW_WATERMARK')
+
+    @property
+    def FILE_CACHE_EVICT_INTERVAL(self):
+        """Seconds between checks of the file cache evictor"""
+        return self._get_option(self.parser.getfloat, 'FILE_CACHE_EVICT_INTERVAL')
+
     @property
     def SB_INODE_COUNTER(self):
         return self.parser.get('file-system-superblock', 'inode_counter')
@@ -201,6 +530,10 @@ class Settings(object):
     @property
     def SB_FREE_INODE_ID(self):
         return self.parser.get('file-system-superblock', 'free_inode_id')
+
+    @property
+    def SB_FREE_INODE_RANGES(self):
+        return self._get_option(self.parser.get, 'SB_FREE_INODE_RANGES')
     
     @property
     def SNS_TOPIC_NAME(self):
@@ -0,0 +1,117 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, print_function
+import sys
+import os
+import pytest
+sys.path.append('..')
+from objectfs.core.cache.cachestore import CacheStoreFactory
+from objectfs.core.cache.blockcache import BlockCacheIndex, FETCH_SUFFIX
+
+def test_block_cache():
+    block_cache = Block_Cache_Test()
+    block_cache.test_persistent_index()
+    block_cache.test_clock_eviction()
+    block_cache.test_dirty_protection()
+    block_cache.test_open_protection()
+    block_cache.test_fetch_after_write()
+
+class Block_Cache_Test:
+
+    def __init__(self):
+        self._cache_store = CacheStoreFactory.create_store('test_fs', 'File')
+        self._index = self._cache_store._index
+        self._capacity = self._index._capacity
+
+    def __del__(self):
+        self._index._capacity = self._capacity
+        self._cache_store.remove_inodes([(inode_id, 10) for inode_id in range(2, 8)])
+
+    def test_persistent_index(self):
+        """Test that the blocks and their sizes are known again after a restart"""
+        self._cache_store.put_inode(2, b'a'*10, object_block_id=0)
+        self._cache_store.write_inode(2, 5, b'b'*10, 1)
+        # written without the index, as if the process stopped before the index was committed
+        self._cache_store.remove_inodes([(3, 1)])
+        with open(self._cache_store._cache_key(3, 0), 'wb') as f:
+            f.write(b'c'*10)
+        index = BlockCacheIndex('test_fs', self._cache_store._cache_key)
+        assert(index._block_map[(2, 0)].size == 10)
+        assert(index._block_map[(2, 1)].size == 15 and index._block_map[(2, 1)].dirty)
+        assert(not index._block_map[(3, 0)].dirty)
+        assert(index.used_size == self._index.used_size + 10)
+        index._connection.close()
+        self._cache_store.remove_inodes([(2, 2), (3, 1)])
+
+    def test_clock_eviction(self):
+        """Test that clean blocks are evicted down to the low watermark and read blocks get a second chance"""
+        used_size = self._index.used_size
+        self._index._capacity = used_size + 100
+        for object_block_id in range(3):
+            self._cache_store.put_inode(4, b'd'*30, object_block_id=object_block_id)
+        assert(self._cache_store.read_inode(4, 0, 29, 0) == b'd'*30)
+        assert(len(self._cache_store.read_inode(4, 0, 9, 0)) == 10)
+        # the cache is full and the writer evicts
+        self._cache_store.put_inode(4, b'd'*30, object_block_id=3)
+        assert(self._index.used_size <= self._index._capacity * self._index._config.FILE_CACHE_LOW_WATERMARK)
+        assert(self._cache_store.exists_inode(4, 0))
+        assert(not self._cache_store.exists_inode(4, 1))
+        assert(self._cache_store.read_inode(4, 0, 29, 1) == b'')
+        self._cache_store.remove_inodes([(4, 4)])
+        assert(self._index.used_size == used_size)
+
+    def test_dirty_protection(self):
+        """Test that written blocks are only evicted once they are clean"""
+        used_size = self._index.used_size
+        self._index._capacity = used_size + 100
+        self._cache_store.write_inode(5, 0, b'e'*90, 0)
+        self._cache_store.put_inode(5, b'e'*20, object_block_id=1)
+        assert(self._cache_store.exists_inode(5, 0))
+        assert(not self._cache_store.exists_inode(5, 1))
+        self._cache_store.clean_inode(5, 0)
+        assert(self._index.evict() == 1)
+        assert(not self._cache_store.exists_inode(5, 0))
+        assert(self._index.used_size == used_size)
+
+    def test_open_protection(self):
+        """Test that the clean blocks of an open file are only evicted once it is closed"""
+        used_size = self._index.used_size
+        self._index._capacity = used_size + 100
+        # opened twice, like the whole file of the cache mode
+        self._cache_store.pin_inode(6)
+        self._cache_store.pin_inode(6)
+        self._cache_store.put_inode(6, b'f'*90)
+        assert(self._index.evict() == 0)
+        assert(self._cache_store.read_inode(6, 0, 89) == b'f'*90)
+        self._cache_store.unpin_inode(6)
+        assert(self._index.evict() == 0)
+        self._cache_store.unpin_inode(6)
+        assert(self._index.evict() == 1)
+        assert(not self._cache_store.exists_inode(6))
+        assert(self._index.used_size == used_size)
+
+    def test_fetch_after_write(self):
+        """Test that a block fetched while it was written does not replace the write"""
+        self._cache_store.write_inode(7, 0, b'g'*10, 0)
+        self._cache_store.put_inode(7, b'h'*20, object_block_id=0)
+        assert(self._cache_store.read_inode(7, 0, 19, 0) == b'g'*10)
+        assert(self._index._block_map[(7, 0)].dirty)
+        assert(not [file_name for file_name in os.listdir(self._index._config.FILE_CACHE_MOUNT_POINT) if FETCH_SUFFIX in file_name])
+        self._cache_store.clean_inode(7, 0)
+        self._cache_store.put_inode(7, b'h'*20, object_block_id=0)
+        assert(self._cache_store.read_inode(7, 0, 19, 0) == b'h'*20)
+        self._cache_store.remove_inodes([(7, 1)])
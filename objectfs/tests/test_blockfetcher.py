@@ -0,0 +1,90 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import threading
+from time import sleep
+sys.path.append('..')
+from objectfs.core.cache.blockfetcher import BlockFetcher
+from objectfs.core.cache.ioscheduler import IOScheduler, READ, READAHEAD
+from objectfs.core.data.objectstore import ObjectStoreFactory
+from objectfs.core.cache.cachestore import CacheStoreFactory
+from config import OBJECT_STORE_LIST, CACHE_STORE_LIST
+
+@pytest.mark.parametrize('object_store', OBJECT_STORE_LIST)
+@pytest.mark.parametrize('cache_store', CACHE_STORE_LIST)
+def test_block_fetcher(object_store, cache_store):
+    block_fetcher = Block_Fetcher_Test(object_store, cache_store)
+    block_fetcher.test_get()
+    block_fetcher.test_single_flight()
+
+class Block_Fetcher_Test:
+
+    def __init__(self, object_store, cache_store):
+        self._object_store = ObjectStoreFactory.create_store('test_fs', object_store)
+        self.container = self._object_store.container
+        self.container.create()
+        self._cache_store = CacheStoreFactory.create_store('test_fs', cache_store)
+        self.data = b'test_block_fetcher_data'
+        self._object_store.put_dnode(8, self.data)
+        # counts the GETs and holds them until set
+        self.event = threading.Event()
+        self.event.set()
+        self.get_list = []
+        get_dnode_range = self._object_store.get_dnode_range
+        def held_get_dnode_range(*args):
+            self.event.wait()
+            self.get_list.append(args)
+            return get_dnode_range(*args)
+        self._object_store.get_dnode_range = held_get_dnode_range
+        self.io_scheduler = IOScheduler()
+        self.block_fetcher = BlockFetcher(self.io_scheduler, self._object_store, self._cache_store)
+
+    def __del__(self):
+        self.event.set()
+        self.io_scheduler.stop()
+        self._cache_store.remove_inode(8, 0)
+        self.container.delete()
+
+    def _wait_unregistered(self):
+        for retry in range(50):
+            if len(self.block_fetcher) == 0:
+                break
+            sleep(0.1)
+        assert(len(self.block_fetcher) == 0)
+
+    def test_get(self):
+        """Test that a fetched block is returned and put in the cache"""
+        view_map = self.block_fetcher.get(8, [0], len(self.data))
+        assert(view_map[0].tobytes() == self.data)
+        assert(self._cache_store.get_inode(8, 0) == self.data)
+        self._wait_unregistered()
+
+    def test_single_flight(self):
+        """Test that a read of a block being read ahead waits on the readahead instead of a second GET"""
+        self.event.clear()
+        self.get_list = []
+        callback_list = []
+        readahead_map = self.block_fetcher.fetch(READAHEAD, 8, [0], len(self.data), callback=callback_list.append)
+        read_map = self.block_fetcher.fetch(READ, 8, [0], len(self.data))
+        assert(read_map[0][1] is readahead_map[0][1])
+        self.event.set()
+        assert(read_map[0][1].wait().tobytes() == self.data)
+        self._wait_unregistered()
+        assert(len(self.get_list) == 1)
+        assert(callback_list == [readahead_map[0][1]])
@@ -30,6 +30,11 @@ def test_object(cache_store):
     cach.test_put_get_remove_exists_inode()
     cach.test_write_read_inode()
 
+@pytest.mark.parametrize('cache_store', CACHE_STORE_LIST)
+def test_fetch_after_write(cache_store):
+    cach = Cache_Store_Test(cache_store)
+    cach.test_fetch_after_write()
+
 class Cache_Store_Test:
 
     def __init__(self, cache_store):
@@ -55,3 +60,12 @@ class Cache_Store_Test:
         self._cache_store.write_inode(self._inode_id, 0, self._data_string)
         response = self._cache_store.read_inode(self._inode_id, 0, len(self._data_string))
         assert(response == self._data_string)
+
+    def test_fetch_after_write(self):
+        """Test that a block fetched while it was written does not replace the write"""
+        self._cache_store.remove_inodes([(self._inode_id, 1)])
+        self._cache_store.write_inode(self._inode_id, 0, self._data_string, 0)
+        self._cache_store.put_inode(self._inode_id, 'x'*20, object_block_id=0)
+        response = self._cache_store.read_inode(self._inode_id, 0, 19, 0)
+        assert(response == self._data_string)
+        self._cache_store.remove_inodes([(self._inode_id, 1)])
@@ -0,0 +1,75 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.metadata.superblock import SuperBlock
+from objectfs.core.metadata.checkpoint import Checkpoint
+from objectfs.core.metadata.inode import Inode
+from objectfs.core.data.objectstore import ObjectStoreFactory
+from config import OBJECT_STORE_LIST
+
+@pytest.mark.parametrize('object_store', OBJECT_STORE_LIST)
+def test_checkpoint(object_store):
+    checkpoint = Checkpoint_Test(object_store)
+    checkpoint.test_encode_chunk()
+    checkpoint.test_save()
+    checkpoint.test_load()
+
+class Checkpoint_Test:
+
+    def __init__(self, object_store):
+        self._object_store = ObjectStoreFactory.create_store('test_fs', object_store)
+        self.container = self._object_store.container
+        self.container.create()
+        self._meta_store = MetaStoreFactory.create_store('test_fs')
+        self._super_block = SuperBlock('test_fs')
+        self._super_block.init_superblock()
+        self.dir_inode = Inode('test_fs', 2, stat.S_IFDIR | 0755, 'test_dir_name', parent_inode_id=1)
+        self.inode = Inode('test_fs', 3, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=2)
+        for inode in [self.dir_inode, self.inode]:
+            self._meta_store.put_inode(inode)
+        self._checkpoint = Checkpoint('test_fs', self._meta_store, self._object_store)
+    
+    def __del__(self):
+        self._super_block.delete_superblock()
+        self._meta_store._clean_store()
+        self.container.delete()
+
+    def test_encode_chunk(self):
+        """Test that a chunk gives back its keys and values"""
+        record_list = [('test_key', '\x00\x01value'), ('test_empty_key', '')]
+        assert(Checkpoint.decode_chunk(Checkpoint.encode_chunk(record_list)) == record_list)
+
+    def test_save(self):
+        """Test that the checkpoint holds the inodes, directories and superblock and becomes the latest"""
+        self._checkpoint_id = self._checkpoint.save(chunk_size=2, num_threads=2)
+        assert(self._checkpoint.latest() == self._checkpoint_id)
+        manifest = self._checkpoint.manifest(self._checkpoint_id)
+        assert(manifest['keys'] == 8)
+        assert(manifest['chunks'] == 4)
+
+    def test_load(self):
+        """Test that the metadata is rebuilt from the checkpoint"""
+        self._meta_store._clean_store()
+        self._super_block.delete_superblock()
+        assert(self._meta_store.get_inode(3) is None)
+        assert(self._checkpoint.load(num_threads=2) == 8)
+        assert(self._meta_store.get_inode(3).name == 'test_inode_name')
+        assert(self._meta_store.get_inode_id(2, 'test_inode_name') == 3)
+        assert(self._super_block.free_inode_id == 1)
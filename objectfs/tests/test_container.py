@@ -46,7 +46,10 @@ class Container_Test:
         assert(False)
     
     def test_delete_container(self):
-        response = self.container.delete()
+        # objects are deleted in batches along with the container
+        for object_num in range(3):
+            self.container.object('test_object_{}'.format(object_num)).put('test_data')
+        response = self.container.delete(num_threads=2)
         container_list = self.container.list()
         for container in container_list:
             if self.container.name == container.name:
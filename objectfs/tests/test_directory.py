@@ -0,0 +1,124 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+from itertools import islice
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory, FS_DELIMITER
+from objectfs.core.metadata.inode import Inode
+from objectfs.core.metadata.directoryhandle import DirectoryHandle
+from config import META_STORE_LIST
+
+@pytest.mark.parametrize('meta_store', META_STORE_LIST)
+def test_directory(meta_store):
+    directory = Directory_Test(meta_store)
+    directory.test_dot_entries()
+    directory.test_delimiter_name()
+    directory.test_resume_offset()
+    directory.test_directory_handle()
+    directory.test_migrate()
+    directory.test_clean_store()
+
+class Directory_Test:
+
+    def __init__(self, meta_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', meta_store)
+        self.inode = Inode('test_fs', 7, stat.S_IFDIR | 0755, 'test_dir_name', parent_inode_id=2)
+        self._meta_store.put_inode(self.inode)
+    
+    def __del__(self):
+        self._meta_store.delete_inode(self.inode.id)
+        self._meta_store.delete_inode_id_list(self.inode.parent_inode_id)
+    
+    def test_dot_entries(self):
+        """Test that a new directory has the . and .. entries"""
+        assert(self._meta_store.get_inode_id(self.inode.id, '.') == self.inode.id)
+        assert(self._meta_store.get_inode_id(self.inode.id, '..') == self.inode.parent_inode_id)
+        assert(self._meta_store.get_inode_id(self.inode.parent_inode_id, self.inode.name) == self.inode.id)
+
+    def test_delimiter_name(self):
+        """Test names with the delimiters used by the store"""
+        for file_name in ['test#name', 'test%name&dir']:
+            self._meta_store.add_inode_id_to_list(self.inode.id, 8, file_name)
+            assert(self._meta_store.get_inode_id(self.inode.id, file_name) == 8)
+            assert((8, file_name) in list(self._meta_store.get_inode_id_list(self.inode.id)))
+            self._meta_store.remove_inode_id_from_list(self.inode.id, 8, file_name)
+            assert(self._meta_store.get_inode_id(self.inode.id, file_name) is None)
+        assert(self._meta_store.length_inode_id_list(self.inode.id) == 2)
+
+    def test_resume_offset(self):
+        """Test that every entry is returned once when the scan is resumed"""
+        for file_num in range(3000):
+            self._meta_store.add_inode_id_to_list(self.inode.id, 100+file_num, 'test_file_{}'.format(file_num))
+        name_list = []
+        offset = 0
+        while True:
+            # resumed after every few entries like a readdir with a small buffer
+            entry_list = list(islice(self._meta_store.scan_inode_id_list(self.inode.id, offset), 100))
+            if not entry_list:
+                break
+            name_list.extend(file_name for (inode_id, file_name, offset) in entry_list)
+            offset = entry_list[-1][2]
+        assert(len(name_list) == 3002)
+        assert(len(set(name_list)) == 3002)
+
+    def test_directory_handle(self):
+        """Test that readdir calls resume the pinned scan and that an entry without room is returned again"""
+        dir_handle = DirectoryHandle(self._meta_store, self.inode.id, batch_size=64)
+        name_list = []
+        offset = 0
+        while True:
+            entry_iter = dir_handle.read(offset)
+            # the caller has room for 10 entries, the 11th one is dropped
+            entry_list = list(islice(entry_iter, 11))
+            if not entry_list:
+                break
+            entry_scan = dir_handle._entry_scan
+            name_list.extend(file_name for (file_name, inode, offset) in entry_list[:10])
+            offset = entry_list[:10][-1][2]
+            entry_iter.close()
+            if len(entry_list) == 11:
+                assert(next(dir_handle.read(offset))[0] == entry_list[10][0])
+                assert(dir_handle._entry_scan is entry_scan)
+        assert(len(name_list) == 3002)
+        assert(len(set(name_list)) == 3002)
+        # a seek to the start scans again
+        assert(len(list(dir_handle.read(0))) == 3002)
+
+    def test_migrate(self):
+        """Test that a directory list and its reverse index keys are converted"""
+        client = self._meta_store._client
+        list_key = 'test_fs{}{}&list'.format(FS_DELIMITER, 9)
+        client.rpush(list_key, '9#.', '7#..', '10#test#name')
+        client.set('test_fs{}9#test#name'.format(FS_DELIMITER), 10)
+        assert(self._meta_store.migrate_directories() == 1)
+        assert(not client.exists(list_key))
+        assert(not client.exists('test_fs{}9#test#name'.format(FS_DELIMITER)))
+        assert(self._meta_store.get_inode_id(9, 'test#name') == 10)
+        assert(self._meta_store.length_inode_id_list(9) == 3)
+        self._meta_store.delete_inode_id_list(9)
+
+    def test_clean_store(self):
+        """Test that all the keys of the file-system are deleted in batches"""
+        client = self._meta_store._client
+        key_count = len(list(client.scan_iter(match='test_fs{}*'.format(FS_DELIMITER))))
+        assert(key_count > 0)
+        assert(self._meta_store._clean_store(batch_size=100) == key_count)
+        assert(not list(client.scan_iter(match='test_fs{}*'.format(FS_DELIMITER))))
+        # put back for the cleanup
+        self._meta_store.put_inode(self.inode)
@@ -0,0 +1,82 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+import copy
+import cPickle as pickle
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory, FS_DELIMITER
+from objectfs.core.metadata.inode import Inode
+from config import META_STORE_LIST
+
+@pytest.mark.parametrize('meta_store', META_STORE_LIST)
+def test_inode(meta_store):
+    inode = Inode_Test(meta_store)
+    inode.test_round_trip()
+    inode.test_symlink()
+    inode.test_copy()
+    inode.test_legacy_decode()
+    inode.test_migrate()
+
+class Inode_Test:
+
+    def __init__(self, meta_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', meta_store)
+        self.inode = Inode('test_fs', 5, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=2, size=4096)
+    
+    def __del__(self):
+        self._meta_store._client.delete('test_fs{}{}'.format(FS_DELIMITER, self.inode.id))
+    
+    def _assert_equal(self, inode, other_inode):
+        for slot in Inode.__slots__:
+            if slot != '_session':
+                assert(getattr(inode, slot) == getattr(other_inode, slot))
+
+    def test_round_trip(self):
+        """Test that an inode is unchanged by encoding and decoding"""
+        inode_string = Inode.to_string(self.inode)
+        assert(Inode.is_encoded(inode_string))
+        assert(len(inode_string) < len(pickle.dumps(self.inode)))
+        self._assert_equal(Inode.from_string(inode_string, 'test_fs'), self.inode)
+
+    def test_symlink(self):
+        """Test a unicode target and an inode without a name"""
+        inode = Inode('test_fs', 6, stat.S_IFLNK | 0777, target=u'test_target_\xe9')
+        new_inode = Inode.from_string(Inode.to_string(inode), 'test_fs')
+        assert(new_inode.name is None)
+        assert(new_inode.target.decode('utf-8') == inode.target)
+
+    def test_copy(self):
+        """Test that a copy does not share the session"""
+        self.inode._session = object()
+        new_inode = copy.copy(self.inode)
+        self.inode._session = None
+        assert(new_inode._session is None)
+        self._assert_equal(new_inode, self.inode)
+
+    def test_legacy_decode(self):
+        """Test that inodes pickled before the binary encoding can be read"""
+        self._assert_equal(Inode.from_string(pickle.dumps(self.inode), 'test_fs'), self.inode)
+
+    def test_migrate(self):
+        """Test that a pickled inode is converted by the migration"""
+        key = 'test_fs{}{}'.format(FS_DELIMITER, self.inode.id)
+        self._meta_store._client.set(key, pickle.dumps(self.inode))
+        assert(self._meta_store.migrate_inodes() == 1)
+        assert(Inode.is_encoded(self._meta_store._client.get(key)))
+        assert(self._meta_store.migrate_inodes() == 0)
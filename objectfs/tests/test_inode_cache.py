@@ -0,0 +1,188 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+import redis
+from time import sleep
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory, FS_DELIMITER
+from objectfs.core.metadata.inodecache import InodeCache, DentryCache
+from objectfs.core.metadata.inode import Inode
+from objectfs.settings import Settings
+settings = Settings()
+from config import META_STORE_LIST
+
+@pytest.mark.parametrize('meta_store', META_STORE_LIST)
+def test_inode_cache(meta_store):
+    cache = Inode_Cache_Test(meta_store)
+    cache.test_lru_eviction()
+    cache.test_stale_fill()
+    cache.test_unrelated_fill()
+    cache.test_cached_get()
+    cache.test_batched_get()
+    cache.test_local_invalidation()
+    cache.test_listener_server()
+    cache.test_remote_invalidation()
+    cache.test_dentry_expiry()
+    cache.test_cached_lookup()
+    cache.test_dentry_local_invalidation()
+    cache.test_own_changes()
+    cache.test_dentry_remote_invalidation()
+
+class Inode_Cache_Test:
+
+    def __init__(self, meta_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', meta_store)
+        self.inode = Inode('test_fs', 4, stat.S_IFREG | 0644, 'test_inode_name')
+        self._meta_store.put_inode(self.inode)
+    
+    def __del__(self):
+        DentryCache.disable('test_fs')
+        InodeCache.disable('test_fs')
+        self._meta_store.delete_inode(self.inode.id)
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used inode is evicted"""
+        inode_cache = InodeCache('test_fs', 2)
+        for inode_id in [1, 2]:
+            inode_cache.put(Inode('test_fs', inode_id, stat.S_IFREG), inode_cache.epoch)
+        inode_cache.get(1)
+        inode_cache.put(Inode('test_fs', 3, stat.S_IFREG), inode_cache.epoch)
+        assert(len(inode_cache) == 2)
+        assert(inode_cache.get(1) is not None)
+        assert(inode_cache.get(2) is None)
+        assert(inode_cache.get(3) is not None)
+    
+    def test_stale_fill(self):
+        """Test that a fill which raced with an invalidation is dropped"""
+        inode_cache = InodeCache('test_fs', 2)
+        epoch = inode_cache.epoch
+        inode_cache.invalidate(1)
+        inode_cache.put(Inode('test_fs', 1, stat.S_IFREG), epoch)
+        assert(inode_cache.get(1) is None)
+
+    def test_unrelated_fill(self):
+        """Test that invalidations only drop the fills of their own inode or directory"""
+        inode_cache = InodeCache('test_fs', 2)
+        epoch = inode_cache.epoch
+        inode_cache.invalidate(1)
+        inode_cache.put(Inode('test_fs', 2, stat.S_IFREG), epoch)
+        assert(inode_cache.get(2) is not None)
+        dentry_cache = DentryCache('test_fs', 10, 10)
+        epoch = dentry_cache.epoch
+        dentry_cache.invalidate_directory(1)
+        dentry_cache.put(1, 'test_inode_name', 4, epoch)
+        dentry_cache.put(2, 'test_inode_name', 4, epoch)
+        assert(dentry_cache.get(1, 'test_inode_name') == (False, None))
+        assert(dentry_cache.get(2, 'test_inode_name') == (True, 4))
+
+    def test_cached_get(self):
+        """Test that the meta store serves copies from the cache"""
+        inode_cache = InodeCache.enable('test_fs', 10)
+        inode = self._meta_store.get_inode(self.inode.id)
+        assert(len(inode_cache) == 1)
+        cached_inode = self._meta_store.get_inode(self.inode.id)
+        assert(cached_inode is not inode)
+        assert(cached_inode.name == self.inode.name)
+
+    def test_batched_get(self):
+        """Test that a batch get fills the cache and keeps missing inodes in place"""
+        inode_cache = InodeCache.load('test_fs')
+        inode_cache.clear()
+        inode_list = self._meta_store.get_inodes([3, self.inode.id])
+        assert(inode_list[0] is None)
+        assert(inode_list[1].name == self.inode.name)
+        assert(inode_cache.get(self.inode.id) is not None)
+        assert(self._meta_store.get_inodes([self.inode.id])[0].name == self.inode.name)
+
+    def test_local_invalidation(self):
+        """Test that the cache is invalidated when the inode is updated"""
+        inode = self._meta_store.get_inode(self.inode.id)
+        inode.size = 10
+        assert(self._meta_store.get_inode(self.inode.id).size == 10)
+    
+    def test_listener_server(self):
+        """Test that the store writes to the server and database the invalidation listener watches"""
+        connection_kwargs = self._meta_store._client.connection_pool.connection_kwargs
+        assert(connection_kwargs['port'] == settings.REDIS_PORT)
+        assert(connection_kwargs['db'] == settings.REDIS_DB)
+
+    def test_remote_invalidation(self):
+        """Test that the cache is invalidated when another mount changes the inode"""
+        self._meta_store.get_inode(self.inode.id)
+        inode = Inode.from_string(Inode.to_string(self.inode), 'test_fs')
+        inode.size = 20
+        client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+        client.set('test_fs{}{}'.format(FS_DELIMITER, self.inode.id), Inode.to_string(inode))
+        for retry in range(50):
+            if self._meta_store.get_inode(self.inode.id).size == 20:
+                break
+            sleep(0.1)
+        assert(self._meta_store.get_inode(self.inode.id).size == 20)
+
+    def test_dentry_expiry(self):
+        """Test that missing names expire and found names stay cached"""
+        dentry_cache = DentryCache('test_fs', 10, 0.1)
+        dentry_cache.put(1, 'test_missing_name', None, dentry_cache.epoch)
+        dentry_cache.put(1, 'test_inode_name', 4, dentry_cache.epoch)
+        assert(dentry_cache.get(1, 'test_missing_name') == (True, None))
+        sleep(0.2)
+        assert(dentry_cache.get(1, 'test_missing_name') == (False, None))
+        assert(dentry_cache.get(1, 'test_inode_name') == (True, 4))
+        dentry_cache.invalidate_directory(1)
+        assert(len(dentry_cache) == 0)
+
+    def test_cached_lookup(self):
+        """Test that repeated lookups and misses are served from the cache"""
+        dentry_cache = DentryCache.enable('test_fs', 10, 10)
+        assert(self._meta_store.get_inode_id(self.inode.parent_inode_id, 'test_inode_name') == self.inode.id)
+        assert(self._meta_store.get_inode_id(self.inode.parent_inode_id, 'test_missing_name') is None)
+        assert(len(dentry_cache) == 2)
+        assert(dentry_cache.get(self.inode.parent_inode_id, 'test_missing_name') == (True, None))
+
+    def test_dentry_local_invalidation(self):
+        """Test that a name created in this mount is not hidden by its negative entry"""
+        new_inode = Inode('test_fs', 5, stat.S_IFREG | 0644, 'test_missing_name')
+        self._meta_store.create_inode(new_inode)
+        assert(self._meta_store.get_inode_id(new_inode.parent_inode_id, 'test_missing_name') == new_inode.id)
+        self._meta_store.remove_entry(new_inode.parent_inode_id, 'test_missing_name', new_inode)
+        assert(self._meta_store.get_inode_id(new_inode.parent_inode_id, 'test_missing_name') is None)
+        self._meta_store.delete_inode(new_inode.id)
+
+    def test_own_changes(self):
+        """Test that a name created in this mount keeps the other entries of its directory cached"""
+        assert(self._meta_store.get_inode_id(self.inode.parent_inode_id, 'test_missing_name') is None)
+        new_inode = Inode('test_fs', 6, stat.S_IFREG | 0644, 'test_own_name')
+        self._meta_store.create_inode(new_inode)
+        sleep(0.5)
+        dentry_cache = DentryCache.load('test_fs')
+        assert(dentry_cache.get(self.inode.parent_inode_id, 'test_missing_name') == (True, None))
+        self._meta_store.remove_entry(new_inode.parent_inode_id, 'test_own_name', new_inode)
+        self._meta_store.delete_inode(new_inode.id)
+
+    def test_dentry_remote_invalidation(self):
+        """Test that the cache is invalidated when another mount adds a name"""
+        assert(self._meta_store.get_inode_id(self.inode.parent_inode_id, 'test_remote_name') is None)
+        client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+        client.hset('test_fs{}{}&dir'.format(FS_DELIMITER, self.inode.parent_inode_id), 'test_remote_name', self.inode.id)
+        for retry in range(50):
+            if self._meta_store.get_inode_id(self.inode.parent_inode_id, 'test_remote_name') is not None:
+                break
+            sleep(0.1)
+        assert(self._meta_store.get_inode_id(self.inode.parent_inode_id, 'test_remote_name') == self.inode.id)
+        self._meta_store.clean_index(self.inode.parent_inode_id, 'test_remote_name')
@@ -0,0 +1,62 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+sys.path.append('..')
+from objectfs.core.metadata.inodecount import InodeCountTable
+
+def test_inode_count():
+    count_table = Inode_Count_Test()
+    count_table.test_lookup_forget()
+    count_table.test_open_release()
+    count_table.test_forget_open_inode()
+
+class Inode_Count_Test:
+
+    def __init__(self):
+        self.count_table = InodeCountTable()
+
+    def test_lookup_forget(self):
+        """Test that an inode is referenced until all its lookups are forgotten"""
+        self.count_table.incr_lookup(2)
+        self.count_table.incr_lookup(2, 2)
+        assert(self.count_table.is_referenced(2))
+        assert(not self.count_table.forget(2, 2))
+        assert(self.count_table.forget(2, 1))
+        assert(not self.count_table.is_referenced(2))
+        assert(len(self.count_table) == 0)
+
+    def test_open_release(self):
+        """Test that the open count is tracked along with the lookup count"""
+        self.count_table.incr_lookup(3)
+        self.count_table.incr_open(3)
+        self.count_table.incr_open(3)
+        self.count_table.decr_open(3)
+        assert(self.count_table.is_open(3))
+        self.count_table.decr_open(3)
+        assert(not self.count_table.is_open(3))
+        assert(self.count_table.is_referenced(3))
+        assert(self.count_table.forget(3, 1))
+
+    def test_forget_open_inode(self):
+        """Test that an open inode stays referenced after its lookups are forgotten"""
+        self.count_table.incr_lookup(4)
+        self.count_table.incr_open(4)
+        assert(not self.count_table.forget(4, 1))
+        assert(self.count_table.is_referenced(4))
+        assert(self.count_table.decr_open(4))
+        assert(len(self.count_table) == 0)
@@ -0,0 +1,85 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.metadata.inodesession import InodeSession
+from objectfs.core.metadata.inode import Inode
+from objectfs.settings import Settings
+settings = Settings()
+from config import META_STORE_LIST
+
+@pytest.mark.parametrize('meta_store', META_STORE_LIST)
+def test_inode_session(meta_store):
+    sess = Inode_Session_Test(meta_store)
+    sess.test_created_inode()
+    sess.test_same_inode()
+    sess.test_coalesced_update()
+    sess.test_discard_on_error()
+
+class Inode_Session_Test:
+
+    def __init__(self, meta_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', meta_store)
+        self.parent_inode_id = 3
+        self.inode = Inode('test_fs', 4, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=self.parent_inode_id)
+    
+    def __del__(self):
+        self._meta_store.delete_inode(self.inode.id)
+        self._meta_store.delete_inode_id_list(self.parent_inode_id)
+    
+    def test_created_inode(self):
+        """Test that the changes to an inode created in the session are written when it commits"""
+        with InodeSession(self._meta_store) as session:
+            self._meta_store.create_inode(self.inode)
+            session.attach(self.inode)
+            self.inode.lookup_count += 1
+            assert(self._meta_store.get_inode(self.inode.id).lookup_count == 0)
+        inode = self._meta_store.get_inode(self.inode.id)
+        assert(inode.lookup_count == 1)
+        assert(self._meta_store.get_inode_id(self.parent_inode_id, self.inode.name) == self.inode.id)
+        assert((self.inode.id, self.inode.name) in list(self._meta_store.get_inode_id_list(self.parent_inode_id)))
+
+    def test_same_inode(self):
+        """Test that the session returns the same inode for every call"""
+        with InodeSession(self._meta_store) as session:
+            assert(session.get_inode(self.inode.id) is session.get_inode(self.inode.id))
+    
+    def test_coalesced_update(self):
+        """Test that the setters are collected and written once"""
+        with InodeSession(self._meta_store) as session:
+            inode = session.get_inode(self.inode.id)
+            inode.size = 10
+            inode.open_count += 1
+            inode.nlink += 1
+            assert(self._meta_store.get_inode(self.inode.id).size == 0)
+            assert(session.is_dirty(self.inode.id))
+        inode = self._meta_store.get_inode(self.inode.id)
+        assert(inode.size == 10)
+        assert(inode.open_count == 1)
+        assert(inode.nlink == 2)
+    
+    def test_discard_on_error(self):
+        """Test that the changes are dropped if the operation fails"""
+        with pytest.raises(ValueError):
+            with InodeSession(self._meta_store) as session:
+                session.get_inode(self.inode.id).size = 20
+                raise ValueError()
+        assert(self._meta_store.get_inode(self.inode.id).size == 10)
+        assert(InodeSession.current() is None)
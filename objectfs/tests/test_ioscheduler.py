@@ -0,0 +1,129 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import threading
+from time import sleep
+sys.path.append('..')
+from objectfs.core.cache.ioscheduler import IOScheduler, READ, READAHEAD, WRITEBACK, MERGE
+
+def test_ioscheduler():
+    io_scheduler = IO_Scheduler_Test()
+    io_scheduler.test_submit()
+    io_scheduler.test_dedupe()
+    io_scheduler.test_rerun()
+    io_scheduler.test_priority()
+    io_scheduler.test_cancel()
+    io_scheduler.test_failure()
+
+class IO_Scheduler_Test:
+
+    def __init__(self):
+        self.io_scheduler = IOScheduler()
+        # holds the running requests until set
+        self.event = threading.Event()
+        self.order_list = []
+
+    def __del__(self):
+        self.event.set()
+        self.io_scheduler.stop()
+
+    def _blocked(self, value):
+        self.event.wait()
+        self.order_list.append(value)
+        return value
+
+    def test_submit(self):
+        """Test that a request returns its result and calls its callback"""
+        callback_list = []
+        request = self.io_scheduler.submit(WRITEBACK, (2, 'upload', 0), sum, ([1, 2],), callback=callback_list.append)
+        assert(request.wait() == 3)
+        assert(callback_list == [request])
+
+    def test_dedupe(self):
+        """Test that a request with the key of a queued one is not run again and moves to the higher class"""
+        self.event.clear()
+        request = self.io_scheduler.submit(READAHEAD, (2, 'fetch', 0), self._blocked, ('fetch',))
+        for retry in range(50):
+            if request.state != request.QUEUED:
+                break
+            sleep(0.1)
+        assert(self.io_scheduler.submit(READ, (2, 'fetch', 0), self._blocked, ('fetch',)) is request)
+        self.event.set()
+        assert(request.wait() == 'fetch')
+        assert(self.order_list == ['fetch'])
+
+    def test_rerun(self):
+        """Test that a write-back submitted again while it runs is run once more after it"""
+        self.event.clear()
+        self.order_list = []
+        request = self.io_scheduler.submit(WRITEBACK, (2, 'upload', 1), self._blocked, ('first',))
+        for retry in range(50):
+            if request.state != request.QUEUED:
+                break
+            sleep(0.1)
+        rerun_request = self.io_scheduler.submit(WRITEBACK, (2, 'upload', 1), self._blocked, ('second',))
+        assert(rerun_request is not request)
+        assert(self.io_scheduler.submit(WRITEBACK, (2, 'upload', 1), self._blocked, ('second',)) is rerun_request)
+        self.event.set()
+        assert(rerun_request.wait() == 'second')
+        assert(self.order_list == ['first', 'second'])
+
+    def test_priority(self):
+        """Test that a free thread takes the queued read before the queued merge"""
+        io_scheduler = IOScheduler()
+        num_threads = io_scheduler._config.CACHE_IO_THREADS
+        io_scheduler._limit_list = [num_threads for io_class in io_scheduler._limit_list]
+        event_list = [threading.Event() for thread_id in range(num_threads)]
+        request_list = [io_scheduler.submit(WRITEBACK, (3, 'upload', block_id), event.wait) for block_id, event in enumerate(event_list)]
+        for retry in range(50):
+            if io_scheduler.queue_depths()['writeback'] == (0, num_threads):
+                break
+            sleep(0.1)
+        order_list = []
+        merge_request = io_scheduler.submit(MERGE, (3, 'merge'), order_list.append, ('merge',))
+        io_scheduler.submit(READ, (3, 'fetch', 0), order_list.append, ('read',))
+        assert(io_scheduler.queue_depths()['writeback'] == (0, num_threads))
+        assert(io_scheduler.queue_depths()['read'] == (1, 0))
+        # free one thread
+        event_list[0].set()
+        merge_request.wait()
+        for event in event_list:
+            event.set()
+        assert(order_list == ['read', 'merge'])
+        io_scheduler.stop()
+
+    def test_cancel(self):
+        """Test that the queued readahead of a closed file is cancelled"""
+        self.event.clear()
+        self.order_list = []
+        num_threads = self.io_scheduler._config.CACHE_IO_READ_THREADS
+        request_list = [self.io_scheduler.submit(READ, (5, 'fetch', block_id), self._blocked, ('read',)) for block_id in range(num_threads)]
+        readahead_list = [self.io_scheduler.submit(READAHEAD, (4, 'fetch', block_id), self._blocked, ('readahead',)) for block_id in range(100)]
+        assert(self.io_scheduler.cancel(4) > 0)
+        self.event.set()
+        for request in request_list + readahead_list:
+            request.wait()
+        assert(any(request.cancelled for request in readahead_list))
+        assert(self.order_list.count('readahead') < 100)
+
+    def test_failure(self):
+        """Test that the exception of a failed request is raised by wait"""
+        request = self.io_scheduler.submit(READ, (6, 'fetch', 0), int, ('block',))
+        with pytest.raises(ValueError):
+            request.wait()
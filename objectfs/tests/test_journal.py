@@ -0,0 +1,115 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+import errno
+import llfuse
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.metadata.superblock import SuperBlock
+from objectfs.core.metadata.journal import MetaJournal, CHANGE_INODE, CHANGE_ENTRY
+from objectfs.core.metadata.inode import Inode
+from objectfs.core.data.objectstore import ObjectStoreFactory
+from config import OBJECT_STORE_LIST
+
+@pytest.mark.parametrize('object_store', OBJECT_STORE_LIST)
+def test_journal(object_store):
+    journal = Journal_Test(object_store)
+    journal.test_encode_segment()
+    journal.test_commit()
+    journal.test_sync_append()
+    journal.test_replay()
+    journal.test_prune()
+    journal.test_failed_sync_append()
+
+class Failed_Object_Store(object):
+    """Object store which is down"""
+
+    def put_object(self, object_name, data):
+        raise IOError("Object store is down")
+
+class Journal_Test:
+
+    def __init__(self, object_store):
+        self._object_store = ObjectStoreFactory.create_store('test_fs', object_store)
+        self.container = self._object_store.container
+        self.container.create()
+        self._meta_store = MetaStoreFactory.create_store('test_fs')
+        self._super_block = SuperBlock('test_fs')
+        self._super_block.init_superblock()
+        self.dir_inode = Inode('test_fs', 2, stat.S_IFDIR | 0755, 'test_dir_name', parent_inode_id=1, size=10)
+        self.inode = Inode('test_fs', 3, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=2, size=20)
+    
+    def __del__(self):
+        MetaJournal.disable('test_fs')
+        self._super_block.delete_superblock()
+        self._meta_store._clean_store()
+        self.container.delete()
+
+    def test_encode_segment(self):
+        """Test that a segment gives back its records in order"""
+        record_list = [(1, [(CHANGE_INODE, 2, '\x00\x01inode')]), (2, [(CHANGE_ENTRY, 1, 'test_name', None)])]
+        segment = MetaJournal.encode_segment([MetaJournal._encode_record(record) for record in record_list])
+        assert(MetaJournal.decode_segment(segment) == record_list)
+
+    def test_commit(self):
+        """Test that the changes of a mount are stored as one segment once committed"""
+        journal = MetaJournal.enable('test_fs', self._object_store, sync=False)
+        for inode in [self.dir_inode, self.inode]:
+            self._meta_store.create_inode(inode)
+        assert(MetaJournal.list_segments(self._object_store) == [])
+        journal.commit()
+        assert(len(MetaJournal.list_segments(self._object_store)) == 1)
+
+    def test_sync_append(self):
+        """Test that a sync mutation returns once its segment is stored"""
+        MetaJournal.enable('test_fs', self._object_store, sync=True)
+        self.inode.size = 30
+        assert(len(MetaJournal.list_segments(self._object_store)) == 2)
+        MetaJournal.disable('test_fs')
+
+    def test_replay(self):
+        """Test that the metadata and the superblock counters are rebuilt from the journal"""
+        self._meta_store._clean_store()
+        assert(self._meta_store.get_inode(3) is None)
+        assert(MetaJournal.replay(self._meta_store, self._object_store, num_threads=2) == 3)
+        assert(self._meta_store.get_inode(3).size == 30)
+        assert(self._meta_store.get_inode_id(2, 'test_inode_name') == 3)
+        assert(self._meta_store.get_inode_id(2, '..') == 1)
+        assert(self._meta_store.rebuild_superblock_counters() == (2, 40))
+        assert(self._super_block.inode_counter == 2)
+        assert(self._super_block.free_inode_id == 3)
+
+    def test_prune(self):
+        """Test that the segments with all their records before a checkpoint are deleted"""
+        segment_list = MetaJournal.list_segments(self._object_store)
+        first_time = min(MetaJournal.parse_segment_name(object_name)[0] for object_name in segment_list)
+        last_time = max(MetaJournal.parse_segment_name(object_name)[1] for object_name in segment_list)
+        assert(MetaJournal.prune(self._object_store, first_time) == 0)
+        assert(MetaJournal.prune(self._object_store, last_time+1) == 2)
+        assert(MetaJournal.list_segments(self._object_store) == [])
+
+    def test_failed_sync_append(self):
+        """Test that a sync mutation fails with EIO instead of waiting when its segment cannot be stored"""
+        MetaJournal.enable('test_fs', Failed_Object_Store(), sync=True)
+        with pytest.raises(llfuse.FUSEError) as e:
+            self._meta_store.update_inode(self.inode)
+        assert(e.value.errno == errno.EIO)
+        # the records are still buffered and their last upload fails too
+        with pytest.raises(IOError):
+            MetaJournal.disable('test_fs')
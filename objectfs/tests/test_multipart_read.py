@@ -0,0 +1,102 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import stat
+import pytest
+sys.path.append('..')
+from objectfs.core.objectfs_operations import ObjectFsOperationsMultipart
+from objectfs.core.cache.blockfetcher import BlockFetcher
+from objectfs.core.cache.ioscheduler import IOScheduler
+from objectfs.core.cache.readahead import Readahead
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.metadata.inode import Inode
+from objectfs.core.data.objectstore import ObjectStoreFactory
+from objectfs.core.cache.cachestore import CacheStoreFactory
+from objectfs.settings import Settings
+settings = Settings()
+from config import OBJECT_STORE_LIST, CACHE_STORE_LIST
+
+@pytest.mark.parametrize('object_store', OBJECT_STORE_LIST)
+@pytest.mark.parametrize('cache_store', CACHE_STORE_LIST)
+def test_multipart_read(object_store, cache_store):
+    multipart_read = Multipart_Read_Test(object_store, cache_store)
+    multipart_read.test_mixed_read()
+    multipart_read.test_read_to_end()
+
+class Small_Block_Config(object):
+    """Config with blocks of a few bytes and no readahead"""
+    DATA_BLOCK_SIZE = 8
+    CACHE_READAHEAD_MIN_BLOCKS = 0
+    def __getattr__(self, name):
+        return getattr(settings.config, name)
+
+class Multipart_Read_Test:
+
+    def __init__(self, object_store, cache_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs')
+        self._object_store = ObjectStoreFactory.create_store('test_fs', object_store)
+        self.container = self._object_store.container
+        self.container.create()
+        self._cache_store = CacheStoreFactory.create_store('test_fs', cache_store)
+        self._remove_blocks()
+        # eight blocks, the last one partial
+        self.data = bytes(bytearray(range(61)))
+        self.inode = Inode('test_fs', 9, stat.S_IFREG | 0644, 'test_read_name')
+        self.inode.size = len(self.data)
+        self._meta_store.put_inode(self.inode)
+        self._object_store.put_dnode(self.inode.id, self.data)
+        # counts the ranged GETs
+        self.get_list = []
+        get_dnode_range = self._object_store.get_dnode_range
+        def counted_get_dnode_range(*args):
+            self.get_list.append(args)
+            return get_dnode_range(*args)
+        self._object_store.get_dnode_range = counted_get_dnode_range
+        # the read path of a mount without its other stores and threads
+        self.io_scheduler = IOScheduler()
+        self.ops = ObjectFsOperationsMultipart.__new__(ObjectFsOperationsMultipart)
+        self.ops._config = Small_Block_Config()
+        self.ops._meta_store = self._meta_store
+        self.ops._cache_store = self._cache_store
+        self.ops._block_fetcher = BlockFetcher(self.io_scheduler, self._object_store, self._cache_store)
+        self.ops._block_fetcher._config = self.ops._config
+        self.ops._readahead = Readahead('test_fs', self.ops._block_fetcher, self._cache_store)
+        self.ops._readahead._config = self.ops._config
+
+    def __del__(self):
+        self.io_scheduler.stop()
+        self._remove_blocks()
+        self._meta_store.delete_inode(self.inode.id)
+        self.container.delete()
+
+    def _remove_blocks(self):
+        for object_block_id in range(8):
+            self._cache_store.remove_inode(9, object_block_id)
+
+    def test_mixed_read(self):
+        """Test that a read across cached and missing blocks returns the file bytes with one GET per run of missing blocks"""
+        for object_block_id in [1, 4]:
+            self._cache_store.put_inode(self.inode.id, self.data[object_block_id*8:object_block_id*8+8], object_block_id=object_block_id)
+        # blocks 0 to 6, of which 0, 2 to 3 and 5 to 6 are missing
+        assert(self.ops.read(self.inode.id, 3, 52) == self.data[3:55])
+        assert(sorted(self.get_list) == [(self.inode.id, 0, 8), (self.inode.id, 16, 16), (self.inode.id, 40, 16)])
+
+    def test_read_to_end(self):
+        """Test that a read past the end of the file returns the bytes up to the partial last block"""
+        del self.get_list[:]
+        assert(self.ops.read(self.inode.id, 50, 100) == self.data[50:])
+        assert(self.get_list == [(self.inode.id, 56, 5)])
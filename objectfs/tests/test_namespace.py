@@ -0,0 +1,119 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+import errno
+import llfuse
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.metadata.superblock import SuperBlock
+from objectfs.core.metadata.inode import Inode
+from config import META_STORE_LIST
+
+@pytest.mark.parametrize('meta_store', META_STORE_LIST)
+def test_namespace(meta_store):
+    namespace = Namespace_Test(meta_store)
+    namespace.test_create()
+    namespace.test_link()
+    namespace.test_rename()
+    namespace.test_replace()
+    namespace.test_remove()
+    namespace.test_delete_inodes()
+
+class Namespace_Test:
+
+    def __init__(self, meta_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', meta_store)
+        self._super_block = SuperBlock('test_fs')
+        self._super_block.init_superblock()
+        # the inode ids are counted when they are leased
+        self._super_block.inode_counter = 4
+        self.dir_inode = Inode('test_fs', 2, stat.S_IFDIR | 0755, 'test_dir_name', parent_inode_id=1)
+        self.inode = Inode('test_fs', 3, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=2, size=10)
+        self.other_inode = Inode('test_fs', 4, stat.S_IFREG | 0644, 'test_other_name', parent_inode_id=2, size=20)
+    
+    def __del__(self):
+        for inode_id in [1, 2, 3, 4]:
+            self._meta_store.delete_inode_id_list(inode_id)
+            self._meta_store._client.delete('test_fs%{}'.format(inode_id))
+        self._super_block.delete_superblock()
+    
+    def _assert_errno(self, error_number, func, *args):
+        # the error is not kept so that no traceback keeps the test alive past its cleanup
+        try:
+            func(*args)
+        except llfuse.FUSEError as e:
+            assert(e.errno == error_number)
+        else:
+            pytest.fail("DID NOT RAISE FUSEError")
+
+    def test_create(self):
+        """Test that create adds the entries"""
+        for inode in [self.dir_inode, self.inode, self.other_inode]:
+            self._meta_store.create_inode(inode)
+        assert(self._meta_store.get_inode_id(2, 'test_inode_name') == 3)
+        assert(self._meta_store.get_inode_id(2, '..') == 1)
+        self._assert_errno(errno.EEXIST, self._meta_store.create_inode, Inode('test_fs', 5, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=2))
+        assert(self._meta_store.get_inode(5) is None)
+
+    def test_link(self):
+        """Test that link adds an entry and updates the inode"""
+        self.inode.nlink += 1
+        self._meta_store.link_entry(1, 'test_link_name', self.inode)
+        assert(self._meta_store.get_inode_id(1, 'test_link_name') == 3)
+        assert(self._meta_store.get_inode(3).nlink == 2)
+        self._assert_errno(errno.EEXIST, self._meta_store.link_entry, 1, 'test_link_name', self.inode)
+
+    def test_rename(self):
+        """Test that rename moves the entry and the .. of a directory"""
+        self._meta_store.rename_entry(1, 'test_dir_name', 1, 'test_new_dir_name', self.dir_inode)
+        assert(self._meta_store.get_inode_id(1, 'test_dir_name') is None)
+        assert(self._meta_store.get_inode_id(1, 'test_new_dir_name') == 2)
+        assert(self._meta_store.get_inode_id(2, '..') == 1)
+        self._assert_errno(errno.ENOENT, self._meta_store.rename_entry, 1, 'test_dir_name', 1, 'test_dir_name', self.dir_inode)
+        self._assert_errno(errno.EEXIST, self._meta_store.rename_entry, 2, 'test_inode_name', 2, 'test_other_name', self.inode)
+
+    def test_replace(self):
+        """Test that rename over an entry deletes the replaced inode"""
+        self._meta_store.rename_entry(1, 'test_link_name', 2, 'test_other_name', self.inode, self.other_inode, True)
+        assert(self._meta_store.get_inode_id(2, 'test_other_name') == 3)
+        assert(self._meta_store.get_inode_id(1, 'test_link_name') is None)
+        assert(self._meta_store.get_inode(4) is None)
+        assert(self._super_block.inode_counter == 3)
+        assert(self._super_block.used_size == -20)
+
+    def test_remove(self):
+        """Test that remove fails for a directory with entries and deletes the inode"""
+        self._assert_errno(errno.ENOTEMPTY, self._meta_store.remove_entry, 1, 'test_new_dir_name', self.dir_inode, True)
+        self.inode.nlink -= 1
+        self._meta_store.remove_entry(2, 'test_other_name', self.inode, False)
+        assert(self._meta_store.get_inode(3).nlink == 1)
+        self._meta_store.remove_entry(2, 'test_inode_name', self.inode, True)
+        assert(self._meta_store.get_inode(3) is None)
+        self._meta_store.remove_entry(1, 'test_new_dir_name', self.dir_inode, True)
+        assert(self._meta_store.length_inode_id_list(2) == 0)
+        assert(self._super_block.inode_counter == 1)
+
+    def test_delete_inodes(self):
+        """Test that unlinked inodes are deleted along with their directories in one batch"""
+        for inode in [Inode('test_fs', 3, stat.S_IFREG | 0644, nlink=0), Inode('test_fs', 4, stat.S_IFDIR | 0755, nlink=0)]:
+            self._meta_store.put_inode(inode)
+        assert(self._meta_store.length_inode_id_list(4) == 2)
+        self._meta_store.delete_inodes([3, 4])
+        assert(self._meta_store.get_inodes([3, 4]) == [None, None])
+        assert(self._meta_store.length_inode_id_list(4) == 0)
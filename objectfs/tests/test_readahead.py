@@ -0,0 +1,137 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+sys.path.append('..')
+from objectfs.core.cache.readahead import Readahead
+from objectfs.settings import Settings
+settings = Settings()
+config = settings.config
+
+def test_readahead():
+    readahead = Readahead_Test()
+    readahead.test_sequential_ramp()
+    readahead.test_random_read()
+    readahead.test_evicted_blocks()
+    readahead.test_inflight_cap()
+    readahead.test_cached_blocks()
+
+class Request(object):
+
+    def __init__(self, key):
+        self.key = key
+
+class BlockFetcher(object):
+    """Keeps the blocks read ahead instead of fetching them"""
+
+    def __init__(self):
+        self.block_list = []
+        self.callback_list = []
+
+    def fetch(self, io_class, inode_id, block_id_list, inode_size, callback):
+        for object_block_id in block_id_list:
+            self.block_list.append(object_block_id)
+            self.callback_list.append((callback, Request((inode_id, 'fetch', object_block_id, object_block_id+1))))
+
+    def cancel(self, inode_id):
+        self.finish()
+
+    def finish(self):
+        for callback, request in self.callback_list:
+            callback(request)
+        self.callback_list = []
+
+class CacheStore(object):
+    """Holds the ids of the cached blocks"""
+
+    def __init__(self, key_list=()):
+        self.key_set = set(key_list)
+
+    def exists_inode(self, inode_id, object_block_id):
+        return (inode_id, object_block_id) in self.key_set
+
+class Readahead_Test:
+
+    def __init__(self):
+        self.inode_size = 1000*config.DATA_BLOCK_SIZE
+
+    def test_sequential_ramp(self):
+        """Test that a sequential reader gets a window which doubles each time it is reached"""
+        block_fetcher = BlockFetcher()
+        readahead = Readahead('test_fs', block_fetcher, CacheStore())
+        readahead.read(2, 0, 0, self.inode_size)
+        window = config.CACHE_READAHEAD_MIN_BLOCKS
+        assert(block_fetcher.block_list == range(1, 1+window))
+        block_fetcher.finish()
+        # reading inside the window reads nothing ahead
+        readahead.read(2, 0, 0, self.inode_size)
+        assert(len(block_fetcher.block_list) == window)
+        readahead.read(2, 1, 1, self.inode_size)
+        assert(block_fetcher.block_list[window:] == range(1+window, 1+3*window))
+        block_fetcher.finish()
+        assert(readahead.inflight_size == 0)
+        readahead.release(2)
+
+    def test_random_read(self):
+        """Test that a random read stops the stream"""
+        block_fetcher = BlockFetcher()
+        readahead = Readahead('test_fs', block_fetcher, CacheStore())
+        readahead.read(3, 5, 5, self.inode_size)
+        readahead.read(3, 50, 50, self.inode_size)
+        assert(block_fetcher.block_list == [])
+        readahead.read(3, 51, 51, self.inode_size)
+        assert(block_fetcher.block_list[0] == 52)
+        # the last block of the file is not passed
+        block_fetcher = BlockFetcher()
+        readahead = Readahead('test_fs', block_fetcher, CacheStore())
+        readahead.read(3, 0, 0, 2*config.DATA_BLOCK_SIZE)
+        assert(block_fetcher.block_list == [1])
+
+    def test_evicted_blocks(self):
+        """Test that the window is halved when a block read ahead is missing from the cache"""
+        block_fetcher = BlockFetcher()
+        readahead = Readahead('test_fs', block_fetcher, CacheStore())
+        for object_block_id in range(0, 2*config.CACHE_READAHEAD_MAX_BLOCKS):
+            readahead.read(4, object_block_id, object_block_id, self.inode_size)
+            block_fetcher.finish()
+        state = readahead._state_map[4]
+        window = state.window
+        readahead.read(4, state.prev_block_id+1, state.prev_block_id+1, self.inode_size, [state.prev_block_id+1])
+        assert(state.window == max(window//2, config.CACHE_READAHEAD_MIN_BLOCKS))
+
+    def test_inflight_cap(self):
+        """Test that the bytes being read ahead are capped"""
+        block_fetcher = BlockFetcher()
+        readahead = Readahead('test_fs', block_fetcher, CacheStore())
+        max_inflight_blocks = config.CACHE_READAHEAD_MAX_INFLIGHT // config.DATA_BLOCK_SIZE
+        for inode_id in range(10, 10+max_inflight_blocks+1):
+            readahead.read(inode_id, 0, 0, self.inode_size)
+        assert(len(block_fetcher.block_list) == max_inflight_blocks)
+        assert(readahead.inflight_size <= config.CACHE_READAHEAD_MAX_INFLIGHT)
+        block_fetcher.finish()
+        assert(readahead.inflight_size == 0)
+
+    def test_cached_blocks(self):
+        """Test that cached blocks, which may be written and not uploaded yet, are not read ahead"""
+        block_fetcher = BlockFetcher()
+        cached_list = [(20, object_block_id) for object_block_id in range(1, 1+config.CACHE_READAHEAD_MIN_BLOCKS, 2)]
+        readahead = Readahead('test_fs', block_fetcher, CacheStore(cached_list))
+        readahead.read(20, 0, 0, self.inode_size)
+        assert(block_fetcher.block_list == range(2, 1+config.CACHE_READAHEAD_MIN_BLOCKS, 2))
+        block_fetcher.finish()
+        assert(readahead.inflight_size == 0)
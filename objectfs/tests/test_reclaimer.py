@@ -0,0 +1,101 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import redis
+from time import sleep
+sys.path.append('..')
+from objectfs.core.common.reclaimer import InodeReclaimer
+from objectfs.core.common.mergequeue import MergeQueue
+from objectfs.core.common.fragmentmap import FragmentMap
+from objectfs.core.data.objectstore import ObjectStoreFactory
+from objectfs.core.cache.cachestore import CacheStoreFactory
+from objectfs.settings import Settings
+settings = Settings()
+from config import OBJECT_STORE_LIST, CACHE_STORE_LIST
+
+@pytest.mark.parametrize('object_store', OBJECT_STORE_LIST)
+@pytest.mark.parametrize('cache_store', CACHE_STORE_LIST)
+def test_reclaimer(object_store, cache_store):
+    reclaimer = Reclaimer_Test(object_store, cache_store)
+    reclaimer.test_reclaim()
+    reclaimer.test_background_reclaim()
+    reclaimer.test_crashed_mount()
+
+class Reclaimer_Test:
+
+    def __init__(self, object_store, cache_store):
+        self._object_store = ObjectStoreFactory.create_store('test_fs', object_store)
+        self.container = self._object_store.container
+        self.container.create()
+        self._cache_store = CacheStoreFactory.create_store('test_fs', cache_store)
+        self._merge_queue = MergeQueue('test_fs')
+        self._fragment_map = FragmentMap('test_fs')
+        self._client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
+        self.reclaimer = InodeReclaimer('test_fs', self._object_store, self._cache_store)
+
+    def __del__(self):
+        self.reclaimer.stop()
+        self.container.delete()
+
+    def _put_file(self, inode_id):
+        """Store a file with a log object, a cache block and its fragment-map keys"""
+        log_object_name = self._fragment_map._log_key(inode_id, [0], 100)
+        self._object_store.put_dnode(inode_id, b'data')
+        self._object_store.put_object(log_object_name, b'log')
+        self._cache_store.put_inode(inode_id, b'data', 0)
+        self._client.zadd(self._fragment_map._block_key(inode_id, 0), {log_object_name: 100})
+        self._merge_queue.insert(inode_id, log_object_name)
+        return log_object_name
+
+    def _assert_reclaimed(self, inode_id, log_object_name):
+        assert(self._object_store.list_objects(str(inode_id)) == [])
+        assert(self._object_store.list_objects(log_object_name) == [])
+        assert(not self._cache_store.exists_inode(inode_id, 0))
+        assert(not self._client.exists(self._fragment_map._block_key(inode_id, 0)))
+        assert(not self._client.exists(self._merge_queue._queue_key(inode_id)))
+
+    def test_reclaim(self):
+        """Test that the data of a file is removed right away before the reclaimer is started"""
+        log_object_name = self._put_file(5)
+        self.reclaimer.reclaim(5, 4)
+        assert(len(self.reclaimer) == 0)
+        self._assert_reclaimed(5, log_object_name)
+
+    def test_background_reclaim(self):
+        """Test that files are queued once started and removed together when stopped"""
+        log_object_name_list = [self._put_file(inode_id) for inode_id in [6, 7]]
+        self.reclaimer.start()
+        self.reclaimer.reclaim(6, 4)
+        self.reclaimer.reclaim(7, 4)
+        self.reclaimer.stop()
+        assert(len(self.reclaimer) == 0)
+        for (inode_id, log_object_name) in zip([6, 7], log_object_name_list):
+            self._assert_reclaimed(inode_id, log_object_name)
+
+    def test_crashed_mount(self):
+        """Test that the files left queued by a mount which crashed are removed on start"""
+        log_object_name = self._put_file(8)
+        self._client.sadd(self.reclaimer._pending_key, self.reclaimer._pending_member(8, 4))
+        self.reclaimer.start()
+        for retry in range(50):
+            if len(self.reclaimer) == 0:
+                break
+            sleep(0.1)
+        assert(len(self.reclaimer) == 0)
+        self._assert_reclaimed(8, log_object_name)
+        self.reclaimer.stop()
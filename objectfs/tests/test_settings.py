@@ -0,0 +1,82 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+from ConfigParser import SafeConfigParser
+sys.path.append('..')
+from objectfs.settings import Settings, Config
+settings = Settings()
+
+def test_settings():
+    settings_test = Settings_Test()
+    settings_test.test_shared_parser()
+    settings_test.test_config_values()
+    settings_test.test_config_read_only()
+    settings_test.test_config_validation()
+    settings_test.test_missing_options()
+
+class Settings_Test:
+
+    def test_shared_parser(self):
+        """Test that the settings file is read once per process"""
+        assert(Settings().parser is settings.parser)
+        assert(Settings().config is settings.config)
+
+    def test_config_values(self):
+        """Test that the config holds the typed settings"""
+        assert(settings.config.DATA_BLOCK_SIZE == settings.DATA_BLOCK_SIZE)
+        assert(isinstance(settings.config.DATA_BLOCK_SIZE, int))
+        assert(settings.config.META_OPENDIR_PREFETCH == settings.META_OPENDIR_PREFETCH)
+        assert(settings.config.SB_USED_SIZE == settings.SB_USED_SIZE)
+
+    def test_config_read_only(self):
+        """Test that the config cannot be changed"""
+        with pytest.raises(AttributeError):
+            settings.config.DATA_BLOCK_SIZE = 1
+        with pytest.raises(AttributeError):
+            settings.config.NEW_SETTING = 1
+        with pytest.raises(AttributeError):
+            del settings.config.DATA_BLOCK_SIZE
+
+    def test_config_validation(self):
+        """Test that invalid values are rejected when the config is made"""
+        class InvalidSettings(object):
+            def __getattr__(self, name):
+                return getattr(settings, name)
+            DATA_BLOCK_SIZE = 0
+        with pytest.raises(ValueError):
+            Config(InvalidSettings())
+        class JournalSettings(object):
+            def __getattr__(self, name):
+                return getattr(settings, name)
+            FS_JOURNAL_ENABLED = True
+            META_STORE = 'Sqlite'
+        with pytest.raises(ValueError):
+            Config(JournalSettings())
+
+    def test_missing_options(self):
+        """Test that options missing from an older settings file are read with their defaults"""
+        parser = SafeConfigParser()
+        parser.read(settings._file_name)
+        parser.remove_option('cache', 'io_threads')
+        parser.remove_option('file-cache', 'low_watermark')
+        older_settings = Settings.__new__(Settings)
+        older_settings.parser = parser
+        assert(older_settings.CACHE_IO_THREADS == Settings.OPTION_DEFAULTS['CACHE_IO_THREADS'][2])
+        assert(not older_settings.is_set('CACHE_IO_THREADS'))
+        assert(older_settings.is_set('CACHE_IO_READ_THREADS'))
+        assert(Config(older_settings).FILE_CACHE_LOW_WATERMARK == Settings.OPTION_DEFAULTS['FILE_CACHE_LOW_WATERMARK'][2])
@@ -0,0 +1,61 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import redis
+sys.path.append('..')
+from objectfs.core.metadata.inode import Inode
+from objectfs.settings import Settings
+settings = Settings()
+import test_namespace
+
+def test_sharded_metastore():
+    namespace = Sharded_Meta_Store_Test()
+    namespace.test_create()
+    namespace.test_placement()
+    namespace.test_batched_get()
+    namespace.test_link()
+    namespace.test_rename()
+    namespace.test_replace()
+    namespace.test_remove()
+    namespace.test_delete_inodes()
+
+class Sharded_Meta_Store_Test(test_namespace.Namespace_Test):
+    """Namespace tests with the inodes spread over two shards"""
+
+    def __init__(self):
+        test_namespace.Namespace_Test.__init__(self, 'ShardedRedis')
+        # two databases of the test server stand in for two servers. The superblock is on the first
+        self._meta_store._shard_client_list = [redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB+shard) for shard in range(2)]
+        self._meta_store._client = self._meta_store._shard_client_list[0]
+
+    def __del__(self):
+        for client in self._meta_store._shard_client_list:
+            for inode_id in [1, 2, 3, 4]:
+                client.delete('test_fs%{}'.format(inode_id), 'test_fs%{}&dir'.format(inode_id))
+        self._super_block.delete_superblock()
+
+    def test_placement(self):
+        """Test that an inode and its directory entries are on the shard of its id"""
+        (even_client, odd_client) = self._meta_store._shard_client_list
+        assert(odd_client.exists('test_fs%3') and not even_client.exists('test_fs%3'))
+        assert(even_client.hget('test_fs%2&dir', 'test_inode_name') == '3')
+        assert(odd_client.hget('test_fs%1&dir', 'test_dir_name') == '2')
+
+    def test_batched_get(self):
+        """Test that a batch get collects the inodes from all shards in order"""
+        inode_list = self._meta_store.get_inodes([4, 5, 3, 2])
+        assert([inode.id if inode else None for inode in inode_list] == [4, None, 3, 2])
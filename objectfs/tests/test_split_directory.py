@@ -0,0 +1,131 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+import errno
+import llfuse
+import redis
+from itertools import islice
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory
+from objectfs.core.metadata.superblock import SuperBlock
+from objectfs.core.metadata.inode import Inode
+from objectfs.settings import Settings
+settings = Settings()
+from config import META_STORE_LIST
+
+@pytest.mark.parametrize('meta_store', META_STORE_LIST + ['ShardedRedis'])
+def test_split_directory(meta_store):
+    directory = Split_Directory_Test(meta_store)
+    directory.test_split()
+    directory.test_lookup()
+    directory.test_create_exists()
+    directory.test_scan()
+    directory.test_rename()
+    directory.test_remove()
+
+class Split_Directory_Test:
+    """Directory split after 4 entries into 4 buckets"""
+
+    def __init__(self, meta_store):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', meta_store)
+        if meta_store == 'ShardedRedis':
+            # two databases of the test server stand in for two servers. The superblock is on the first
+            self._meta_store._shard_client_list = [redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB+shard) for shard in range(2)]
+            self._meta_store._client = self._meta_store._shard_client_list[0]
+        self._meta_store._dir_split_size = 4
+        self._meta_store._dir_buckets = 4
+        self._super_block = SuperBlock('test_fs')
+        self._super_block.init_superblock()
+        self._super_block.inode_counter = 22
+        self.dir_inode = Inode('test_fs', 2, stat.S_IFDIR | 0755, 'test_dir_name', parent_inode_id=1)
+        self.inode_list = [Inode('test_fs', inode_id, stat.S_IFREG | 0644, 'test_file_{}'.format(inode_id), parent_inode_id=2) for inode_id in range(3, 23)]
+        self.name_list = ['.', '..'] + [inode.name for inode in self.inode_list]
+
+    def __del__(self):
+        for client in self._meta_store._get_client_list():
+            client.delete(*['test_fs%{}'.format(inode_id) for inode_id in range(1, 23)])
+            client.delete(*['test_fs%{}&dir'.format(inode_id) for inode_id in [1, 2]] + ['test_fs%2&dir&{}'.format(bucket) for bucket in range(1, 5)])
+        self._meta_store._set_split_hint(2, False)
+        self._super_block.delete_superblock()
+
+    def _assert_errno(self, error_number, func, *args):
+        # the error is not kept so that no traceback keeps the test alive past its cleanup
+        try:
+            func(*args)
+        except llfuse.FUSEError as e:
+            assert(e.errno == error_number)
+        else:
+            pytest.fail("DID NOT RAISE FUSEError")
+
+    def test_split(self):
+        """Test that the directory stops growing at the split size and new names go to the buckets"""
+        for inode in [self.dir_inode] + self.inode_list:
+            self._meta_store.create_inode(inode)
+        client = self._meta_store._get_list_client(2)
+        assert(client.hexists('test_fs%2&dir', '/split'))
+        # ., .., two names and the split field
+        assert(client.hlen('test_fs%2&dir') == 5)
+        assert(self._meta_store.length_inode_id_list(2) == 22)
+
+    def test_lookup(self):
+        """Test that every name is found with and without the split hint"""
+        for split_hint in [True, False]:
+            self._meta_store._set_split_hint(2, split_hint)
+            for inode in self.inode_list:
+                assert(self._meta_store.get_inode_id(2, inode.name) == inode.id)
+            assert(self._meta_store.get_inode_id(2, 'test_missing_name') is None)
+
+    def test_create_exists(self):
+        """Test that names in the directory hash and in the buckets are taken"""
+        for inode in [self.inode_list[0], self.inode_list[-1]]:
+            self._assert_errno(errno.EEXIST, self._meta_store.create_inode, Inode('test_fs', 23, stat.S_IFREG | 0644, inode.name, parent_inode_id=2))
+        assert(self._meta_store.get_inode(23) is None)
+
+    def test_scan(self):
+        """Test that a resumed scan returns every entry of the directory and its buckets once"""
+        name_list = []
+        offset = 0
+        while True:
+            entry_list = list(islice(self._meta_store.scan_inode_id_list(2, offset), 3))
+            if not entry_list:
+                break
+            name_list.extend(file_name for (inode_id, file_name, offset) in entry_list)
+            offset = entry_list[-1][2]
+        assert(sorted(name_list) == sorted(self.name_list))
+
+    def test_rename(self):
+        """Test that an entry moves between the directory hash and a bucket"""
+        inode = self.inode_list[0]
+        self._meta_store.rename_entry(2, inode.name, 1, 'test_moved_name', inode)
+        assert(self._meta_store.get_inode_id(1, 'test_moved_name') == inode.id)
+        self._meta_store.rename_entry(1, 'test_moved_name', 2, 'test_new_name', inode)
+        assert(self._meta_store.get_inode_id(2, 'test_new_name') == inode.id)
+        assert(self._meta_store.get_inode_id(2, inode.name) is None)
+        self._assert_errno(errno.EEXIST, self._meta_store.rename_entry, 2, 'test_new_name', 2, self.inode_list[-1].name, inode)
+        self._meta_store.rename_entry(2, 'test_new_name', 2, inode.name, inode)
+
+    def test_remove(self):
+        """Test that a split directory is removed once the entries in its buckets are gone"""
+        self._assert_errno(errno.ENOTEMPTY, self._meta_store.remove_entry, 1, 'test_dir_name', self.dir_inode, True)
+        for inode in self.inode_list:
+            self._meta_store.remove_entry(2, inode.name, inode, True)
+        assert(self._meta_store.length_inode_id_list(2) == 2)
+        self._meta_store.remove_entry(1, 'test_dir_name', self.dir_inode, True)
+        assert(not any(client.exists('test_fs%2&dir') for client in self._meta_store._get_client_list()))
+        assert(self._super_block.inode_counter == 1)
@@ -0,0 +1,77 @@
+# Copyright 2017 IBM Corporation
+# Copyright 2017 The Johns Hopkins University
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, print_function
+import sys
+import pytest
+import stat
+sys.path.append('..')
+from objectfs.core.metadata.metastore import MetaStoreFactory, SqliteDatabase
+from objectfs.core.metadata.superblock import SuperBlock
+from objectfs.core.metadata.inode import Inode
+import test_namespace
+
+def test_sqlite_metastore():
+    namespace = Sqlite_Meta_Store_Test()
+    namespace.test_create()
+    namespace.test_link()
+    namespace.test_rename()
+    namespace.test_replace()
+    namespace.test_reopen()
+    namespace.test_resume_offset()
+    namespace.test_remove()
+    namespace.test_delete_inodes()
+
+class Sqlite_Meta_Store_Test(test_namespace.Namespace_Test):
+    """Namespace tests on the Sqlite meta store"""
+
+    def __init__(self):
+        self._meta_store = MetaStoreFactory.create_store('test_fs', 'Sqlite')
+        self._super_block = SuperBlock('test_fs')
+        # the superblock has to use the same store
+        self._super_block._meta_store = self._meta_store
+        self._super_block.init_superblock()
+        self._super_block.inode_counter = 4
+        self.dir_inode = Inode('test_fs', 2, stat.S_IFDIR | 0755, 'test_dir_name', parent_inode_id=1)
+        self.inode = Inode('test_fs', 3, stat.S_IFREG | 0644, 'test_inode_name', parent_inode_id=2, size=10)
+        self.other_inode = Inode('test_fs', 4, stat.S_IFREG | 0644, 'test_other_name', parent_inode_id=2, size=20)
+
+    def __del__(self):
+        self._meta_store._clean_store()
+        SqliteDatabase.close('test_fs')
+        # inodes changed outside a session are written through the configured store
+        redis_store = MetaStoreFactory.create_store('test_fs', 'Redis')
+        for inode_id in [2, 3, 4]:
+            redis_store.delete_inode_id_list(inode_id)
+            redis_store._client.delete('test_fs%{}'.format(inode_id))
+
+    def test_reopen(self):
+        """Test that the committed writes are found after the database is opened again"""
+        SqliteDatabase.close('test_fs')
+        self._meta_store = MetaStoreFactory.create_store('test_fs', 'Sqlite')
+        self._super_block._meta_store = self._meta_store
+        assert(self._meta_store.get_inode(3).name == 'test_inode_name')
+        assert(self._meta_store.get_inode_id(2, 'test_other_name') == 3)
+        assert(self._super_block.inode_counter == 3)
+
+    def test_resume_offset(self):
+        """Test that readdir resumes after the last entry returned even if entries were removed"""
+        for inode_id in range(10, 15):
+            self._meta_store.build_index(2, inode_id, 'test_entry_{}'.format(inode_id))
+        entry_list = [entry for entry in self._meta_store.scan_inode_id_list(2) if entry[0] >= 10]
+        self._meta_store.clean_index(2, entry_list[2][1])
+        resumed_list = list(self._meta_store.scan_inode_id_list(2, entry_list[2][2]))
+        assert(resumed_list == entry_list[3:])
+        for inode_id in range(10, 15):
+            self._meta_store.clean_index(2, 'test_entry_{}'.format(inode_id))
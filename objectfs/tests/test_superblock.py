@@ -19,8 +19,9 @@ import sys
 import pytest
 import llfuse
 import stat
+from time import sleep
 sys.path.append('..')
-from objectfs.core.metadata.superblock import SuperBlock
+from objectfs.core.metadata.superblock import SuperBlock, CachedSuperBlock
 from objectfs.settings import Settings
 settings = Settings()
 from config import META_STORE_LIST, FS_SIZE, FS_BLOCK_SIZE, FS_NUM_INODES
@@ -33,10 +34,19 @@ def test_object(meta_store):
     super_test.test_total_size()
     super_test.test_inode_counter()
     super_test.test_free_inode_id()
+    super_test.test_inode_id_lease()
     super_test.test_used_size()
     super_test.test_keys_exists()
     super_test.test_delete_superblock()
 
+@pytest.mark.parametrize('meta_store', META_STORE_LIST)
+def test_cached_superblock(meta_store):
+    cached_test = Cached_Super_Block_Test(meta_store)
+    cached_test.test_local_changes()
+    cached_test.test_soft_limit()
+    cached_test.test_flush_in_flight()
+    cached_test.test_background_flush()
+
 class Super_Block_Test:
 
     def __init__(self, meta_store):
@@ -85,6 +95,19 @@ class Super_Block_Test:
         assert(self._superblock.fetch_free_inode_id() == 3)
         assert(self._superblock.fetch_free_inode_id() == 4)
 
+    def test_inode_id_lease(self):
+        """Test that leased inode ids are counted and unused ids are leased again once returned"""
+        assert(self._superblock.inode_counter == 5)
+        with pytest.raises(llfuse.FUSEError, message='No space left on device') as e:
+            self._superblock.fetch_free_inode_id()
+        self._superblock.return_free_inode_id(4)
+        self._superblock.release_inode_ids()
+        assert(self._superblock.inode_counter == 4)
+        other_superblock = SuperBlock('test_fs')
+        assert(other_superblock.fetch_free_inode_id() == 4)
+        assert(other_superblock.inode_counter == 5)
+        other_superblock.release_inode_ids()
+
     def test_used_size(self):
         """Test max inodes value"""
         assert(self._superblock.used_size == 0)
@@ -106,3 +129,66 @@ class Super_Block_Test:
         assert(self._superblock.inode_counter is None)
         assert(self._superblock.free_inode_id is None)
         assert(self._superblock.max_inodes is None)
+
+class Cached_Super_Block_Test:
+
+    def __init__(self, meta_store):
+        self._superblock = SuperBlock('test_fs')
+        self._superblock.init_superblock()
+        self._superblock.total_size = FS_SIZE
+        self._superblock.max_inodes = FS_NUM_INODES
+        self._cached_superblock = CachedSuperBlock('test_fs')
+    
+    def __del__(self):
+        self._cached_superblock.stop()
+        self._superblock.delete_superblock()
+
+    def test_local_changes(self):
+        """Test that changes are only published by a flush"""
+        self._cached_superblock.incr_used_size(10)
+        self._cached_superblock.decr_inode_counter()
+        assert(self._cached_superblock.used_size == 10)
+        assert(self._cached_superblock.inode_counter == 0)
+        assert(self._superblock.used_size == 0)
+        self._cached_superblock.flush()
+        assert(self._superblock.used_size == 10)
+        assert(self._superblock.inode_counter == 0)
+
+    def test_soft_limit(self):
+        """Test that changes by other mounts are seen close to the limit"""
+        self._superblock.incr_used_size(FS_SIZE // 2)
+        self._cached_superblock.incr_used_size(FS_SIZE // 4)
+        assert(self._cached_superblock.used_size == 10 + FS_SIZE // 4)
+        with pytest.raises(llfuse.FUSEError, message='No space left on device') as e:
+            self._cached_superblock.incr_used_size(FS_SIZE * 7 // 10)
+        assert(self._cached_superblock.used_size == 10 + FS_SIZE // 2 + FS_SIZE // 4)
+        self._cached_superblock.decr_used_size(10 + FS_SIZE // 2 + FS_SIZE // 4)
+
+    def test_flush_in_flight(self):
+        """Test that the changes being flushed are counted until the flush returns"""
+        meta_store = self._cached_superblock._meta_store
+        update_superblock_keys = meta_store.update_superblock_keys
+        value_list = []
+        def update_and_read(*args):
+            value_list.append((self._cached_superblock.used_size, self._cached_superblock.inode_counter))
+            return update_superblock_keys(*args)
+        self._cached_superblock.incr_used_size(10)
+        self._cached_superblock.decr_inode_counter()
+        meta_store.update_superblock_keys = update_and_read
+        try:
+            self._cached_superblock.flush()
+        finally:
+            del meta_store.update_superblock_keys
+        assert(value_list == [(10, -1)])
+        assert(self._cached_superblock.used_size == 10)
+        assert(self._cached_superblock.inode_counter == -1)
+        self._cached_superblock.decr_used_size(10)
+
+    def test_background_flush(self):
+        """Test that changes are flushed in the background"""
+        self._cached_superblock.start()
+        for retry in range(50):
+            if self._superblock.used_size == 0:
+                break
+            sleep(0.1)
+        assert(self._superblock.used_size == 0)
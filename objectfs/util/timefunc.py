@@ -24,3 +24,22 @@ def timeit(func):
         finally:
             duration = time.time() - start
             print(duration)
+
+class StageTimer(object):
+    """Time the stages of a process, each measured from the end of the previous stage"""
+
+    def __init__(self, start=None):
+        self._start = self._last = start if start is not None else time.time()
+        self._stage_list = []
+
+    def mark(self, stage_name):
+        """End a stage"""
+        now = time.time()
+        self._stage_list.append((stage_name, now - self._last))
+        self._last = now
+
+    def report(self):
+        """Return the duration of every stage and the total in milliseconds"""
+        lines = ['{:<20} {:>10.1f} ms'.format(stage_name, duration*1000) for (stage_name, duration) in self._stage_list]
+        lines.append('{:<20} {:>10.1f} ms'.format('total', (self._last - self._start)*1000))
+        return '\n'.join(lines)